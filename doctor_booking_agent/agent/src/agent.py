@@ -2,28 +2,57 @@
 Doctor Appointment Booking Voice AI Agent
 Direct Dinodial Proxy Integration - No External Dependencies
 """
-from typing import Dict, Any, Optional
+import itertools
+import os
+import threading
+from typing import Dict, Any, Optional, Iterable
 from src.dinodial_client import DinodialClient
-from src.prompts import get_booking_prompt, get_evaluation_tool, get_reminder_prompt
+from src.batch_dinodial_client import BatchDinodialClient
+from src.prompts import build_booking_prompt, get_evaluation_tool, get_reminder_prompt
+
+VAD_ENGINES = ('LOKEN', 'KAAN', 'POLUX', 'ANCHORITE', 'CALGAR', 'VALDOR', 'CAWL')
+
+def configured_vad_engines() -> list:
+    """DINODIAL_VAD_ENGINES (comma-separated, rotated per call) or DINODIAL_VAD_ENGINE (default CAWL)"""
+    names = os.getenv('DINODIAL_VAD_ENGINES') or os.getenv('DINODIAL_VAD_ENGINE') or 'CAWL'
+    engines = [name.strip().upper() for name in names.split(',') if name.strip()]
+    unknown = [name for name in engines if name not in VAD_ENGINES]
+    if unknown:
+        raise ValueError(f"Unknown VAD engine(s) {unknown}; expected one of {VAD_ENGINES}")
+    return engines
 
 class DoctorBookingAgent:
     """Voice AI agent for doctor appointment booking"""
     
-    def __init__(self):
+    def __init__(self, vad_engines: Optional[list] = None):
         self.client = DinodialClient()
+        self.batch_client = BatchDinodialClient(self.client)
+        # Several engines are used round-robin so analytics/vad_report.py can compare them
+        self.vad_engines = list(vad_engines or configured_vad_engines())
+        self._engine_cycle = itertools.cycle(self.vad_engines)
+        self._engine_lock = threading.Lock()
+    
+    def next_vad_engine(self) -> str:
+        with self._engine_lock:
+            return next(self._engine_cycle)
     
     def create_reminder_call(self, phone_number: str, patient_name: str, doctor_name: str, date: str, time: str) -> Dict[str, Any]:
         """Initiate a reminder call"""
         prompt = get_reminder_prompt(patient_name, doctor_name, date, time)
         # Use a simple evaluation tool or None for reminders
         # For now, we reuse the tool but maybe we don't need to extract much
-        return self.client.initiate_call(
+        vad_engine = self.next_vad_engine()
+        response = self.client.initiate_call(
             prompt=prompt,
             evaluation_tool=get_evaluation_tool(), # Reuse for now
-            vad_engine='CAWL'
+            vad_engine=vad_engine
         )
+        if isinstance(response, dict):
+            response['vad_engine'] = vad_engine
+        return response
 
-    def create_booking_call(self, phone_number: str, doctor_info: Dict[str, Any] = None, roster: list = None) -> Dict[str, Any]:
+    def create_booking_call(self, phone_number: str, doctor_info: Dict[str, Any] = None, roster: list = None,
+                            roster_xml: Optional[str] = None) -> Dict[str, Any]:
         """
         Initiate a voice call for doctor appointment booking
         
@@ -31,22 +60,29 @@ class DoctorBookingAgent:
             phone_number: Patient phone number
             doctor_info: Optional doctor information to include in context
             roster: Optional list of available doctors
+            roster_xml: Optional pre-rendered <hospital_roster> block (takes precedence over roster)
         
         Returns:
-            Response from Dinodial API
+            Response from Dinodial API, plus the 'vad_engine' used and a
+            'prompt_compaction' report with the estimated prompt tokens
+            after compaction and the over_budget flag
         """
-        # Get the appointment booking prompt
-        prompt = get_booking_prompt(phone_number, doctor_info, roster)
+        # Get the appointment booking prompt (compacted; over-budget prompts are logged, not truncated)
+        prompt, compaction = build_booking_prompt(phone_number, doctor_info, roster, roster_xml)
         
         # Get evaluation tool configuration
         evaluation_tool = get_evaluation_tool()
         
         # Initiate the call
+        vad_engine = self.next_vad_engine()
         response = self.client.initiate_call(
             prompt=prompt,
             evaluation_tool=evaluation_tool,
-            vad_engine='CAWL'
+            vad_engine=vad_engine
         )
+        if isinstance(response, dict):
+            response['vad_engine'] = vad_engine
+            response['prompt_compaction'] = compaction
         
         return response
     
@@ -58,6 +94,19 @@ class DoctorBookingAgent:
         """Get the recording of a booking call"""
         return self.client.get_call_recording(call_id)
     
-    def list_calls(self) -> Dict[str, Any]:
-        """List all booking calls"""
-        return self.client.get_call_list()
+    def get_booking_statuses(self, call_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Fetch the details of many calls concurrently (bounded by DINODIAL_CONCURRENCY)
+        
+        Returns:
+            {call_id: call detail response}; a failed fetch maps to {'status': 'error', ...}
+        """
+        return self.batch_client.get_call_details(call_ids)
+    
+    def get_call_recordings(self, call_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch the recordings of many calls concurrently"""
+        return self.batch_client.get_call_recordings(call_ids)
+    
+    def list_calls(self, page: Optional[int] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
+        """List booking calls (all of them, or one page when `page` is given)"""
+        return self.client.get_call_list(page, page_size)
@@ -1,20 +1,26 @@
 """
 Dinodial Proxy API Client for Doctor Booking Agent
 """
-import requests
 import os
+import threading
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
+from src.transport import PooledTransport, LatencyStats
 
 load_dotenv()
 
 class DinodialClient:
     """Client for interacting with Dinodial Proxy API"""
     
-    def __init__(self):
+    # Shared by every client in the process so latency is reported per endpoint, not per instance
+    latency = LatencyStats()
+    
+    def __init__(self, transport: Optional[PooledTransport] = None):
+        self.transport = transport or PooledTransport(stats=DinodialClient.latency)
         self.base_url = os.getenv('DINODIAL_BASE_URL', 'https://api-dinodial-proxy.cyces.co')
         self.admin_token = os.getenv('ADMIN_TOKEN')
         self.token = os.getenv('TOKEN')
+        self._token_lock = threading.Lock()  # one refresh at a time when BatchDinodialClient threads share us
         # Auto-generate a token if not present but admin creds and phone are available
         if not self.token and self.admin_token:
             phone = os.getenv('PHONE_NUMBER')
@@ -40,7 +46,8 @@ class DinodialClient:
         endpoint = f'{self.base_url}/api/proxy/token/generate/'
         payload = {'phone_number': phone_number}
         
-        response = requests.post(
+        response = self.transport.post(
+            'token/generate',
             endpoint,
             json=payload,
             headers=self._get_headers(use_admin=True)
@@ -57,7 +64,9 @@ class DinodialClient:
             'vad_engine': vad_engine
         }
         
-        response = requests.post(
+        sent_token = self.token
+        response = self.transport.post(
+            'make-call',
             endpoint,
             json=payload,
             headers=self._get_headers(use_admin=False)
@@ -66,37 +75,59 @@ class DinodialClient:
         
         # Check for token error and retry
         if response.status_code in [400, 401] and 'Token is not valid' in str(result):
-            print("Token invalid, attempting to refresh...")
-            phone = os.getenv('PHONE_NUMBER')
-            if phone and self.admin_token:
-                try:
-                    print(f"Generating new token for {phone} using admin token...")
-                    gen = self.generate_token(phone)
-                    print(f"Generate token response: {gen}")
-                    new_token = (gen.get('data') or {}).get('token')
-                    if new_token:
-                        print(f"New token obtained: {new_token[:10]}...")
-                        self.token = new_token
-                        # Retry the call
-                        response = requests.post(
-                            endpoint,
-                            json=payload,
-                            headers=self._get_headers(use_admin=False)
-                        )
-                        return response.json()
-                    else:
-                        print("Failed to extract token from generation response")
-                except Exception as e:
-                    print(f"Failed to refresh token: {e}")
+            if self._refresh_token(sent_token):
+                # Retry the call
+                response = self.transport.post(
+                    'make-call',
+                    endpoint,
+                    json=payload,
+                    headers=self._get_headers(use_admin=False)
+                )
+                return response.json()
         
         return result
     
-    def get_call_list(self) -> Dict[str, Any]:
-        """Get list of calls for the token"""
+    def _refresh_token(self, stale_token: Optional[str]) -> bool:
+        """
+        Replace a token the API rejected; True when self.token is usable again.
+        Calls failing on the same stale token queue on the lock, and only the
+        first generates a new one - the rest retry with it.
+        """
+        with self._token_lock:
+            if self.token != stale_token:
+                return bool(self.token)
+            print("Token invalid, attempting to refresh...")
+            phone = os.getenv('PHONE_NUMBER')
+            if not (phone and self.admin_token):
+                return False
+            try:
+                print(f"Generating new token for {phone} using admin token...")
+                gen = self.generate_token(phone)
+                print(f"Generate token response: {gen}")
+                new_token = (gen.get('data') or {}).get('token')
+                if not new_token:
+                    print("Failed to extract token from generation response")
+                    return False
+                print(f"New token obtained: {new_token[:10]}...")
+                self.token = new_token
+                return True
+            except Exception as e:
+                print(f"Failed to refresh token: {e}")
+                return False
+    
+    def get_call_list(self, page: Optional[int] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
+        """Get list of calls for the token (optionally one page of it)"""
         endpoint = f'{self.base_url}/api/proxy/calls/list/'
+        params = {}
+        if page is not None:
+            params['page'] = page
+        if page_size is not None:
+            params['page_size'] = page_size
         
-        response = requests.get(
+        response = self.transport.get(
+            'calls/list',
             endpoint,
+            params=params or None,
             headers=self._get_headers(use_admin=False)
         )
         return response.json()
@@ -105,7 +136,8 @@ class DinodialClient:
         """Get detailed information about a specific call"""
         endpoint = f'{self.base_url}/api/proxy/call/detail/{call_id}/'
         
-        response = requests.get(
+        response = self.transport.get(
+            'call/detail',
             endpoint,
             headers=self._get_headers(use_admin=False)
         )
@@ -115,8 +147,13 @@ class DinodialClient:
         """Get recording URL for a call"""
         endpoint = f'{self.base_url}/api/proxy/call/recording/{call_id}/'
         
-        response = requests.get(
+        response = self.transport.get(
+            'call/recording',
             endpoint,
             headers=self._get_headers(use_admin=False)
         )
         return response.json()
+    
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint latency (count, errors, avg/p50/p95/max ms) for this process"""
+        return self.latency.snapshot()
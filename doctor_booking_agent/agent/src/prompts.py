@@ -1,21 +1,221 @@
 """
 Prompt templates for Doctor Booking Agent
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 import os
+import re
 import json
+import math
+import threading
+import time
 
 # Get the directory of the current file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
-def get_booking_prompt(phone_number: str, doctor_info: Optional[Dict[str, Any]] = None, roster: Optional[list] = None) -> str:
-    """Generate prompt from XML template"""
-    
+# How often (seconds) a cached template re-checks its file's mtime; 0 = every use
+TEMPLATE_CHECK_INTERVAL = float(os.getenv('PROMPT_TEMPLATE_CHECK_INTERVAL', 2))
+
+# Booking-prompt compaction: on/off switch, token budget (0 = unlimited; only
+# trims the specialty shortlist of a known target doctor, never the full roster)
+# and the chars-per-token ratio used to estimate Gemini prompt tokens without a tokenizer
+PROMPT_COMPACTION = os.getenv('PROMPT_COMPACTION', '1') != '0'
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 1500))
+CHARS_PER_TOKEN = float(os.getenv('PROMPT_CHARS_PER_TOKEN', 4))
+
+class FrozenDict(dict):
+    """Read-only dict: still JSON-serialisable, but shared safely between callers"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached template objects are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(value):
+    """Recursively turn parsed JSON into FrozenDicts and tuples"""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+class TemplateRegistry:
+    """
+    Loads each template file once, keeps the parsed result in memory and
+    reloads it only when the file's mtime changes (checked at most every
+    `check_interval` seconds). Counts hits, misses (first loads) and reloads.
+    """
+
+    def __init__(self, base_dir: str = TEMPLATES_DIR, check_interval: float = TEMPLATE_CHECK_INTERVAL):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._entries = {}  # name -> [value, mtime, last_checked]
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    def _load(self, name: str, parse: Callable[[str], Any]):
+        path = os.path.join(self.base_dir, name)
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return parse(f.read()), mtime
+
+    def get(self, name: str, parse: Callable[[str], Any] = lambda text: text):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                if now - entry[2] < self.check_interval:
+                    self.stats['hits'] += 1
+                    return entry[0]
+                entry[2] = now
+                try:
+                    unchanged = os.path.getmtime(os.path.join(self.base_dir, name)) == entry[1]
+                except OSError:
+                    unchanged = True  # keep serving the last good copy
+                if unchanged:
+                    self.stats['hits'] += 1
+                    return entry[0]
+                self.stats['reloads'] += 1
+            else:
+                self.stats['misses'] += 1
+            value, mtime = self._load(name, parse)
+            self._entries[name] = [value, mtime, now]
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _parse_tool(text: str):
+    return freeze(json.loads(text))
+
+templates = TemplateRegistry()
+
+def template_stats() -> Dict[str, int]:
+    """Template cache hit/miss/reload counters"""
+    return dict(templates.stats)
+
+# Fallback roster used when no doctors are provided
+DEFAULT_ROSTER_XML = (
+    f"    <hospital_roster>\n"
+    f"      <doc><name>Dr. Sharma</name><spec>General Medicine</spec><slots>10am-2pm</slots></doc>\n"
+    f"      <doc><name>Dr. Anita</name><spec>Cardiology</spec><slots>4pm-6pm</slots></doc>\n"
+    f"      <doc><name>Dr. Raj</name><spec>Dermatology</spec><slots>11am-1pm</slots></doc>\n"
+    f"      <doc><name>Dr. Priya</name><spec>Orthopedics</spec><slots>2pm-5pm</slots></doc>\n"
+    f"      <doc><name>Dr. Khan</name><spec>Pediatrics</spec><slots>9am-12pm</slots></doc>\n"
+    f"    </hospital_roster>\n"
+)
+
+def render_roster_xml(roster: Optional[list]) -> str:
+    """Render the <hospital_roster> block for a list of {name, specialty, slots} dicts"""
+    if not roster:
+        return DEFAULT_ROSTER_XML
+    lines = ["    <hospital_roster>\n"]
+    for doc in roster:
+        # Ensure slots exist, default to 9am-5pm if missing
+        slots = doc.get('slots') or doc.get('available_time') or '9am-5pm'
+        lines.append(f"      <doc><name>{doc['name']}</name><spec>{doc['specialty']}</spec><slots>{slots}</slots></doc>\n")
+    lines.append("    </hospital_roster>\n")
+    return "".join(lines)
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt-token estimate (len / CHARS_PER_TOKEN); good enough to track savings"""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+_XML_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_BETWEEN_TAGS = re.compile(r'>\s+<')
+_LINE_INDENT = re.compile(r'[ \t]*\n[ \t]*')
+_RUNS = re.compile(r'[ \t]{2,}')
+
+def compact_text(text: str) -> str:
+    """Drop XML comments, indentation and whitespace between tags; keep line breaks inside text"""
+    text = _XML_COMMENT.sub('', text)
+    text = _BETWEEN_TAGS.sub('><', text)
+    text = _LINE_INDENT.sub('\n', text)
+    return _RUNS.sub(' ', text).strip()
+
+def prune_roster(roster: Optional[list], doctor_info: Optional[Dict[str, Any]]) -> Optional[list]:
+    """
+    Keep only the doctors relevant to a known target: the target doctor plus
+    everyone sharing its specialty. Returns the roster unchanged when there is
+    no target or nothing matches (the agent then needs the whole list).
+    """
+    if not roster or not doctor_info:
+        return roster
+    name = doctor_info.get('name')
+    specialty = (doctor_info.get('specialty') or '').strip().lower()
+    if not name and not specialty:
+        return roster
+    kept = [doc for doc in roster
+            if doc.get('name') == name or (specialty and (doc.get('specialty') or '').lower() == specialty)]
+    return kept or roster
+
+class CompactionStats:
+    """Running totals of booking-prompt token estimates before/after compaction"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {'prompts': 0, 'tokens_before': 0, 'tokens_after': 0, 'doctors_pruned': 0, 'over_budget': 0}
+
+    def record(self, report: Dict[str, Any]):
+        with self._lock:
+            self.totals['prompts'] += 1
+            self.totals['tokens_before'] += report['tokens_before']
+            self.totals['tokens_after'] += report['tokens_after']
+            self.totals['doctors_pruned'] += report['roster_before'] - report['roster_after']
+            self.totals['over_budget'] += int(report['over_budget'])
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.totals)
+
+compaction = CompactionStats()
+
+def compaction_stats() -> Dict[str, int]:
+    """Booking-prompt compaction totals (compare tokens_after with usageMetadata.promptTokenCount)"""
+    return compaction.snapshot()
+
+def _fill_booking_template(phone_number: str, target_block: str, roster_xml: str) -> str:
+    return templates.get('prompt.txt').format(
+        phone_number=phone_number,
+        target_block=target_block,
+        roster_xml=roster_xml
+    )
+
+def _target_first(roster: list, name: Optional[str]) -> list:
+    """The roster with the target doctor (if named) moved to the front, so trimming the tail never drops it"""
+    return sorted(roster, key=lambda doc: doc.get('name') != name) if name else roster
+
+def build_booking_prompt(phone_number: str, doctor_info: Optional[Dict[str, Any]] = None, roster: Optional[list] = None,
+                         roster_xml: Optional[str] = None, budget: Optional[int] = None):
+    """
+    Generate the booking prompt and a compaction report.
+
+    With PROMPT_COMPACTION on, whitespace between XML tags is stripped and,
+    when a target doctor or specialty is known, the roster is pruned to that
+    doctor and specialty and then trimmed (keeping a named target) until the
+    estimate fits `budget` tokens (PROMPT_TOKEN_BUDGET by default, 0 =
+    unlimited). Without a target the agent needs every doctor, so the roster
+    is never trimmed: a prompt over budget is logged and flagged instead. A
+    pre-rendered `roster_xml` is used as-is unless the roster has to be
+    pruned or trimmed, in which case it is re-rendered from `roster`.
+
+    Returns:
+        (prompt, report) where report holds tokens_before/tokens_after
+        estimates, roster sizes, the budget and an over_budget flag
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+
     # Check if a specific doctor is requested (from UI click)
     # Only consider it a target if a name is provided and it's not a generic placeholder
     name = doctor_info.get('name') if doctor_info else None
     has_target = name and name not in ['the duty doctor', 'Dr.Sharma', 'Available Doctor']
+    specialty = (doctor_info.get('specialty') or '').strip() if doctor_info else ''
+    # A requested specialty narrows the roster even when no particular doctor was picked
+    target = {'name': name if has_target else None, 'specialty': specialty} if has_target or specialty else None
     
     target_block = ""
     if has_target:
@@ -28,64 +228,70 @@ def get_booking_prompt(phone_number: str, doctor_info: Optional[Dict[str, Any]]
             f"    </target_doctor>\n"
         )
 
-    # Generate Roster XML
-    roster_xml = ""
-    if roster:
-        roster_xml = "    <hospital_roster>\n"
-        for doc in roster:
-            # Ensure slots exist, default to 9am-5pm if missing
-            slots = doc.get('slots') or doc.get('available_time') or '9am-5pm'
-            roster_xml += f"      <doc><name>{doc['name']}</name><spec>{doc['specialty']}</spec><slots>{slots}</slots></doc>\n"
-        roster_xml += "    </hospital_roster>\n"
-    else:
-        # Fallback to hardcoded roster if none provided
-        roster_xml = (
-            f"    <hospital_roster>\n"
-            f"      <doc><name>Dr. Sharma</name><spec>General Medicine</spec><slots>10am-2pm</slots></doc>\n"
-            f"      <doc><name>Dr. Anita</name><spec>Cardiology</spec><slots>4pm-6pm</slots></doc>\n"
-            f"      <doc><name>Dr. Raj</name><spec>Dermatology</spec><slots>11am-1pm</slots></doc>\n"
-            f"      <doc><name>Dr. Priya</name><spec>Orthopedics</spec><slots>2pm-5pm</slots></doc>\n"
-            f"      <doc><name>Dr. Khan</name><spec>Pediatrics</spec><slots>9am-12pm</slots></doc>\n"
-            f"    </hospital_roster>\n"
-        )
-
-    # Read template
-    template_path = os.path.join(TEMPLATES_DIR, 'prompt.txt')
+    roster_size = len(roster) if roster else 0
+    report = {
+        'tokens_before': 0,
+        'tokens_after': 0,
+        'roster_before': roster_size,
+        'roster_after': roster_size,
+        'budget': budget,
+        'over_budget': False,
+    }
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-            
-        # Fill template
-        return template_content.format(
-            phone_number=phone_number,
-            target_block=target_block,
-            roster_xml=roster_xml
-        )
+        full_xml = roster_xml if roster_xml is not None else render_roster_xml(roster)
+        prompt = _fill_booking_template(phone_number, target_block, full_xml)
+        report['tokens_before'] = estimate_tokens(prompt)
+
+        if PROMPT_COMPACTION:
+            kept = roster
+            if target:
+                kept = prune_roster(roster, target)
+                if kept is not roster:
+                    full_xml = render_roster_xml(kept)
+            prompt = compact_text(_fill_booking_template(phone_number, target_block, full_xml))
+            if target and budget and kept and estimate_tokens(prompt) > budget:
+                kept = _target_first(kept, target['name'])
+            while target and budget and kept and len(kept) > 1 and estimate_tokens(prompt) > budget:
+                # Every <doc> entry costs about the same, so trim by the overshoot rather than one at a time
+                overshoot = estimate_tokens(prompt) - budget
+                per_doc = max(1.0, estimate_tokens(compact_text(render_roster_xml(kept))) / len(kept))
+                kept = kept[:max(1, len(kept) - int(math.ceil(overshoot / per_doc)))]
+                prompt = compact_text(_fill_booking_template(phone_number, target_block, render_roster_xml(kept)))
+            report['roster_after'] = len(kept) if kept else 0
     except Exception as e:
         print(f"Error reading template: {e}")
         # Fallback to a minimal prompt if file read fails
-        return f"<ai_master_prompt><critical_directive>System Error. Please try again.</critical_directive></ai_master_prompt>"
+        prompt = "<ai_master_prompt><critical_directive>System Error. Please try again.</critical_directive></ai_master_prompt>"
+
+    report['tokens_after'] = estimate_tokens(prompt)
+    report['over_budget'] = bool(budget) and report['tokens_after'] > budget
+    if report['over_budget']:
+        print(f"[Prompt] Booking prompt is ~{report['tokens_after']} tokens, over PROMPT_TOKEN_BUDGET={budget} "
+              f"({report['roster_after']} doctors in the roster)")
+    compaction.record(report)
+    return prompt, report
+
+def get_booking_prompt(phone_number: str, doctor_info: Optional[Dict[str, Any]] = None, roster: Optional[list] = None,
+                       roster_xml: Optional[str] = None) -> str:
+    """Generate prompt from XML template (pass a pre-rendered `roster_xml` to skip rendering the roster)"""
+    return build_booking_prompt(phone_number, doctor_info, roster, roster_xml)[0]
 
 def get_reminder_prompt(patient_name: str, doctor_name: str, date: str, time: str) -> str:
     """Generate reminder prompt"""
-    template_path = os.path.join(TEMPLATES_DIR, 'reminder_prompt.txt')
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return f.read().format(
-                patient_name=patient_name,
-                doctor_name=doctor_name,
-                date=date,
-                time=time
-            )
+        return templates.get('reminder_prompt.txt').format(
+            patient_name=patient_name,
+            doctor_name=doctor_name,
+            date=date,
+            time=time
+        )
     except Exception as e:
         return "System Error"
 
 def get_evaluation_tool() -> Dict[str, Any]:
-    """Load evaluation tool from JSON"""
-    tool_path = os.path.join(TEMPLATES_DIR, 'evaluationTool.json')
+    """Load evaluation tool from JSON (cached, read-only; copy before modifying)"""
     try:
-        with open(tool_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return templates.get('evaluationTool.json', _parse_tool)
     except Exception as e:
         print(f"Error reading tool definition: {e}")
         return {}
@@ -0,0 +1,114 @@
+"""
+Pooled HTTP transport for outbound API calls
+
+All clients share one requests.Session per process, so TCP+TLS connections
+to Dinodial are kept alive and reused instead of re-established per call.
+Every request gets connect/read timeouts, idempotent GETs are retried with
+backoff on connection errors and 502/503/504, and per-endpoint latency is
+recorded for monitoring.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = float(os.getenv('DINODIAL_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('DINODIAL_READ_TIMEOUT', 30))
+GET_RETRIES = int(os.getenv('DINODIAL_GET_RETRIES', 3))
+POOL_SIZE = int(os.getenv('DINODIAL_POOL_SIZE', 20))
+
+class LatencyStats:
+    """Thread-safe per-endpoint latency recorder (keeps the last `window` samples)"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.listeners = []  # callables(endpoint, seconds, ok) - e.g. a metrics exporter
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                    'samples': deque(maxlen=self.window)
+                }
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['samples'].append(seconds)
+            if not ok:
+                entry['errors'] += 1
+        for listener in self.listeners:
+            listener(endpoint, seconds, ok)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """{endpoint: {count, errors, avg_ms, p50_ms, p95_ms, max_ms}}"""
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._endpoints.items():
+                samples = sorted(entry['samples'])
+                def pct(p):
+                    return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000 if samples else 0.0
+                result[endpoint] = {
+                    'count': entry['count'],
+                    'errors': entry['errors'],
+                    'avg_ms': entry['total'] / entry['count'] * 1000,
+                    'p50_ms': pct(0.50),
+                    'p95_ms': pct(0.95),
+                    'max_ms': entry['max'] * 1000
+                }
+            return result
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_shared_session(pool_size: int = POOL_SIZE, get_retries: int = GET_RETRIES) -> requests.Session:
+    """Process-wide keep-alive session; created once on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=get_retries,
+                backoff_factor=0.3,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({'GET'}),  # never replay make-call / token POSTs
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+class PooledTransport:
+    """Timed, timeout-bounded requests over the shared session"""
+
+    def __init__(self, connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 session: Optional[requests.Session] = None, stats: Optional[LatencyStats] = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = session or get_shared_session()
+        self.stats = stats or LatencyStats()
+
+    def request(self, method: str, endpoint_name: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.request(method, url, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            self.stats.record(endpoint_name, time.perf_counter() - started, ok)
+
+    def get(self, endpoint_name: str, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', endpoint_name, url, **kwargs)
+
+    def post(self, endpoint_name: str, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', endpoint_name, url, **kwargs)
@@ -1,8 +1,11 @@
 import sys
 import requests
 
+API_URL = "http://localhost:5000"
+BATCH_LIMIT = 500  # keep <= CALL_SYNC_MAX_IDS on the server
+
 def sync_call(call_id):
-    url = f"http://localhost:5000/api/call/sync/{call_id}"
+    url = f"{API_URL}/api/call/sync/{call_id}"
     try:
         response = requests.post(url)
         if response.status_code == 200:
@@ -14,10 +17,53 @@ def sync_call(call_id):
     except Exception as e:
         print(f"Error: {e}")
 
+def parse_ids(args):
+    """Expand '255 258 300-310' into a list of call ids"""
+    call_ids = []
+    for arg in args:
+        if '-' in arg:
+            low, high = (int(part) for part in arg.split('-', 1))
+            call_ids.extend(range(low, high + 1))
+        else:
+            call_ids.append(int(arg))
+    return list(dict.fromkeys(call_ids))
+
+def sync_calls(call_ids):
+    """Sync many calls through the batch endpoint, BATCH_LIMIT ids per request"""
+    synced = failed = 0
+    elapsed_ms = 0.0
+    for start in range(0, len(call_ids), BATCH_LIMIT):
+        chunk = call_ids[start:start + BATCH_LIMIT]
+        try:
+            response = requests.post(f"{API_URL}/api/call/sync", json={'call_ids': chunk})
+        except Exception as e:
+            print(f"Error: {e}")
+            failed += len(chunk)
+            continue
+        if response.status_code != 200:
+            print(f"Failed to sync calls {chunk[0]}..{chunk[-1]}")
+            print(response.text)
+            failed += len(chunk)
+            continue
+        data = response.json()['data']
+        for result in data['results']:
+            if result['status'] == 'success':
+                print(f"[OK]   {result['call_id']}: {result['data']['status']}")
+            else:
+                print(f"[FAIL] {result['call_id']}: {result.get('message')}")
+        synced += data['synced']
+        failed += data['failed']
+        elapsed_ms += data['elapsed_ms']
+    rate = synced / (elapsed_ms / 1000) if elapsed_ms else 0.0
+    print(f"\nSynced {synced}, failed {failed} in {elapsed_ms:.0f} ms ({rate:.1f} calls/s)")
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python sync_call.py <call_id>")
+        print("       python sync_call.py <call_id> <call_id> ... | <from_id>-<to_id>")
         sys.exit(1)
-    
-    call_id = sys.argv[1]
-    sync_call(call_id)
+
+    if len(sys.argv) == 2 and '-' not in sys.argv[1]:
+        sync_call(sys.argv[1])
+    else:
+        sync_calls(parse_ids(sys.argv[1:]))
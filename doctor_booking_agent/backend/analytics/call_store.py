@@ -0,0 +1,336 @@
+"""
+Columnar store for Dinodial call-detail dumps
+
+Flattens call-detail documents (like output/255.json) into five Parquet
+tables under one store directory:
+
+  calls      one row per call: metadata, outcome, token usage, counts, timing
+  events     one row per entry of call_details.events
+  tool_calls one row per entry of call_details.toolCalls
+  phases     one row per entry of call_details.phaseHistory
+  turns      one row per model turn (turn/generation-complete timestamps,
+             interruption flag, transcript text when present)
+
+Ingestion streams: documents are read one at a time, from *.json files
+(one response per file) or *.jsonl dumps (one per line). Rows are buffered
+only until --row-group calls are collected, then written out as a Parquet
+row group, so memory stays bounded however many calls are ingested. Each
+run appends one part file per table and skips call ids already in the
+store.
+
+Analyses then read only the columns they need and aggregate them with
+pyarrow.compute, instead of json.load-ing every document again.
+
+Usage:
+    python analytics/call_store.py ingest ../../output --store call_store
+    python analytics/call_store.py summary --store call_store
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+ROW_GROUP_CALLS = int(os.getenv('CALL_STORE_ROW_GROUP', 2000))
+
+SCHEMAS = {
+    'calls': pa.schema([
+        ('call_id', pa.int64()),
+        ('call_uuid', pa.string()),
+        ('created', pa.timestamp('ms')),
+        ('phone_number', pa.string()),
+        ('status', pa.string()),
+        ('vad_engine', pa.string()),
+        ('termination_reason', pa.string()),
+        ('termination_source', pa.string()),
+        ('booked', pa.bool_()),
+        ('specialty', pa.string()),
+        ('prompt_tokens', pa.int64()),
+        ('prompt_text_tokens', pa.int64()),
+        ('prompt_audio_tokens', pa.int64()),
+        ('response_tokens', pa.int64()),
+        ('response_audio_tokens', pa.int64()),
+        ('total_tokens', pa.int64()),
+        ('event_count', pa.int32()),
+        ('tool_call_count', pa.int32()),
+        ('turn_count', pa.int32()),
+        ('interruption_count', pa.int32()),
+        ('started_ms', pa.int64()),
+        ('ended_ms', pa.int64()),
+        ('duration_ms', pa.int64()),
+        ('summary', pa.string()),
+    ]),
+    'events': pa.schema([
+        ('call_id', pa.int64()),
+        ('seq', pa.int32()),
+        ('event', pa.string()),
+        ('timestamp_ms', pa.int64()),
+        ('data', pa.string()),  # JSON-encoded payload (usually empty)
+    ]),
+    'tool_calls': pa.schema([
+        ('call_id', pa.int64()),
+        ('seq', pa.int32()),
+        ('tool_name', pa.string()),
+        ('timestamp_ms', pa.int64()),
+    ]),
+    'phases': pa.schema([
+        ('call_id', pa.int64()),
+        ('seq', pa.int32()),
+        ('from_phase', pa.string()),
+        ('to_phase', pa.string()),
+        ('reason', pa.string()),
+        ('timestamp_ms', pa.int64()),
+    ]),
+    'turns': pa.schema([
+        ('call_id', pa.int64()),
+        ('seq', pa.int32()),
+        ('generation_complete_ms', pa.int64()),
+        ('turn_complete_ms', pa.int64()),
+        ('interrupted', pa.bool_()),
+        ('role', pa.string()),
+        ('text', pa.string()),
+    ]),
+}
+
+# ==================== READING DOCUMENTS ====================
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield call-detail `data` objects one at a time from files, .jsonl dumps or directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, '*.json')) + glob.glob(os.path.join(path, '*.jsonl')))
+            yield from iter_documents(files)
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                lines = (json.loads(line) for line in f if line.strip())
+            else:
+                lines = iter([json.load(f)])
+            for doc in lines:
+                data = doc.get('data', doc) if isinstance(doc, dict) else None
+                if isinstance(data, dict) and data.get('id') is not None:
+                    yield data
+
+def _token_detail(details: Optional[list], modality: str) -> Optional[int]:
+    for entry in details or []:
+        if entry.get('modality') == modality:
+            return entry.get('tokenCount')
+    return None
+
+def _created(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def flatten(data: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Rows for every table from one call-detail `data` object"""
+    call_id = int(data['id'])
+    details = data.get('call_details') or {}
+    events = details.get('events') or []
+    tools = details.get('toolCalls') or []
+    phases = details.get('phaseHistory') or []
+    usage = details.get('usageMetadata') or {}
+    outcome = details.get('callOutcomesData') or {}
+    transcription = details.get('transcriptionData') or {}
+
+    turn_done = transcription.get('turnCompleteTimestamps') or []
+    generated = transcription.get('generationCompleteTimestamps') or []
+    interruptions = transcription.get('interruptionTimestamps') or []
+    transcripts = transcription.get('transcripts') or []
+    interrupted_at = set(interruptions)
+
+    stamps = [e.get('timestamp') for e in events if e.get('timestamp') is not None]
+    started = min(stamps) if stamps else None
+    ended = max(stamps) if stamps else None
+
+    turns = []
+    for seq in range(max(len(turn_done), len(generated), len(transcripts))):
+        done = turn_done[seq] if seq < len(turn_done) else None
+        transcript = transcripts[seq] if seq < len(transcripts) and isinstance(transcripts[seq], dict) else {}
+        turns.append({
+            'call_id': call_id, 'seq': seq,
+            'generation_complete_ms': generated[seq] if seq < len(generated) else None,
+            'turn_complete_ms': done,
+            'interrupted': done in interrupted_at if done is not None else None,
+            'role': transcript.get('role') or transcript.get('speaker'),
+            'text': transcript.get('text') or transcript.get('transcript'),
+        })
+
+    return {
+        'calls': [{
+            'call_id': call_id,
+            'call_uuid': data.get('call_id') or details.get('callId'),
+            'created': _created(data.get('created')),
+            'phone_number': data.get('phone_number'),
+            'status': data.get('status'),
+            'vad_engine': data.get('vad_engine'),
+            'termination_reason': details.get('terminationReason'),
+            'termination_source': details.get('terminationSource'),
+            'booked': outcome.get('booked') if isinstance(outcome.get('booked'), bool) else None,
+            'specialty': outcome.get('specialty'),
+            'prompt_tokens': usage.get('promptTokenCount'),
+            'prompt_text_tokens': _token_detail(usage.get('promptTokensDetails'), 'TEXT'),
+            'prompt_audio_tokens': _token_detail(usage.get('promptTokensDetails'), 'AUDIO'),
+            'response_tokens': usage.get('responseTokenCount'),
+            'response_audio_tokens': _token_detail(usage.get('responseTokensDetails'), 'AUDIO'),
+            'total_tokens': usage.get('totalTokenCount'),
+            'event_count': len(events),
+            'tool_call_count': len(tools),
+            'turn_count': len(turns),
+            'interruption_count': len(interruptions),
+            'started_ms': started,
+            'ended_ms': ended,
+            'duration_ms': ended - started if stamps else None,
+            'summary': (details.get('callSummaryData') or {}).get('summary'),
+        }],
+        'events': [{
+            'call_id': call_id, 'seq': seq, 'event': e.get('event'), 'timestamp_ms': e.get('timestamp'),
+            'data': json.dumps(e['data'], separators=(',', ':')) if e.get('data') else None,
+        } for seq, e in enumerate(events)],
+        'tool_calls': [{
+            'call_id': call_id, 'seq': seq, 'tool_name': t.get('toolName'), 'timestamp_ms': t.get('timestamp'),
+        } for seq, t in enumerate(tools)],
+        'phases': [{
+            'call_id': call_id, 'seq': seq, 'from_phase': p.get('from'), 'to_phase': p.get('to'),
+            'reason': (p.get('metadata') or {}).get('reason'), 'timestamp_ms': p.get('timestamp'),
+        } for seq, p in enumerate(phases)],
+        'turns': turns,
+    }
+
+# ==================== STORE ====================
+
+class CallStore:
+    """A directory of Parquet tables (one sub-directory of part files per table)"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def table_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def has(self, name: str) -> bool:
+        return bool(glob.glob(os.path.join(self.table_dir(name), '*.parquet')))
+
+    def read(self, name: str, columns: Optional[List[str]] = None, filter=None) -> pa.Table:
+        """Read only the requested columns of a table (empty table if nothing was ingested)"""
+        schema = SCHEMAS[name]
+        if not self.has(name):
+            return schema.empty_table().select(columns) if columns else schema.empty_table()
+        dataset = ds.dataset(self.table_dir(name), schema=schema, format='parquet')
+        return dataset.to_table(columns=columns, filter=filter)
+
+    def call_ids(self) -> set:
+        return set(self.read('calls', ['call_id']).column('call_id').to_pylist())
+
+    def ingest(self, documents: Iterable[Dict[str, Any]], row_group_calls: int = ROW_GROUP_CALLS,
+               skip_existing: bool = True) -> Dict[str, int]:
+        """Append documents to the store; returns rows written per table (+ calls skipped)"""
+        seen = self.call_ids() if skip_existing else set()
+        part = f"part-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        writers = {}
+        buffers = {name: [] for name in SCHEMAS}
+        written = dict.fromkeys(SCHEMAS, 0)
+        written['skipped'] = 0
+
+        def flush():
+            for name, rows in buffers.items():
+                if not rows:
+                    continue
+                if name not in writers:
+                    os.makedirs(self.table_dir(name), exist_ok=True)
+                    writers[name] = pq.ParquetWriter(os.path.join(self.table_dir(name), part),
+                                                     SCHEMAS[name], compression='zstd')
+                writers[name].write_table(pa.Table.from_pylist(rows, schema=SCHEMAS[name]))
+                written[name] += len(rows)
+                rows.clear()
+
+        try:
+            pending = 0
+            for data in documents:
+                call_id = int(data['id'])
+                if call_id in seen:
+                    written['skipped'] += 1
+                    continue
+                seen.add(call_id)
+                for name, rows in flatten(data).items():
+                    buffers[name].extend(rows)
+                pending += 1
+                if pending >= row_group_calls:
+                    flush()
+                    pending = 0
+            flush()
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return written
+
+# ==================== ANALYTICS ====================
+
+def _percentiles(values: pa.Array, qs=(0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+    values = pc.drop_null(values)
+    if len(values) == 0:
+        return {f"p{int(q * 100)}": None for q in qs}
+    return {f"p{int(q * 100)}": v for q, v in zip(qs, pc.quantile(values, q=list(qs)).to_pylist())}
+
+def value_counts(table: pa.Table, column: str) -> Dict[Any, int]:
+    counts = pc.value_counts(table.column(column)).to_pylist()
+    return dict(sorted(((c['values'], c['counts']) for c in counts), key=lambda kv: -kv[1]))
+
+def summary(store: CallStore) -> Dict[str, Any]:
+    """Store-wide call statistics, computed with vectorised column scans"""
+    calls = store.read('calls', ['booked', 'total_tokens', 'prompt_tokens', 'duration_ms',
+                                 'termination_reason', 'interruption_count', 'turn_count'])
+    tools = store.read('tool_calls', ['tool_name'])
+    total = calls.num_rows
+    booked = pc.sum(pc.cast(pc.fill_null(calls.column('booked'), False), pa.int64())).as_py() or 0
+    turns = pc.sum(calls.column('turn_count')).as_py() or 0
+    interruptions = pc.sum(calls.column('interruption_count')).as_py() or 0
+    return {
+        'calls': total,
+        'booked': booked,
+        'booking_rate': booked / total if total else None,
+        'tokens': {
+            'total': pc.sum(calls.column('total_tokens')).as_py(),
+            'mean_prompt': pc.mean(calls.column('prompt_tokens')).as_py(),
+            **_percentiles(calls.column('total_tokens')),
+        },
+        'duration_ms': _percentiles(calls.column('duration_ms')),
+        'interruptions_per_turn': interruptions / turns if turns else None,
+        'termination_reasons': value_counts(calls, 'termination_reason'),
+        'tool_calls': value_counts(tools, 'tool_name'),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    ingest = sub.add_parser('ingest', help='Append call-detail JSON/JSONL files or directories to the store')
+    ingest.add_argument('paths', nargs='+')
+    ingest.add_argument('--store', default='call_store')
+    ingest.add_argument('--row-group', type=int, default=ROW_GROUP_CALLS, help='calls buffered per row group')
+    report = sub.add_parser('summary', help='Print store-wide call statistics')
+    report.add_argument('--store', default='call_store')
+    args = parser.parse_args(argv)
+
+    store = CallStore(args.store)
+    started = time.perf_counter()
+    if args.command == 'ingest':
+        written = store.ingest(iter_documents(args.paths), row_group_calls=args.row_group)
+        elapsed = time.perf_counter() - started
+        print(f"Ingested {written['calls']} calls ({written['skipped']} already stored) in {elapsed:.2f}s: "
+              + ", ".join(f"{name}={written[name]}" for name in SCHEMAS if name != 'calls'))
+    else:
+        print(json.dumps(summary(store), indent=2, default=str))
+        print(f"({time.perf_counter() - started:.3f}s)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
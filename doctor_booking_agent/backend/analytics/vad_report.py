@@ -0,0 +1,198 @@
+"""
+VAD engine latency report from call event timelines
+
+Reads the columnar call store (analytics/call_store.py) and compares the
+Dinodial VAD engines calls were placed with:
+
+  setup latency     call-initiated -> websocket-established,
+                    gemini-session-ready and greeting-complete
+  response latency  each turnCompleteTimestamp -> the next
+                    generationCompleteTimestamp of the same call (includes
+                    the caller's speaking time, so compare engines, not
+                    absolute numbers)
+  interruptions     interruptionTimestamps per model turn
+
+Latency percentiles (p50/p95/p99) are computed per engine with pyarrow's
+grouped t-digest. An engine's latency is only recommended once it has at
+least --min-calls calls.
+
+The engine comes from the call detail's vad_engine field when Dinodial
+echoes it. Otherwise pass --engine-map, a CSV of call_id,vad_engine, e.g.
+exported from the call_logs table that records the engine each call was
+placed with:
+
+    sqlite3 -csv instance/hospital_booking.db "select call_id, vad_engine from call_logs"
+
+To collect data, rotate engines with DINODIAL_VAD_ENGINES=CAWL,VALDOR,KAAN.
+
+Usage:
+    python analytics/vad_report.py --store call_store [--engine-map engines.csv] [--json]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from call_store import CallStore
+
+QUANTILES = (0.5, 0.95, 0.99)
+SETUP_STAGES = (
+    ('websocket_ms', 'websocket-established'),
+    ('session_ready_ms', 'gemini-session-ready'),
+    ('greeting_ms', 'greeting-complete'),
+)
+# Longest gap still treated as "the reply to this turn"; later generations belong to a later turn
+RESPONSE_WINDOW_MS = int(os.getenv('VAD_REPORT_RESPONSE_WINDOW_MS', 120000))
+
+def load_engine_map(path: str) -> pa.Table:
+    rows = {'call_id': [], 'map_engine': []}
+    with open(path, newline='', encoding='utf-8') as f:
+        for record in csv.reader(f):
+            if len(record) < 2 or not record[0].strip().isdigit():
+                continue  # header or blank line
+            rows['call_id'].append(int(record[0]))
+            rows['map_engine'].append(record[1].strip().upper() or None)
+    return pa.table(rows, schema=pa.schema([('call_id', pa.int64()), ('map_engine', pa.string())]))
+
+def call_engines(store: CallStore, engine_map: Optional[pa.Table] = None) -> pa.Table:
+    """(call_id, engine, turn_count, interruption_count) with 'unknown' for unattributed calls"""
+    calls = store.read('calls', ['call_id', 'vad_engine', 'turn_count', 'interruption_count'])
+    engine = calls.column('vad_engine')
+    if engine_map is not None and engine_map.num_rows:
+        calls = calls.join(engine_map, 'call_id', join_type='left outer')
+        engine = pc.coalesce(calls.column('map_engine'), calls.column('vad_engine'))
+    engine = pc.fill_null(engine, 'unknown')
+    return pa.table({
+        'call_id': calls.column('call_id'),
+        'engine': engine,
+        'turn_count': calls.column('turn_count'),
+        'interruption_count': calls.column('interruption_count'),
+    })
+
+def setup_latencies(store: CallStore) -> pa.Table:
+    """Per call: ms from call-initiated to each setup stage (null if the stage never happened)"""
+    events = store.read('events', ['call_id', 'event', 'timestamp_ms'])
+    firsts = events.group_by(['call_id', 'event']).aggregate([('timestamp_ms', 'min')])
+
+    def stage(name):
+        rows = firsts.filter(pc.equal(firsts.column('event'), name))
+        return pa.table({'call_id': rows.column('call_id'), name: rows.column('timestamp_ms_min')})
+
+    result = stage('call-initiated')
+    for column, event in SETUP_STAGES:
+        result = result.join(stage(event), 'call_id', join_type='left outer')
+        result = result.append_column(column, pc.subtract(result.column(event), result.column('call-initiated')))
+        result = result.drop_columns([event])
+    return result.drop_columns(['call-initiated'])
+
+def response_latencies(store: CallStore) -> pa.Table:
+    """One row per completed model turn: ms until the next generation completed in the same call"""
+    turns = store.read('turns', ['call_id', 'turn_complete_ms', 'generation_complete_ms'])
+    done = turns.filter(pc.is_valid(turns.column('turn_complete_ms')))
+    generated = turns.filter(pc.is_valid(turns.column('generation_complete_ms')))
+    # One timeline of turn completions (kind 0) and generations (kind 1), ordered within each call
+    timeline = pa.concat_tables([
+        pa.table({'call_id': done.column('call_id'), 'ts': done.column('turn_complete_ms'),
+                  'kind': pa.array([0] * done.num_rows, pa.int8())}),
+        pa.table({'call_id': generated.column('call_id'), 'ts': generated.column('generation_complete_ms'),
+                  'kind': pa.array([1] * generated.num_rows, pa.int8())}),
+    ]).sort_by([('call_id', 'ascending'), ('ts', 'ascending'), ('kind', 'ascending')])
+    is_generation = pc.equal(timeline.column('kind'), 1)
+    null_ts = pa.nulls(timeline.num_rows, pa.int64())
+    # Back-fill every row with the next generation's time and call; discard matches from a later call
+    next_generation = pc.fill_null_backward(pc.if_else(is_generation, timeline.column('ts'), null_ts))
+    next_call = pc.fill_null_backward(pc.if_else(is_generation, timeline.column('call_id'), null_ts))
+    response_ms = pc.subtract(next_generation, timeline.column('ts'))
+    keep = pc.and_(pc.and_(pc.invert(is_generation), pc.equal(next_call, timeline.column('call_id'))),
+                   pc.less_equal(response_ms, RESPONSE_WINDOW_MS))
+    return pa.table({'call_id': timeline.column('call_id'), 'response_ms': response_ms}).filter(keep)
+
+def _grouped_quantiles(table: pa.Table, column: str) -> Dict[str, Dict[str, Any]]:
+    valid = table.filter(pc.is_valid(table.column(column)))
+    if not valid.num_rows:
+        return {}
+    grouped = valid.group_by('engine').aggregate([
+        (column, 'tdigest', pc.TDigestOptions(q=list(QUANTILES))),
+        (column, 'count'),
+    ])
+    result = {}
+    for row in grouped.to_pylist():
+        values = row[f'{column}_tdigest'] or []
+        result[row['engine']] = {'n': row[f'{column}_count'],
+                                 **{f"p{int(q * 100)}": v for q, v in zip(QUANTILES, values)}}
+    return result
+
+def build_report(store: CallStore, engine_map: Optional[pa.Table] = None, min_calls: int = 20) -> Dict[str, Any]:
+    engines = call_engines(store, engine_map)
+    attribution = engines.select(['call_id', 'engine'])
+
+    setup = setup_latencies(store).join(attribution, 'call_id', join_type='inner')
+    responses = response_latencies(store).join(attribution, 'call_id', join_type='inner')
+    totals = engines.group_by('engine').aggregate([
+        ('call_id', 'count'), ('turn_count', 'sum'), ('interruption_count', 'sum')
+    ])
+
+    setup_stats = {column: _grouped_quantiles(setup, column) for column, _ in SETUP_STAGES}
+    response_stats = _grouped_quantiles(responses, 'response_ms')
+
+    report = {}
+    for row in totals.to_pylist():
+        engine = row['engine']
+        turns = row['turn_count_sum'] or 0
+        report[engine] = {
+            'calls': row['call_id_count'],
+            'setup': {column: setup_stats[column].get(engine) for column, _ in SETUP_STAGES},
+            'response_ms': response_stats.get(engine),
+            'interruption_rate': (row['interruption_count_sum'] or 0) / turns if turns else None,
+        }
+
+    eligible = {e: r for e, r in report.items()
+                if e != 'unknown' and r['calls'] >= min_calls and r['response_ms']}
+    recommended = min(eligible, key=lambda e: eligible[e]['response_ms']['p95']) if eligible else None
+    return {'engines': report, 'recommended': recommended, 'min_calls': min_calls}
+
+def _fmt(stats: Optional[Dict[str, Any]]) -> str:
+    if not stats:
+        return '-'
+    return '/'.join(f"{stats[f'p{int(q * 100)}']:.0f}" for q in QUANTILES)
+
+def print_report(report: Dict[str, Any]):
+    header = f"{'engine':<10} {'calls':>6}  {'websocket':>17}  {'session ready':>17}  {'greeting':>17}  " \
+             f"{'response':>17}  {'interrupt':>9}"
+    print("Latency in ms as p50/p95/p99")
+    print(header)
+    print('-' * len(header))
+    rows = sorted(report['engines'].items(), key=lambda kv: -kv[1]['calls'])
+    for engine, r in rows:
+        rate = f"{r['interruption_rate']:.1%}" if r['interruption_rate'] is not None else '-'
+        print(f"{engine:<10} {r['calls']:>6}  {_fmt(r['setup']['websocket_ms']):>17}  "
+              f"{_fmt(r['setup']['session_ready_ms']):>17}  {_fmt(r['setup']['greeting_ms']):>17}  "
+              f"{_fmt(r['response_ms']):>17}  {rate:>9}")
+    if report['recommended']:
+        print(f"\nLowest p95 response latency: {report['recommended']}")
+    else:
+        print(f"\nNo engine has {report['min_calls']}+ attributed calls yet; no recommendation.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare VAD engines by setup and response latency')
+    parser.add_argument('--store', default='call_store')
+    parser.add_argument('--engine-map', help='CSV of call_id,vad_engine for calls whose detail lacks the engine')
+    parser.add_argument('--min-calls', type=int, default=20, help='calls an engine needs before it can be recommended')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    engine_map = load_engine_map(args.engine_map) if args.engine_map else None
+    report = build_report(CallStore(args.store), engine_map, args.min_calls)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+In-memory index of free doctor availability slots
+
+Free slots are loaded once and kept in sorted lists keyed by
+(day ordinal * 1440 + minute of day), per doctor and per specialty, so
+"next N free slots after date D within [a, b]" is a bisect plus a short walk
+instead of one DoctorAvailability query per doctor. Times are compared as
+minute-of-day integers, so "9:00 AM" correctly sorts before "10:00 AM".
+
+The API keeps the index current in place when slots are added, deleted or
+booked and when doctors are registered or toggled. Writes made by other
+processes are picked up by a full reload every AVAILABILITY_INDEX_TTL seconds.
+"""
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import date
+from typing import Dict, List, Optional
+from models import db, Doctor, DoctorAvailability
+
+MINUTES_PER_DAY = 24 * 60
+INDEX_TTL = int(os.getenv('AVAILABILITY_INDEX_TTL', 300))
+
+FreeSlot = namedtuple('FreeSlot', ['slot_id', 'doctor_id', 'date', 'minute', 'time_slot'])
+
+_TIME_RE = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([AaPp]\.?[Mm]\.?)?\s*$')
+
+@lru_cache(maxsize=1024)
+def parse_time_slot(value: str) -> Optional[int]:
+    """Parse '10:00 AM', '10am', '2:30 pm' or '14:00' into minutes after midnight"""
+    match = _TIME_RE.match(value or '')
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if minute > 59:
+        return None
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem[0] in 'Pp' else 0)
+    elif hour > 23:
+        return None
+    return hour * 60 + minute
+
+def _sort_key(day: date, minute: int) -> int:
+    return day.toordinal() * MINUTES_PER_DAY + minute
+
+class AvailabilityIndex:
+    """Free slots sorted by (date, minute of day), per doctor and per specialty"""
+
+    def __init__(self, ttl: int = INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._slots: Dict[int, FreeSlot] = {}
+        self._by_doctor: Dict[int, list] = {}     # doctor_id -> [(key, slot_id)]
+        self._by_specialty: Dict[str, list] = {}  # specialty -> [(key, doctor_id, slot_id)]
+        self._doctors: Dict[int, tuple] = {}      # doctor_id -> (specialty, is_available)
+
+    # ---------- loading ----------
+
+    def load(self):
+        """(Re)build the index with one doctors query and one free-slots query"""
+        doctors = db.session.query(Doctor.id, Doctor.specialty, Doctor.is_available).all()
+        slots = db.session.query(
+            DoctorAvailability.id,
+            DoctorAvailability.doctor_id,
+            DoctorAvailability.date,
+            DoctorAvailability.time_slot
+        ).filter(
+            DoctorAvailability.is_booked == False,
+            DoctorAvailability.date >= date.today()
+        ).all()
+
+        with self._lock:
+            self._slots, self._by_doctor, self._by_specialty = {}, {}, {}
+            self._doctors = {d.id: (d.specialty, d.is_available is not False) for d in doctors}
+            for slot in slots:
+                self._insert(slot.id, slot.doctor_id, slot.date, slot.time_slot)
+            for entries in self._by_doctor.values():
+                entries.sort()
+            for entries in self._by_specialty.values():
+                entries.sort()
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Load on first use and reload once the TTL has passed (needs an app context)"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- in-place updates ----------
+
+    def _insert(self, slot_id, doctor_id, day, time_slot, keep_sorted=False):
+        minute = parse_time_slot(time_slot)
+        if minute is None:
+            print(f"[AvailabilityIndex] Skipping slot {slot_id}: unparseable time '{time_slot}'")
+            return
+        self._slots[slot_id] = FreeSlot(slot_id, doctor_id, day, minute, time_slot)
+        key = _sort_key(day, minute)
+        specialty = self._doctors.get(doctor_id, (None, True))[0]
+        doctor_entries = self._by_doctor.setdefault(doctor_id, [])
+        specialty_entries = self._by_specialty.setdefault(specialty, [])
+        if keep_sorted:
+            insort(doctor_entries, (key, slot_id))
+            insort(specialty_entries, (key, doctor_id, slot_id))
+        else:
+            doctor_entries.append((key, slot_id))
+            specialty_entries.append((key, doctor_id, slot_id))
+
+    def add_slot(self, slot_id: int, doctor_id: int, day: date, time_slot: str):
+        """Register a newly created (or released) free slot"""
+        with self._lock:
+            if self._loaded_at is None or slot_id in self._slots:
+                return
+            self._insert(slot_id, doctor_id, day, time_slot, keep_sorted=True)
+
+    def remove_slot(self, slot_id: int):
+        """Drop a slot that was deleted or fully booked"""
+        with self._lock:
+            slot = self._slots.pop(slot_id, None)
+            if slot is None:
+                return
+            key = _sort_key(slot.date, slot.minute)
+            specialty = self._doctors.get(slot.doctor_id, (None, True))[0]
+            self._discard(self._by_doctor.get(slot.doctor_id), (key, slot_id))
+            self._discard(self._by_specialty.get(specialty), (key, slot.doctor_id, slot_id))
+
+    @staticmethod
+    def _discard(entries, entry):
+        if not entries:
+            return
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def set_doctor(self, doctor_id: int, specialty: str, is_available: bool = True):
+        """Register a new doctor or record a change to their availability/specialty"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            previous = self._doctors.get(doctor_id)
+            self._doctors[doctor_id] = (specialty, is_available is not False)
+            old_specialty = previous[0] if previous else None
+            if old_specialty != specialty and old_specialty in self._by_specialty:
+                old_entries = self._by_specialty[old_specialty]
+                moved = [e for e in old_entries if e[1] == doctor_id]
+                self._by_specialty[old_specialty] = [e for e in old_entries if e[1] != doctor_id]
+                new_entries = self._by_specialty.setdefault(specialty, [])
+                new_entries.extend(moved)
+                new_entries.sort()
+
+    # ---------- queries ----------
+
+    @staticmethod
+    def _scan(entries, after: date, from_minute: int, to_minute: int, limit: int, accept=None) -> list:
+        """Walk sorted entries from `after`, jumping over minutes outside [from_minute, to_minute]"""
+        found = []
+        if not entries or limit <= 0 or from_minute > to_minute:
+            return found
+        i = bisect_left(entries, (_sort_key(after, from_minute),))
+        n = len(entries)
+        while i < n and len(found) < limit:
+            entry = entries[i]
+            day, minute = divmod(entry[0], MINUTES_PER_DAY)
+            if minute < from_minute:
+                i = bisect_left(entries, (day * MINUTES_PER_DAY + from_minute,), i)
+                continue
+            if minute > to_minute:
+                i = bisect_left(entries, ((day + 1) * MINUTES_PER_DAY + from_minute,), i)
+                continue
+            if accept is None or accept(entry):
+                found.append(entry)
+            i += 1
+        return found
+
+    def doctor_slots(self, doctor_id: int, after: date, from_minute: int = 0,
+                     to_minute: int = MINUTES_PER_DAY - 1, limit: int = 5) -> List[FreeSlot]:
+        """Next `limit` free slots for one doctor on or after `after`, within the time window"""
+        with self._lock:
+            entries = self._scan(self._by_doctor.get(doctor_id), after, from_minute, to_minute, limit)
+            return [self._slots[slot_id] for _, slot_id in entries]
+
+    def next_free_slots(self, specialty: str, after: date, from_minute: int = 0,
+                        to_minute: int = MINUTES_PER_DAY - 1, limit: int = 10) -> List[FreeSlot]:
+        """Next `limit` free slots across all available doctors of a specialty"""
+        with self._lock:
+            doctors = self._doctors
+            entries = self._scan(
+                self._by_specialty.get(specialty), after, from_minute, to_minute, limit,
+                accept=lambda entry: doctors.get(entry[1], (None, False))[1]
+            )
+            return [self._slots[slot_id] for _, _, slot_id in entries]
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,288 @@
+"""
+Latency and SQL-count benchmark of the hot hospital_api endpoints
+
+Generates a synthetic database (synthetic_data.py), imports hospital_api
+against it and drives each endpoint in-process through the Flask test
+client. Dinodial is replaced by an in-memory stub on agent.client, so
+prompt building still runs but no call is placed. twilio.rest.Client is
+replaced by a stub that records messages; booking and sync only queue them
+in the outbox. Each scenario reports p50/p95 latency and the number of SQL
+statements per request (counted with engine events on every bind).
+
+The results go into a baseline file. Later runs are compared against it,
+and the benchmark exits 1 if any of these regressed:
+  - p50 or p95 grew by more than --threshold (relative) and --min-delta-ms
+  - a scenario issues more SQL statements per request than before
+
+Latencies depend on the machine, so keep baselines per machine. The SQL
+counts do not.
+
+Usage:
+    python benchmarks/bench_endpoints.py                     # compare (first run writes the baseline)
+    python benchmarks/bench_endpoints.py --update-baseline
+    python benchmarks/bench_endpoints.py --doctors 2000 --patients 500000 --appointments 1000000 \\
+        --database /tmp/bench.db --baseline /tmp/bench_baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'endpoints.json')
+STUB_CALL_ID_BASE = 2_000_000_000  # stubbed Dinodial call ids stay clear of synthetic ones
+
+Scenario = namedtuple('Scenario', ['name', 'method', 'request', 'expect', 'on_success'], defaults=(None,))
+Result = namedtuple('Result', ['name', 'requests', 'p50_ms', 'p95_ms', 'max_ms', 'sql_median', 'sql_max', 'errors'])
+
+class StubDinodialClient:
+    """Answers the DinodialClient calls hospital_api makes, without the network"""
+
+    def __init__(self):
+        self._ids = itertools.count(STUB_CALL_ID_BASE)
+        self.calls = {}  # call id -> patient phone, filled in by the booking scenario
+        self.requests = 0
+
+    def initiate_call(self, prompt, evaluation_tool, vad_engine='CAWL'):
+        self.requests += 1
+        return {'status': 'success', 'data': {'id': next(self._ids)}}
+
+    def get_call_detail(self, call_id):
+        self.requests += 1
+        return {'status': 'success', 'data': {
+            'id': call_id,
+            'phone_number': self.calls.get(int(call_id), '+917900000000'),
+            'status': 'completed',
+            'duration': 95,
+            'created': datetime.utcnow().isoformat(),
+            'evaluation_result': {'booked': True, 'name': 'Bench Patient', 'symptoms': 'fever',
+                                  'specialty': 'General Medicine', 'time': '10:00 AM'},
+            'call_details': {'usageMetadata': {
+                'promptTokenCount': 5200, 'responseTokenCount': 2100,
+                'promptTokensDetails': [{'modality': 'TEXT', 'tokenCount': 1600},
+                                        {'modality': 'AUDIO', 'tokenCount': 3600}],
+                'responseTokensDetails': [{'modality': 'AUDIO', 'tokenCount': 2100}],
+            }},
+        }}
+
+    def get_call_recording(self, call_id):
+        self.requests += 1
+        return {'status': 'error', 'message': 'stubbed'}
+
+class StubTwilioClient:
+    """twilio.rest.Client look-alike that records messages instead of sending them"""
+    sent = []
+
+    def __init__(self, *args, **kwargs):
+        self.messages = self
+
+    def create(self, **kwargs):
+        StubTwilioClient.sent.append(kwargs)
+        return namedtuple('Message', ['sid', 'status'])(f'SM{len(StubTwilioClient.sent):032d}', 'queued')
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def load_app(db_path, args):
+    """Import hospital_api on `db_path`, filling it with a synthetic dataset first if it is new"""
+    os.environ['SQLITE_PATH'] = db_path
+    fresh = not os.path.exists(db_path)
+    import twilio.rest
+    twilio.rest.Client = StubTwilioClient
+    import hospital_api
+    from models import db
+    from counters import reconcile_counters
+    from availability_index import availability_index
+    from roster_cache import roster_cache
+    from synthetic_data import SyntheticDataset
+
+    hospital_api.agent.client = StubDinodialClient()
+    app = hospital_api.app
+    if fresh:
+        with app.app_context():
+            started = time.perf_counter()
+            counts = SyntheticDataset(args.doctors, args.patients, args.appointments,
+                                      seed=args.seed).generate()
+            reconcile_counters()
+            print(f"Generated {', '.join(f'{v:,} {k}' for k, v in counts.items())} "
+                  f"in {time.perf_counter() - started:.1f}s")
+    else:
+        print(f"Reusing {db_path}")
+    availability_index.invalidate()
+    roster_cache.invalidate()
+    return app, db
+
+def count_statements(db, app):
+    """Install a before_cursor_execute counter on every engine; returns the counter dict"""
+    from sqlalchemy import event
+    counter = {'statements': 0}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['statements'] += 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', on_execute)
+    return counter
+
+def build_scenarios(app, db, dinodial):
+    """The benchmarked requests, in run order (syncs use the calls the bookings placed)"""
+    from sqlalchemy import func
+    from models import Appointment, Doctor, DoctorAvailability
+
+    today = date.today()
+    with app.app_context():
+        busiest_doctor = (db.session.query(Appointment.doctor_id).group_by(Appointment.doctor_id)
+                          .order_by(func.count(Appointment.id).desc()).limit(1).scalar()
+                          or db.session.query(Doctor.id).limit(1).scalar())
+        free_slots = (db.session.query(DoctorAvailability.doctor_id, DoctorAvailability.date,
+                                       DoctorAvailability.time_slot)
+                      .filter(DoctorAvailability.is_booked == False, DoctorAvailability.date >= today)
+                      .order_by(DoctorAvailability.id).all())
+    slots = itertools.cycle(free_slots)
+    phones = (f'+9178{n:08d}' for n in itertools.count())
+    booked_calls = []
+
+    def book(i):
+        doctor_id, day, time_slot = next(slots)
+        return {'json': {'patient_phone': next(phones), 'patient_name': 'Bench Patient', 'doctor_id': doctor_id,
+                         'appointment_date': day.isoformat(), 'appointment_time': time_slot, 'reason': 'benchmark'}}
+
+    def booked(request, response):
+        call_id = response.get_json()['call_id']
+        dinodial.calls[call_id] = request['json']['patient_phone']
+        booked_calls.append(call_id)
+
+    def sync(i):
+        return {'path': f'/api/call/sync/{booked_calls[i % len(booked_calls)]}'}
+
+    scenarios = [
+        Scenario('appointments', 'GET', lambda i: {'path': '/api/appointments'}, 200),
+        Scenario('appointments?status', 'GET', lambda i: {'path': '/api/appointments?status=scheduled'}, 200),
+        Scenario('doctors/available', 'GET', lambda i: {'path': f'/api/doctors/available?date={today}'}, 200),
+        Scenario('doctors/available?specialty', 'GET',
+                 lambda i: {'path': f'/api/doctors/available?date={today}&specialty=Cardiology'}, 200),
+        Scenario('stats/dashboard', 'GET', lambda i: {'path': '/api/stats/dashboard'}, 200),
+        Scenario('doctor/<id>/appointments', 'GET',
+                 lambda i: {'path': f'/api/doctor/{busiest_doctor}/appointments'}, 200),
+        Scenario('appointment/book', 'POST', lambda i: {'path': '/api/appointment/book', **book(i)}, 201, booked),
+        Scenario('call/sync/<id>', 'POST', sync, 200),
+    ]
+    return scenarios
+
+def run_scenario(client, counter, scenario, iterations, warmup):
+    timings, statements, errors = [], [], 0
+    for i in range(warmup + iterations):
+        request = scenario.request(i)
+        path = request['path']
+        counter['statements'] = 0
+        started = time.perf_counter()
+        response = client.open(path, method=scenario.method, json=request.get('json'))
+        elapsed = time.perf_counter() - started
+        if response.status_code != scenario.expect:
+            errors += 1
+            if errors == 1:
+                print(f"  {scenario.name}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+        elif scenario.on_success:
+            scenario.on_success(request, response)
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            statements.append(counter['statements'])
+    return Result(scenario.name, len(timings), round(percentile(timings, 50), 3), round(percentile(timings, 95), 3),
+                  round(max(timings), 3), percentile(statements, 50), max(statements), errors)
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regression messages of `results` against a baseline dict"""
+    regressions = []
+    for result in results:
+        base = baseline.get('endpoints', {}).get(result.name)
+        if not base:
+            continue
+        for field in ('p50_ms', 'p95_ms'):
+            now, before = getattr(result, field), base[field]
+            if now > before * (1 + threshold) and now - before > min_delta_ms:
+                regressions.append(f"{result.name}: {field} {before:.2f} -> {now:.2f} ms (+{(now / before - 1) * 100:.0f}%)")
+        if result.sql_max > base['sql_max']:
+            regressions.append(f"{result.name}: SQL statements per request {base['sql_max']} -> {result.sql_max}")
+    return regressions
+
+def write_baseline(path, results, args):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'machine': f"{platform.node()} {platform.machine()} Python {platform.python_version()}",
+            'dataset': {'doctors': args.doctors, 'patients': args.patients,
+                        'appointments': args.appointments, 'seed': args.seed},
+            'iterations': args.iterations,
+            'endpoints': {r.name: {k: v for k, v in r._asdict().items() if k not in ('name', 'errors')}
+                          for r in results},
+        }, f, indent=2)
+    print(f"Baseline written to {path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--database', help='SQLite file to use; generated if missing (default: a temp file)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative latency growth')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore latency changes smaller than this')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.abspath(args.database) if args.database else os.path.join(tmp, 'bench.db')
+        app, db = load_app(db_path, args)
+        counter = count_statements(db, app)
+        import hospital_api
+        scenarios = build_scenarios(app, db, hospital_api.agent.client)
+        client = app.test_client()
+
+        results = []
+        for scenario in scenarios:
+            results.append(run_scenario(client, counter, scenario, args.iterations, args.warmup))
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    print(f"\n{'endpoint':<30}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'SQL p50':>9}{'SQL max':>9}{'errors':>8}")
+    for r in results:
+        print(f"{r.name:<30}{r.p50_ms:>9.2f}{r.p95_ms:>9.2f}{r.max_ms:>9.2f}{r.sql_median:>9}{r.sql_max:>9}{r.errors:>8}")
+    print(f"Stubbed Dinodial requests: {hospital_api.agent.client.requests}, Twilio messages: {len(StubTwilioClient.sent)}")
+
+    failed = sum(r.errors for r in results)
+    if failed:
+        print(f"\n{failed} request(s) returned an unexpected status")
+    if args.update_baseline or not os.path.exists(args.baseline):
+        write_baseline(args.baseline, results, args)
+        return 1 if failed else 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('dataset') != {'doctors': args.doctors, 'patients': args.patients,
+                                   'appointments': args.appointments, 'seed': args.seed}:
+        print(f"\nWARNING: baseline was recorded on a different dataset: {baseline.get('dataset')}")
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\nREGRESSIONS against {args.baseline} (recorded {baseline.get('recorded_at')}):")
+        for line in regressions:
+            print(f"  {line}")
+    else:
+        print(f"\nRESULT: OK - no regressions against {args.baseline}")
+    return 1 if regressions or failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
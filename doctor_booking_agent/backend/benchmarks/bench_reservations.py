@@ -0,0 +1,153 @@
+"""
+Multithreaded stress benchmark for slot reservations
+
+Runs against a throwaway SQLite database:
+  1. Hot slot  - many threads race for one slot with limited capacity
+  2. Spread    - threads book random slots, oversubscribing total capacity 2x
+
+Each successful claim also inserts an Appointment in the same transaction,
+like book_appointment does. Afterwards the benchmark checks that no slot
+holds more appointments than max_patients and reports bookings per second.
+
+Usage:
+    python benchmarks/bench_reservations.py [--threads 200] [--slots 500] [--capacity 2]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from models import db, Doctor, Patient, Appointment, DoctorAvailability
+from reservations import SlotReservations
+
+def create_app(db_path, threads):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': threads,
+        'max_overflow': 0,
+        'connect_args': {'timeout': 60}
+    }
+    db.init_app(app)
+    return app
+
+def seed(app, slot_count, capacity):
+    with app.app_context():
+        db.create_all()
+        doctor = Doctor(name='Dr. Bench', specialty='General Medicine', phone='0000000000')
+        patient = Patient(name='Bench Patient', phone='+910000000000')
+        db.session.add_all([doctor, patient])
+        db.session.flush()
+        db.session.add_all(DoctorAvailability(
+            doctor_id=doctor.id,
+            date=date.today(),
+            time_slot=f'{(540 + i) // 60 % 24:02d}:{(540 + i) % 60:02d}',
+            max_patients=capacity
+        ) for i in range(slot_count))
+        db.session.commit()
+        slot_ids = [row.id for row in db.session.query(DoctorAvailability.id).all()]
+        return doctor.id, patient.id, slot_ids
+
+def run(app, engine, doctor_id, patient_id, slot_ids, threads, attempts_per_thread):
+    """Every thread makes `attempts_per_thread` booking attempts on random slots"""
+    stats = {'booked': 0, 'conflicts': 0, 'errors': 0}
+    stats_lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        booked = conflicts = errors = 0
+        with app.app_context():
+            start_barrier.wait()
+            for _ in range(attempts_per_thread):
+                slot_id = rng.choice(slot_ids)
+                try:
+                    result = engine.reserve(slot_id)
+                    if not result.ok:
+                        db.session.rollback()
+                        conflicts += 1
+                        continue
+                    db.session.add(Appointment(
+                        patient_id=patient_id,
+                        doctor_id=doctor_id,
+                        appointment_date=date.today(),
+                        appointment_time=str(slot_id),  # slot id doubles as the booking key
+                        status='scheduled'
+                    ))
+                    db.session.commit()
+                    booked += 1
+                except OperationalError:
+                    db.session.rollback()
+                    errors += 1
+        with stats_lock:
+            stats['booked'] += booked
+            stats['conflicts'] += conflicts
+            stats['errors'] += errors
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+def verify(app, capacity):
+    """Return (total booked_count, appointments, overbooked slot count)"""
+    with app.app_context():
+        booked_total = db.session.query(func.sum(DoctorAvailability.booked_count)).scalar() or 0
+        appointments = db.session.query(func.count(Appointment.id)).scalar()
+        per_slot = db.session.query(Appointment.appointment_time, func.count(Appointment.id)).group_by(Appointment.appointment_time).all()
+        overbooked = sum(1 for _, n in per_slot if n > capacity)
+        overbooked += db.session.query(func.count(DoctorAvailability.id)).filter(
+            DoctorAvailability.booked_count > DoctorAvailability.max_patients
+        ).scalar()
+        return booked_total, appointments, overbooked
+
+def scenario(name, threads, slots, capacity, attempts_per_thread):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'), threads)
+        doctor_id, patient_id, slot_ids = seed(app, slots, capacity)
+        stats = run(app, SlotReservations(), doctor_id, patient_id, slot_ids, threads, attempts_per_thread)
+        booked_total, appointments, overbooked = verify(app, capacity)
+        with app.app_context():
+            db.engine.dispose()
+
+    rate = stats['booked'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    attempt_rate = threads * attempts_per_thread / stats['elapsed'] if stats['elapsed'] else 0.0
+    print(f"\n== {name} ==")
+    print(f"threads={threads} slots={slots} capacity={capacity} attempts={threads * attempts_per_thread}")
+    print(f"booked={stats['booked']} conflicts={stats['conflicts']} errors={stats['errors']} "
+          f"elapsed={stats['elapsed']:.2f}s -> {rate:.0f} bookings/sec, {attempt_rate:.0f} attempts/sec")
+    print(f"slot booked_count total={booked_total} appointments={appointments} overbooked slots={overbooked}")
+
+    ok = overbooked == 0 and booked_total == appointments == stats['booked'] and stats['booked'] <= slots * capacity
+    print("RESULT:", "OK - zero double-bookings" if ok else "FAILED - double-booking detected")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=500)
+    parser.add_argument('--capacity', type=int, default=2)
+    parser.add_argument('--hot-capacity', type=int, default=25)
+    args = parser.parse_args()
+
+    ok = scenario('Hot slot', args.threads, slots=1, capacity=args.hot_capacity, attempts_per_thread=5)
+    attempts = max(1, (args.slots * args.capacity * 2) // args.threads)
+    ok = scenario('Spread', args.threads, args.slots, args.capacity, attempts) and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Watermark-based reconciliation of completed calls
+
+Call results normally arrive through call_completed_webhook. A lost webhook
+used to leave its CallLog at 'in_progress' until someone ran sync_call.py.
+The reconciler pages through Dinodial's call list (newest first) and stops
+at the first page that reaches the persisted high-water mark, the
+reconciler_state row's watermark. Each cycle therefore only looks at calls
+newer than that mark. Completed calls without a completed CallLog are
+synced through the same batch path as POST /api/call/sync.
+
+The watermark only advances over a contiguous run of settled calls. A call
+that is still running, or whose sync failed, holds it back so it is looked
+at again next cycle. Calls still unsettled after CALL_RECONCILE_STALE_AFTER
+seconds, or whose sync failed CALL_RECONCILE_MAX_ATTEMPTS times, stop
+holding it. The watermark is only ever raised, never moved backwards.
+
+When CALL_RECONCILE_MAX_PAGES pages do not reach the watermark, the calls
+older than the last page scanned are given up (and logged): the watermark
+still advances over the scanned range, from just below its oldest call,
+so the next cycle does not rescan the same pages from the top.
+
+Every scheduler process starts a reconciler, but only one runs a cycle at a
+time: a cycle first takes the lease on the same row with a conditional
+UPDATE (lease_owner/lease_expires_at, taken only when no live lease is
+stored) and clears it when done. A reconciler that crashes mid-cycle holds
+the lease until CALL_RECONCILE_LEASE_SECONDS expires. Other processes skip
+their cycle while it is held.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from models import db, CallLog, ReconcilerState
+
+STATE_NAME = 'calls'  # reconciler_state row
+WORKER_ID = os.getenv('SCHEDULER_WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+INTERVAL = int(os.getenv('CALL_RECONCILE_INTERVAL', 300))  # 0 disables the background thread
+PAGE_SIZE = int(os.getenv('CALL_RECONCILE_PAGE_SIZE', 100))
+MAX_PAGES = int(os.getenv('CALL_RECONCILE_MAX_PAGES', 50))  # per cycle
+STALE_AFTER = int(os.getenv('CALL_RECONCILE_STALE_AFTER', 7200))
+MAX_ATTEMPTS = int(os.getenv('CALL_RECONCILE_MAX_ATTEMPTS', 3))
+LEASE_SECONDS = int(os.getenv('CALL_RECONCILE_LEASE_SECONDS', 900))  # longer than any cycle
+# Initial watermark for a fresh database, so the first cycle does not walk the whole history
+START_ID = int(os.getenv('CALL_RECONCILE_START_ID', 0))
+
+SETTLED_STATUSES = {'completed', 'failed', 'cancelled', 'canceled', 'busy', 'no-answer', 'no_answer', 'error'}
+
+def call_list_page(response: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], bool]:
+    """(calls, has_next) from a call-list response, paginated ({results, next}) or not (plain list)"""
+    if not isinstance(response, dict) or response.get('status', 'success') != 'success':
+        raise RuntimeError(f"Call list request failed: {response}")
+    data = response.get('data', response)
+    if isinstance(data, dict):
+        return list(data.get('results') or data.get('calls') or []), bool(data.get('next'))
+    return list(data or []), False
+
+def _created_at(call: Dict[str, Any]) -> Optional[datetime]:
+    try:
+        created = datetime.fromisoformat(call['created'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return created.astimezone(timezone.utc).replace(tzinfo=None) if created.tzinfo else created
+
+def _ensure_state():
+    """Create the reconciler_state row on first use"""
+    if db.session.get(ReconcilerState, STATE_NAME) is not None:
+        return
+    try:
+        db.session.add(ReconcilerState(name=STATE_NAME, watermark=0))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another process created it first
+
+def acquire_lease(seconds: int = LEASE_SECONDS, worker_id: str = WORKER_ID) -> Optional[str]:
+    """Take the reconciler lease for every process; returns the owner token, or None if held"""
+    now = datetime.utcnow()
+    owner = f"{worker_id}#{uuid.uuid4().hex[:12]}"
+    try:
+        _ensure_state()
+        result = db.session.execute(
+            update(ReconcilerState)
+            .where(ReconcilerState.name == STATE_NAME,
+                   or_(ReconcilerState.lease_expires_at.is_(None), ReconcilerState.lease_expires_at <= now))
+            .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return owner if result.rowcount == 1 else None
+
+def release_lease(owner: str):
+    """Clear the lease, unless it expired and someone else has taken it since"""
+    try:
+        db.session.execute(
+            update(ReconcilerState)
+            .where(ReconcilerState.name == STATE_NAME, ReconcilerState.lease_owner == owner)
+            .values(lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def read_watermark() -> int:
+    return db.session.query(ReconcilerState.watermark).filter_by(name=STATE_NAME).scalar() or 0
+
+def raise_watermark(value: int):
+    """Set the watermark to max(current, value) inside the current transaction"""
+    db.session.execute(
+        update(ReconcilerState)
+        .where(ReconcilerState.name == STATE_NAME, ReconcilerState.watermark < value)
+        .values(watermark=value)
+        .execution_options(synchronize_session=False)
+    )
+
+class CallReconciler:
+    """Syncs completed calls newer than the watermark, then advances it"""
+
+    def __init__(self, list_page: Callable[[int], Dict[str, Any]], sync: Callable[[List[int]], List[Dict[str, Any]]],
+                 max_pages: int = MAX_PAGES, stale_after: int = STALE_AFTER, max_attempts: int = MAX_ATTEMPTS):
+        self.list_page = list_page  # page number (1-based) -> get_call_list response
+        self.sync = sync  # call ids -> per-call results (call_sync result dicts)
+        self.max_pages = max_pages
+        self.stale_after = timedelta(seconds=stale_after)
+        self.max_attempts = max_attempts
+        self._failures = {}  # call_id -> failed sync attempts
+
+    def new_calls(self, watermark: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Calls with id > watermark, oldest first, and whether the listing reached the watermark"""
+        calls = {}
+        for page in range(1, self.max_pages + 1):
+            items, has_next = call_list_page(self.list_page(page))
+            reached = False
+            for item in items:
+                call_id = int(item['id'])
+                if call_id > watermark:
+                    calls[call_id] = item
+                else:
+                    reached = True
+            if reached or not has_next:
+                return [calls[k] for k in sorted(calls)], True
+        return [calls[k] for k in sorted(calls)], False
+
+    def _already_synced(self, call_ids: Iterable[int]) -> set:
+        keys = [str(c) for c in call_ids]
+        synced = set()
+        for start in range(0, len(keys), 500):
+            rows = db.session.query(CallLog.call_id).filter(
+                CallLog.call_id.in_(keys[start:start + 500]),
+                CallLog.status == 'completed'
+            ).all()
+            synced.update(int(row.call_id) for row in rows)
+        return synced
+
+    def _holds_watermark(self, call: Dict[str, Any], failed: set, now: datetime) -> bool:
+        call_id = int(call['id'])
+        if call_id in failed:
+            return self._failures.get(call_id, 0) < self.max_attempts
+        if (call.get('status') or '').lower() in SETTLED_STATUSES:
+            return False
+        created = _created_at(call)
+        return created is None or now - created < self.stale_after
+
+    def run_once(self) -> Dict[str, Any]:
+        """One reconciliation cycle, if no other process holds the lease (must run inside an app context)"""
+        lease = acquire_lease()
+        if lease is None:
+            return {'skipped': 'another reconciler holds the lease', 'scanned': 0}
+        try:
+            return self._reconcile()
+        finally:
+            release_lease(lease)
+
+    def _reconcile(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        watermark = read_watermark() or START_ID
+        calls, complete = self.new_calls(watermark)
+
+        completed = [int(c['id']) for c in calls if (c.get('status') or '').lower() == 'completed']
+        synced = self._already_synced(completed)
+        pending = [c for c in completed if c not in synced]
+        db.session.rollback()  # end the read transaction before the sync opens its own
+
+        failed = set()
+        if pending:
+            for result in self.sync(pending):
+                call_id = int(result['call_id'])
+                if result['status'] == 'success':
+                    self._failures.pop(call_id, None)
+                else:
+                    failed.add(call_id)
+                    self._failures[call_id] = self._failures.get(call_id, 0) + 1
+                    print(f"[Reconciler] Sync of call {call_id} failed "
+                          f"({self._failures[call_id]}/{self.max_attempts}): {result.get('message')}")
+
+        new_watermark = watermark
+        if not complete and calls:
+            # Calls below the scanned pages are out of reach; start the walk just below the
+            # oldest call seen instead of rescanning the same pages from the top next cycle
+            new_watermark = max(watermark, int(calls[0]['id']) - 1)
+            print(f"[Reconciler] Call list not exhausted after {self.max_pages} pages; calls between "
+                  f"{watermark} and {new_watermark} are skipped (raise CALL_RECONCILE_MAX_PAGES to reach them)")
+        now = datetime.utcnow()
+        for call in calls:
+            if self._holds_watermark(call, failed, now):
+                break
+            new_watermark = int(call['id'])
+            self._failures.pop(new_watermark, None)
+
+        if new_watermark > watermark:
+            try:
+                raise_watermark(new_watermark)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+        return {
+            'watermark': new_watermark,
+            'scanned': len(calls),
+            'synced': len(pending) - len(failed),
+            'failed': len(failed),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+def start_reconciler(app, reconciler: CallReconciler, interval: int = INTERVAL) -> bool:
+    """Run reconciler.run_once() every `interval` seconds on a daemon thread"""
+    if not interval:
+        return False
+
+    def loop():
+        while True:
+            try:
+                with app.app_context():
+                    stats = reconciler.run_once()
+                if stats['scanned']:
+                    print(f"[Reconciler] {stats}")
+            except Exception as e:
+                print(f"[Reconciler] Cycle failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name='call-reconciler', daemon=True).start()
+    return True
@@ -0,0 +1,276 @@
+"""
+Apply Dinodial call results to the database in batches
+
+sync_call_results used to resolve the patient, call log, appointment and
+doctors of a call with one query each and commit per call. Here a chunk of
+up to CALL_SYNC_BATCH_SIZE fetched call details is applied together: the
+patients (by phone), call logs (by call_id), their appointments and the
+doctors matching any requested specialty are loaded with one IN/OR query
+each, every call is applied against those maps, and the chunk commits once.
+If any call in a chunk fails, the chunk is rolled back and its calls are
+retried one transaction each, so a single bad call never sinks the rest.
+
+Booking confirmations are written to the outbox in the same transaction, so
+they only go out for calls that committed, and only on the sync that first
+sees the call booked. So are the call's token usage and
+cost (usage.py). Scheduler wake-ups are returned to the caller.
+"""
+import os
+import secrets
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from models import db, Doctor, Patient, Appointment, CallLog, FollowUpCall
+import outbox
+import usage
+
+BATCH_SIZE = int(os.getenv('CALL_SYNC_BATCH_SIZE', 100))  # calls per transaction
+MAX_IDS = int(os.getenv('CALL_SYNC_MAX_IDS', 500))  # calls per batch request
+
+# One synced call: per-call result plus the follow-ups to announce after commit
+SyncOutcome = namedtuple('SyncOutcome', ['call_id', 'result', 'followups'])
+SyncReport = namedtuple('SyncReport', ['results', 'followups'])
+
+def evaluation_of(call_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Evaluation result of a call, falling back to call_details.callOutcomesData"""
+    evaluation_result = call_data.get('evaluation_result', {})
+    if not evaluation_result and 'call_details' in call_data:
+        evaluation_result = (call_data['call_details'] or {}).get('callOutcomesData', {})
+    return evaluation_result or {}
+
+class SyncLookups:
+    """Rows a chunk of calls needs, loaded with one query per table"""
+
+    def __init__(self, details: Dict[str, Dict[str, Any]]):
+        phones = {data.get('phone_number', 'Unknown') for data in details.values()}
+        specialties = {evaluation_of(data).get('specialty') for data in details.values()} - {None, ''}
+
+        self.patients = {p.phone: p for p in Patient.query.filter(Patient.phone.in_(phones))}
+        self.call_logs = {c.call_id: c for c in CallLog.query.filter(CallLog.call_id.in_(list(details)))}
+
+        appointment_ids = [c.appointment_id for c in self.call_logs.values() if c.appointment_id]
+        self.appointments = {}
+        if appointment_ids:
+            self.appointments = {a.id: a for a in Appointment.query.options(joinedload(Appointment.doctor))
+                                 .filter(Appointment.id.in_(appointment_ids))}
+
+        self.specialty_doctors = []
+        if specialties:
+            self.specialty_doctors = (Doctor.query
+                                      .filter(or_(*[Doctor.specialty.ilike(f"%{s}%") for s in specialties]))
+                                      .order_by(Doctor.id).all())
+        self._default_doctor = None
+
+    def doctor_for_specialty(self, specialty: str) -> Optional[Doctor]:
+        """First doctor whose specialty contains `specialty` (same match as ilike('%s%'))"""
+        needle = specialty.lower()
+        for doctor in self.specialty_doctors:
+            if needle in (doctor.specialty or '').lower():
+                return doctor
+        return None
+
+    def default_doctor(self) -> Doctor:
+        """First doctor, or a placeholder one when the table is empty"""
+        if self._default_doctor is None:
+            doctor = Doctor.query.first()
+            if not doctor:
+                # Create a dummy doctor if none exists
+                doctor = Doctor(name="Dr. Sharma", specialty="General Medicine", phone="0000000000")
+                db.session.add(doctor)
+                db.session.flush()
+            self._default_doctor = doctor
+        return self._default_doctor
+
+def apply_call_result(call_id: str, call_data: Dict[str, Any], lookups: SyncLookups) -> SyncOutcome:
+    """Upsert the patient, call log and appointment of one call (no commit)"""
+    evaluation_result = evaluation_of(call_data)
+    phone_number = call_data.get('phone_number', 'Unknown')
+
+    # 1. Find or Create Patient
+    patient = lookups.patients.get(phone_number)
+    if not patient:
+        patient = Patient(name=evaluation_result.get('name', 'New Patient'), phone=phone_number)
+        db.session.add(patient)
+        db.session.flush()  # Get ID
+        lookups.patients[phone_number] = patient
+
+    # Update patient name if we have a better one now
+    if evaluation_result.get('name') and evaluation_result['name'] != 'Unknown':
+        patient.name = evaluation_result['name']
+
+    # 2. Find or Create CallLog
+    call_log = lookups.call_logs.get(call_id)
+    was_booked = usage.is_booked(call_log) if call_log else False
+    if not call_log:
+        call_log = CallLog(
+            call_id=call_id,
+            phone_number=phone_number,
+            status=call_data.get('status', 'completed'),
+            duration=call_data.get('duration', 0),
+            recording_url=call_data.get('recording_url'),
+            vad_engine=call_data.get('vad_engine'),
+            call_type='booking',  # reminder calls are logged when the scheduler places them
+            evaluation_result=evaluation_result,
+            created_at=usage.parse_created(call_data.get('created')) or datetime.utcnow()
+        )
+        db.session.add(call_log)
+        lookups.call_logs[call_id] = call_log
+    else:
+        call_log.status = call_data.get('status', 'completed')
+        call_log.duration = call_data.get('duration')
+        call_log.evaluation_result = evaluation_result
+        if call_data.get('recording_url'):
+            call_log.recording_url = call_data.get('recording_url')
+
+    # 3. Find or Create Appointment
+    appointment = lookups.appointments.get(call_log.appointment_id) if call_log.appointment_id else None
+    if not appointment:
+        appointment = Appointment(
+            patient_id=patient.id,
+            doctor_id=lookups.default_doctor().id,
+            appointment_date=date.today() + timedelta(days=1),  # Default tomorrow
+            appointment_time="10:00 AM",  # Default time
+            call_id=call_id,
+            status='pending'
+        )
+        db.session.add(appointment)
+        db.session.flush()
+        call_log.appointment_id = appointment.id
+        lookups.appointments[appointment.id] = appointment
+
+    # 4. Update Appointment from Evaluation
+    if evaluation_result.get('symptoms'):
+        appointment.symptoms = evaluation_result['symptoms']
+
+    if evaluation_result.get('specialty'):
+        matching_doctor = lookups.doctor_for_specialty(evaluation_result['specialty'])
+        if matching_doctor:
+            appointment.doctor = matching_doctor
+
+    if evaluation_result.get('time'):
+        appointment.appointment_time = evaluation_result['time']
+
+    booked = usage.is_booked(call_log)
+    usage.record_call_usage(call_log, call_data, booked, was_booked)
+
+    followups = []
+    if booked:
+        appointment.status = 'confirmed'
+        appointment.call_status = 'completed'
+
+        # Generate confirmation number if not exists
+        if not appointment.confirmation_number:
+            appointment.confirmation_number = f"APT-{appointment.id}-{secrets.token_hex(4).upper()}"
+
+    # Confirmations and follow-ups go out once per call: re-syncs (batch, webhook,
+    # reconciler) of an already booked call only refresh its rows
+    if booked and not was_booked:
+        # SMS + WhatsApp confirmation, sent by the outbox once this commits
+        outbox.enqueue_confirmation(patient.phone, {
+            'patient_name': patient.name,
+            'doctor_name': appointment.doctor.name,
+            'specialty': appointment.doctor.specialty,
+            'date': str(appointment.appointment_date),
+            'time': appointment.appointment_time,
+            'confirmation': appointment.confirmation_number
+        }, appointment.id)
+
+        # Schedule Follow-up Calls (1 hour and 2 hours later)
+        now = datetime.utcnow()
+        followups = [
+            FollowUpCall(appointment_id=appointment.id, scheduled_time=now + timedelta(hours=1),
+                         type='whatsapp', status='pending'),
+            FollowUpCall(appointment_id=appointment.id, scheduled_time=now + timedelta(hours=2),
+                         type='call', status='pending')
+        ]
+        db.session.add_all(followups)
+
+    result = {
+        'call_id': call_id,
+        'status': 'success',
+        'data': {
+            'patient_name': patient.name,
+            'doctor': appointment.doctor.name,
+            'specialty': appointment.doctor.specialty,
+            'symptoms': appointment.symptoms,
+            'status': appointment.status
+        }
+    }
+    return SyncOutcome(call_id, result, followups)
+
+def _apply_chunk(details: Dict[str, Dict[str, Any]]) -> List[SyncOutcome]:
+    """Apply and commit a chunk in one transaction (raises after rolling back)"""
+    try:
+        lookups = SyncLookups(details)
+        outcomes = [apply_call_result(call_id, data, lookups) for call_id, data in details.items()]
+        db.session.flush()  # assign follow-up ids before commit
+        outcomes = [o._replace(followups=[(f.id, f.scheduled_time) for f in o.followups]) for o in outcomes]
+        db.session.commit()
+        return outcomes
+    except Exception:
+        db.session.rollback()
+        raise
+
+def sync_call_details(details: Dict[Any, Dict[str, Any]], batch_size: int = BATCH_SIZE) -> SyncReport:
+    """
+    Apply fetched call details ({call_id: get_call_detail response}).
+
+    Returns:
+        SyncReport of per-call results (in input order) and
+        (followup_id, scheduled_time) pairs to announce
+    """
+    results = {}
+    fetched = {}
+    for call_id, detail in details.items():
+        call_id = str(call_id)
+        if not detail or detail.get('status') != 'success':
+            results[call_id] = {'call_id': call_id, 'status': 'error', 'message': 'Failed to fetch call details'}
+        else:
+            fetched[call_id] = detail['data']
+
+    followups = []
+    pending = list(fetched.items())
+    for start in range(0, len(pending), max(1, batch_size)):
+        chunk = dict(pending[start:start + batch_size])
+        try:
+            outcomes = _apply_chunk(chunk)
+        except Exception:
+            # Isolate the failing call(s): one transaction per call
+            outcomes = []
+            for call_id, data in chunk.items():
+                try:
+                    outcomes.extend(_apply_chunk({call_id: data}))
+                except Exception as e:
+                    results[call_id] = {'call_id': call_id, 'status': 'error', 'message': str(e)}
+        for outcome in outcomes:
+            results[outcome.call_id] = outcome.result
+            followups.extend(outcome.followups)
+
+    ordered = [results[str(call_id)] for call_id in details]
+    return SyncReport(ordered, followups)
+
+def parse_call_ids(payload: Dict[str, Any]) -> Tuple[List[int], Optional[str]]:
+    """
+    Read {"call_ids": [...]} and/or {"from_id": a, "to_id": b} (inclusive).
+    Returns (ids, error message or None); ids are de-duplicated in order.
+    """
+    call_ids = []
+    try:
+        call_ids.extend(int(c) for c in payload.get('call_ids') or [])
+        if payload.get('from_id') is not None or payload.get('to_id') is not None:
+            low, high = int(payload['from_id']), int(payload['to_id'])
+            if high < low:
+                return [], 'to_id must be >= from_id'
+            if high - low + 1 > MAX_IDS:
+                return [], f'At most {MAX_IDS} calls per request'
+            call_ids.extend(range(low, high + 1))
+    except (KeyError, TypeError, ValueError):
+        return [], 'call_ids must be integers; ranges need both from_id and to_id'
+    call_ids = list(dict.fromkeys(call_ids))
+    if not call_ids:
+        return [], 'call_ids or from_id/to_id required'
+    if len(call_ids) > MAX_IDS:
+        return [], f'At most {MAX_IDS} calls per request'
+    return call_ids, None
@@ -0,0 +1,164 @@
+"""
+Incrementally maintained dashboard counters
+
+Every flush that inserts, deletes or changes a Patient, Doctor or Appointment
+applies the matching deltas to the dashboard_counters table on the same
+connection, so counters commit (or roll back) together with the write that
+caused them. This covers register_patient, register_doctor, book_appointment,
+cancel_appointment and sync_call_results without touching each handler.
+
+Bulk Query.delete()/update() calls bypass the ORM and are not tracked;
+reconcile_counters() repairs any such drift.
+"""
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable
+from sqlalchemy import event, func, inspect
+from models import db, Doctor, Patient, Appointment, DashboardCounter
+
+DEFAULT_STATUS = 'scheduled'
+
+# Monotonic version counters: bumped explicitly, never recomputed by reconcile_counters()
+VERSION_COUNTERS = ('roster_version',)
+
+def status_key(status: str) -> str:
+    return f"status:{status or DEFAULT_STATUS}"
+
+def date_key(day: date) -> str:
+    return f"appointments_on:{day.isoformat()}"
+
+def _appointment_keys(appt) -> list:
+    keys = ['appointments', status_key(appt.status)]
+    if appt.appointment_date:
+        keys.append(date_key(appt.appointment_date))
+    return keys
+
+def _old_value(obj, attr):
+    """Pre-flush value of an attribute (loaded on set: Appointment maps status/date with active_history)"""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+def _collect_deltas(session) -> Counter:
+    deltas = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, Patient):
+            deltas['patients'] += 1
+        elif isinstance(obj, Doctor):
+            deltas['doctors'] += 1
+        elif isinstance(obj, Appointment):
+            for key in _appointment_keys(obj):
+                deltas[key] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            deltas['patients'] -= 1
+        elif isinstance(obj, Doctor):
+            deltas['doctors'] -= 1
+        elif isinstance(obj, Appointment):
+            for key in _appointment_keys(obj):
+                deltas[key] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Appointment):
+            continue
+        state = inspect(obj)
+        if state.attrs.status.history.has_changes():
+            deltas[status_key(_old_value(obj, 'status'))] -= 1
+            deltas[status_key(obj.status)] += 1
+        if state.attrs.appointment_date.history.has_changes():
+            old_date = _old_value(obj, 'appointment_date')
+            if old_date:
+                deltas[date_key(old_date)] -= 1
+            if obj.appointment_date:
+                deltas[date_key(obj.appointment_date)] += 1
+
+    return Counter({k: v for k, v in deltas.items() if v})
+
+def _upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT(name) DO UPDATE SET value = value + excluded.value"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = DashboardCounter.__table__
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'value': table.c.value + stmt.excluded.value}
+    )
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_counter_deltas(session, flush_context):
+    deltas = _collect_deltas(session)
+    if not deltas:
+        return
+    connection = session.connection()
+    connection.execute(
+        _upsert_statement(connection.dialect.name),
+        [{'name': name, 'value': delta} for name, delta in deltas.items()]
+    )
+
+def bump_counter(name: str, delta: int = 1):
+    """Add `delta` to a counter inside the current transaction (commits with the caller)"""
+    connection = db.session.connection()
+    connection.execute(_upsert_statement(connection.dialect.name), [{'name': name, 'value': delta}])
+
+def read_counters(names: Iterable[str]) -> Dict[str, int]:
+    """Read several counters in one primary-key lookup; missing counters are 0"""
+    names = list(names)
+    rows = db.session.query(DashboardCounter.name, DashboardCounter.value).filter(
+        DashboardCounter.name.in_(names)
+    ).all()
+    values = dict.fromkeys(names, 0)
+    values.update({name: value for name, value in rows})
+    return values
+
+def compute_counters() -> Dict[str, int]:
+    """Recompute every counter from the base tables (full scans - reconciliation only)"""
+    counts = {
+        'patients': db.session.query(func.count(Patient.id)).scalar(),
+        'doctors': db.session.query(func.count(Doctor.id)).scalar(),
+        'appointments': db.session.query(func.count(Appointment.id)).scalar(),
+    }
+    for status, total in db.session.query(Appointment.status, func.count(Appointment.id)).group_by(Appointment.status):
+        counts[status_key(status)] = counts.get(status_key(status), 0) + total
+    for day, total in db.session.query(Appointment.appointment_date, func.count(Appointment.id)).group_by(Appointment.appointment_date):
+        counts[date_key(day)] = total
+    return {name: value for name, value in counts.items() if value}
+
+def counters_empty() -> bool:
+    return db.session.query(DashboardCounter.name).first() is None
+
+def reconcile_counters() -> Dict[str, tuple]:
+    """
+    Rebuild the counters table from the base tables and report drift.
+
+    Must run inside an app context. The old rows are deleted first so that,
+    on SQLite, the write lock is held while the counts are taken and no
+    concurrent write can slip in between the count and the rewrite.
+
+    Returns {counter_name: (stored_value, actual_value)} for drifted counters.
+    """
+    try:
+        derived = ~DashboardCounter.name.in_(VERSION_COUNTERS)
+        stored = dict(db.session.query(DashboardCounter.name, DashboardCounter.value).filter(derived).all())
+        DashboardCounter.query.filter(derived).delete(synchronize_session=False)
+        actual = compute_counters()
+        db.session.add_all(DashboardCounter(name=name, value=value) for name, value in actual.items())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    drift = {}
+    for name in set(stored) | set(actual):
+        if stored.get(name, 0) != actual.get(name, 0):
+            drift[name] = (stored.get(name, 0), actual.get(name, 0))
+    if drift:
+        sample = dict(list(drift.items())[:10])
+        more = f" (+{len(drift) - len(sample)} more)" if len(drift) > len(sample) else ""
+        print(f"[Counters] Repaired {len(drift)} drifted counters: {sample}{more}")
+    return drift
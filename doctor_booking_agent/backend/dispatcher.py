@@ -0,0 +1,171 @@
+"""
+Concurrent follow-up dispatch with per-channel rate limiting
+
+Each channel (WhatsApp, voice) gets its own bounded job queue, worker
+threads and token bucket. A throttled channel only stalls its own workers:
+when Dinodial answers "Rate limit", the voice bucket is paused while
+WhatsApp reminders keep flowing. A full queue rejects new jobs
+(backpressure) and the scheduler requeues them for later.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token and return 0, or return the seconds to wait for the next one"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Drain the bucket and hand out nothing for `seconds` (upstream said we are throttled)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+class ChannelDispatcher:
+    """Bounded queue + worker pool + token bucket for one delivery channel"""
+
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, name: str, handler: Callable[[int, str], str], workers: int,
+                 rate: float, burst: int, max_queue: int):
+        self.name = name
+        self.handler = handler  # (followup_id, lease_token) -> 'completed' | 'failed' | 'rate_limited' | 'skipped'
+        self.bucket = TokenBucket(rate, burst)
+        self.on_rate_limited = None  # callback(followup_id), set by FollowUpDispatcher
+        self.rate_limit_backoff = 65.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._finished = deque()  # completion timestamps inside THROUGHPUT_WINDOW
+        self.counts = {'completed': 0, 'failed': 0, 'rate_limited': 0, 'skipped': 0, 'rejected': 0}
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'dispatch-{name}-{i}', daemon=True).start()
+
+    def submit(self, followup_id: int, lease_token: str = None) -> bool:
+        """Queue a job; False means the channel is saturated and the caller should retry later"""
+        with self._lock:
+            if followup_id in self._in_flight:
+                return True
+            try:
+                self._queue.put_nowait((followup_id, lease_token))
+            except queue.Full:
+                self.counts['rejected'] += 1
+                return False
+            self._in_flight.add(followup_id)
+            return True
+
+    def _work(self):
+        while True:
+            followup_id, lease_token = self._queue.get()
+            try:
+                self.bucket.acquire()
+                try:
+                    outcome = self.handler(followup_id, lease_token)
+                except Exception as e:
+                    print(f"[Dispatcher:{self.name}] Follow-up {followup_id} crashed: {e}")
+                    outcome = 'failed'
+                if outcome == 'rate_limited':
+                    self.bucket.pause(self.rate_limit_backoff)
+                    if self.on_rate_limited:
+                        self.on_rate_limited(followup_id)
+                with self._lock:
+                    self.counts[outcome] = self.counts.get(outcome, 0) + 1
+                    if outcome in ('completed', 'failed'):
+                        self._finished.append(time.monotonic())
+            finally:
+                with self._lock:
+                    self._in_flight.discard(followup_id)
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            cutoff = time.monotonic() - self.THROUGHPUT_WINDOW
+            while self._finished and self._finished[0] < cutoff:
+                self._finished.popleft()
+            return {
+                'queue_depth': self._queue.qsize(),
+                'in_flight': len(self._in_flight),
+                'throughput_per_min': len(self._finished) * 60.0 / self.THROUGHPUT_WINDOW,
+                **self.counts
+            }
+
+class FollowUpDispatcher:
+    """Routes follow-up ids to the channel that delivers them"""
+
+    def __init__(self, handler: Callable[[int, str], str], on_rate_limited: Callable[[int], None] = None,
+                 rate_limit_backoff: float = 65.0):
+        max_queue = int(os.getenv('FOLLOWUP_QUEUE_SIZE', 100))
+        self.channels = {
+            'whatsapp': ChannelDispatcher(
+                'whatsapp', handler,
+                workers=int(os.getenv('FOLLOWUP_WHATSAPP_WORKERS', 4)),
+                rate=_env_float('FOLLOWUP_WHATSAPP_RATE', 1.0),
+                burst=int(os.getenv('FOLLOWUP_WHATSAPP_BURST', 5)),
+                max_queue=max_queue),
+            'call': ChannelDispatcher(
+                'voice', handler,
+                workers=int(os.getenv('FOLLOWUP_VOICE_WORKERS', 2)),
+                rate=_env_float('FOLLOWUP_VOICE_RATE', 0.5),
+                burst=int(os.getenv('FOLLOWUP_VOICE_BURST', 1)),
+                max_queue=max_queue),
+        }
+        for channel in self.channels.values():
+            channel.on_rate_limited = on_rate_limited
+            channel.rate_limit_backoff = rate_limit_backoff
+
+    def submit(self, followup_id: int, followup_type: str, lease_token: str = None) -> bool:
+        channel = self.channels.get(followup_type or 'call')
+        if channel is None:
+            # Unknown types are failed by the handler; any worker pool can do that
+            channel = self.channels['whatsapp']
+        return channel.submit(followup_id, lease_token)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {channel.name: channel.stats() for channel in self.channels.values()}
+
+    def format_stats(self) -> str:
+        parts = []
+        for name, s in self.stats().items():
+            parts.append(f"{name}: depth={s['queue_depth']} in_flight={s['in_flight']} "
+                         f"done={s['completed']} failed={s['failed']} throttled={s['rate_limited']} "
+                         f"rejected={s['rejected']} rate={s['throughput_per_min']:.1f}/min")
+        return " | ".join(parts)
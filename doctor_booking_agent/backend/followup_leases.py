@@ -0,0 +1,113 @@
+"""
+Lease-based claiming of FollowUpCall jobs
+
+Any number of scheduler processes (on one or many nodes) can share the
+follow_up_calls table. A worker claims due rows with one conditional UPDATE
+that stamps them with a unique claim token and a lease expiry; rows whose
+lease is still live are invisible to everyone else. Results are written back
+only while the worker still holds the claim, and leases that expire (a
+crashed worker) make the row claimable again automatically.
+
+A lease only counts while it is live: finish() and defer() match the token
+*and* an unexpired lease_expires_at, so a worker whose job outlived its
+lease (queued, throttled or stuck in a slow send) cannot record over the
+worker that re-claimed the row. Workers renew() the lease when they pick a
+job off the dispatcher queue, just before the outbound send.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, or_, select, update
+from models import db, FollowUpCall
+
+WORKER_ID = os.getenv('SCHEDULER_WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.getenv('FOLLOWUP_LEASE_SECONDS', 300))
+CLAIM_BATCH = int(os.getenv('FOLLOWUP_CLAIM_BATCH', 50))
+
+def _claimable(now):
+    return and_(
+        FollowUpCall.status == 'pending',
+        FollowUpCall.scheduled_time <= now,
+        or_(FollowUpCall.lease_expires_at.is_(None), FollowUpCall.lease_expires_at <= now)
+    )
+
+def claim_due(followup_ids: Optional[List[int]] = None, limit: int = CLAIM_BATCH,
+              worker_id: str = WORKER_ID) -> Tuple[str, list]:
+    """
+    Atomically lease up to `limit` due follow-ups (optionally only `followup_ids`).
+    Returns (claim_token, [(id, type), ...]) for the rows this call won.
+    """
+    now = datetime.utcnow()
+    token = f"{worker_id}#{uuid.uuid4().hex[:12]}"
+
+    candidates = select(FollowUpCall.id).where(_claimable(now))
+    if followup_ids is not None:
+        candidates = candidates.where(FollowUpCall.id.in_(followup_ids))
+    candidates = candidates.order_by(FollowUpCall.scheduled_time).limit(limit)
+
+    # The claimable condition is repeated on the outer UPDATE so a row leased by a
+    # concurrent worker between the sub-select and the write is left alone
+    db.session.execute(
+        update(FollowUpCall)
+        .where(FollowUpCall.id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(claimed_by=token, lease_expires_at=now + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    claimed = db.session.query(FollowUpCall.id, FollowUpCall.type).filter(
+        FollowUpCall.claimed_by == token
+    ).order_by(FollowUpCall.scheduled_time).all()
+    return token, claimed
+
+def holds_lease(token: str, now):
+    """Rows `token` claimed whose lease has not expired yet"""
+    return and_(FollowUpCall.claimed_by == token, FollowUpCall.lease_expires_at > now)
+
+def _write_under_lease(followup_id: int, token: str, values: dict) -> bool:
+    """
+    Apply `values` and commit the session's pending rows only if `token` still
+    holds a live lease; otherwise roll everything back (CallLog/outbox rows
+    included) so the worker that re-claimed the row is the only one recorded.
+    """
+    result = db.session.execute(
+        update(FollowUpCall)
+        .where(FollowUpCall.id == followup_id, holds_lease(token, datetime.utcnow()))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+def renew(followup_id: int, token: str, seconds: float = LEASE_SECONDS) -> bool:
+    """Extend a live lease by `seconds` from now (call right before the outbound send)"""
+    return _write_under_lease(followup_id, token,
+                              {'lease_expires_at': datetime.utcnow() + timedelta(seconds=seconds)})
+
+def finish(followup_id: int, token: str, status: str) -> bool:
+    """Record a final status, but only if `token` still holds a live lease"""
+    if not _write_under_lease(followup_id, token, {'status': status, 'lease_expires_at': None}):
+        print(f"[Lease] Lost lease on follow-up {followup_id} before recording '{status}'")
+        return False
+    return True
+
+def defer(followup_id: int, token: str, seconds: float) -> bool:
+    """Keep the row pending but hidden from every worker for `seconds` (e.g. rate limited)"""
+    return _write_under_lease(followup_id, token,
+                              {'lease_expires_at': datetime.utcnow() + timedelta(seconds=seconds)})
+
+def release(followup_id: int, token: str) -> bool:
+    """Give up a lease without doing the work so any worker can claim the row now"""
+    result = db.session.execute(
+        update(FollowUpCall)
+        .where(FollowUpCall.id == followup_id, FollowUpCall.claimed_by == token)
+        .values(claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
@@ -0,0 +1,119 @@
+"""
+In-memory due queue for follow-up jobs
+
+The scheduler keeps every pending FollowUpCall as a (scheduled_time, id)
+entry in a min-heap and sleeps exactly until the earliest deadline instead
+of polling the database every minute. New follow-ups created by the API
+process (sync_call_results) are announced with a small UDP datagram to the
+scheduler's wake port, which pushes them onto the heap and wakes the loop
+early if they are due sooner than anything already queued.
+"""
+import heapq
+import json
+import os
+import socket
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+WAKE_HOST = os.getenv('SCHEDULER_WAKE_HOST', '127.0.0.1')
+WAKE_PORT = int(os.getenv('SCHEDULER_WAKE_PORT', 5056))  # 0 disables wake-ups
+
+class DueQueue:
+    """Min-heap of follow-up deadlines with an interruptible wait"""
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}  # followup_id -> current deadline (older heap entries are stale)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._deadlines)
+
+    def push(self, followup_id: int, when: datetime):
+        """Queue (or reschedule) a follow-up; wakes the waiter if it is the new earliest"""
+        with self._cond:
+            if self._deadlines.get(followup_id) == when:
+                return
+            self._deadlines[followup_id] = when
+            heapq.heappush(self._heap, (when, followup_id))
+            if self._heap[0] == (when, followup_id):
+                self._cond.notify_all()
+
+    def discard(self, followup_id: int):
+        with self._cond:
+            self._deadlines.pop(followup_id, None)
+
+    def next_deadline(self) -> Optional[datetime]:
+        with self._cond:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, followup_id = heapq.heappop(self._heap)
+            del self._deadlines[followup_id]
+            due.append(followup_id)
+            self._drop_stale()
+        return due
+
+    def wait_due(self, max_wait: float) -> List[int]:
+        """
+        Block until the earliest deadline passes, an earlier job is pushed or
+        max_wait seconds elapse. Returns the ids that are due (possibly none).
+        """
+        with self._cond:
+            due = self._pop_due(datetime.utcnow())
+            if due:
+                return due
+            self._drop_stale()
+            timeout = max_wait
+            if self._heap:
+                until_next = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                timeout = max(0.0, min(timeout, until_next))
+            self._cond.wait(timeout)
+            return self._pop_due(datetime.utcnow())
+
+def notify_scheduler(entries: Iterable[Tuple[int, datetime]]):
+    """Tell a running scheduler about new follow-ups (best effort, never raises)"""
+    if not WAKE_PORT:
+        return
+    payload = [[followup_id, when.isoformat()] for followup_id, when in entries]
+    if not payload:
+        return
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps(payload).encode('utf-8'), (WAKE_HOST, WAKE_PORT))
+    except OSError as e:
+        print(f"[Scheduler] Wake-up notification failed: {e}")
+
+def start_wake_listener(queue: DueQueue, host: str = WAKE_HOST, port: int = WAKE_PORT) -> bool:
+    """Receive notify_scheduler() datagrams on a daemon thread and push them onto the queue"""
+    if not port:
+        return False
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind((host, port))
+    except OSError as e:
+        print(f"[Scheduler] Wake port {host}:{port} unavailable ({e}); relying on periodic resync")
+        sock.close()
+        return False
+
+    def listen():
+        while True:
+            data, _ = sock.recvfrom(65535)
+            try:
+                for followup_id, when in json.loads(data.decode('utf-8')):
+                    queue.push(int(followup_id), datetime.fromisoformat(when))
+            except (ValueError, TypeError) as e:
+                print(f"[Scheduler] Ignoring malformed wake-up message: {e}")
+
+    threading.Thread(target=listen, name='scheduler-wake-listener', daemon=True).start()
+    return True
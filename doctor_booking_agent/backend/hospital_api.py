@@ -2,134 +2,100 @@
 Complete Hospital Booking Management System API
 Patient Portal + Doctor Dashboard + Admin Panel
 """
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, send_file
 from flask_cors import CORS
 from flask_compress import Compress
 from models import db, Doctor, Patient, Appointment, CallLog, DoctorAvailability, FollowUpCall
+from migrations import migrate
+import storage
+import metrics
+from counters import read_counters, counters_empty, reconcile_counters, status_key, date_key
+from availability_index import availability_index, parse_time_slot, MINUTES_PER_DAY
+from reservations import reservations
+from followup_queue import notify_scheduler
+import call_sync
+import webhook_queue
+import outbox
+import usage
 import sys
 import os
 # Add agent directory to path to allow importing src.agent
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agent')))
 from src.agent import DoctorBookingAgent
+from src.prompts import compaction_stats, template_stats
+from roster_cache import roster_cache
+from recording_cache import RecordingCache, RecordingUnavailable, recording_url_of
 from datetime import datetime, date, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
-from twilio.rest import Client
+from sqlalchemy import and_, or_
 import os
 import secrets
+import base64
+import time
 
 app = Flask(__name__)
 CORS(app)
 Compress(app)  # Enable gzip compression for faster response times
 
-# Database configuration with performance optimizations
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_booking.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 10,
-    'pool_recycle': 3600,
-    'pool_pre_ping': True,
-    'max_overflow': 20
-}
 app.config['SECRET_KEY'] = secrets.token_hex(16)
 app.config['JSON_SORT_KEYS'] = False  # Faster JSON serialization
 
-db.init_app(app)
+# SQLite (WAL + read-only pool for GETs) or Postgres, chosen by environment - see storage.py
+storage.init_app(app, db)
+
+# Route latency, SQL per request and slow-request logs - see metrics.py
+metrics.init_app(app, db)
+metrics.register_gauge('webhook_events', 'Queued call-completed webhooks by status', ('status',),
+                       lambda: {(status,): count for status, count in webhook_queue.queue_depth().items()})
 
 # Initialize agent
 agent = DoctorBookingAgent()
+agent.client.latency.listeners.append(metrics.outbound_listener('dinodial'))
+metrics.register_gauge('dinodial_request_window_ms',
+                       f'Dinodial latency per endpoint: p50/p95 over the last {agent.client.latency.window} '
+                       f'requests, avg/max since start',
+                       ('endpoint', 'stat'),
+                       lambda: {(endpoint, stat): value
+                                for endpoint, stats in agent.client.latency_stats().items()
+                                for stat, value in stats.items() if stat.endswith('_ms')})
+metrics.register_gauge('prompt_template_cache_total', 'Prompt template cache lookups by result', ('result',),
+                       lambda: {(result,): count for result, count in template_stats().items()}, kind='counter')
+metrics.register_gauge('booking_prompt_compaction_total',
+                       'Booking-prompt compaction totals (tokens are len/PROMPT_CHARS_PER_TOKEN estimates)',
+                       ('field',), lambda: {(field,): value for field, value in compaction_stats().items()},
+                       kind='counter')
 
-# SMS Confirmation Helper
-def send_sms_confirmation(phone, appointment_data):
-    """Send SMS confirmation (mock implementation - integrate with Twilio/SMS service)"""
-    message = f"""Appointment Confirmed!
-
-Patient: {appointment_data['patient_name']}
-Doctor: {appointment_data['doctor_name']} ({appointment_data['specialty']})
-Date: {appointment_data['date']}
-Time: {appointment_data['time']}
-Confirmation: {appointment_data['confirmation']}
-
-Arrive 10 min early. Call to reschedule.
-- Hospital Booking System"""
-    
-    # TODO: Integrate with SMS gateway (Twilio, Nexmo, etc.)
-    print(f"[SMS] Sending to {phone}:")
-    print(message)
-    return True
-
-# WhatsApp Confirmation Helper
-def send_whatsapp_confirmation(phone, appointment_data):
-    """Send WhatsApp confirmation via Twilio"""
-    
-    # Twilio Credentials
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    
-    message_body = f"""*Appointment Confirmed!* ✅
-
-👤 *Patient:* {appointment_data['patient_name']}
-👨‍⚕️ *Doctor:* {appointment_data['doctor_name']} ({appointment_data['specialty']})
-📅 *Date:* {appointment_data['date']}
-⏰ *Time:* {appointment_data['time']}
-🔖 *ID:* {appointment_data['confirmation']}
+# Recordings are fetched from Dinodial once, then served from local disk
+recordings = RecordingCache(lambda call_id: recording_url_of(agent.get_call_recording(call_id)))
 
-Please arrive 10 min early.
-Reply to this message to reschedule."""
+# Keyset pagination helpers
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
-    print(f"\n[WhatsApp] Sending to {phone}...")
-    
+def get_page_size():
+    """Read the ?limit= page size, clamped to [1, MAX_PAGE_SIZE]"""
     try:
-        client = Client(account_sid, auth_token)
-        
-        # FOR TESTING: Override recipient to verified number
-        # Ensure phone number has country code (defaulting to +91 if missing for India)
-        # to_number = phone if phone.startswith('+') else f"+91{phone}"
-        to_number = "+919970208412" # Hardcoded for testing
-        
-        message = client.messages.create(
-            from_='whatsapp:+14155238886',  # Twilio Sandbox Number
-            body=message_body,
-            to=f'whatsapp:{to_number}'
-        )
-        print(f"[WhatsApp] Sent successfully to {to_number}! SID: {message.sid}")
-        return True
-    except Exception as e:
-        print(f"[WhatsApp] Failed to send: {str(e)}")
-        return False
-
-def send_whatsapp_reminder(phone, appointment_data):
-    """Send WhatsApp reminder via Twilio"""
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    
-    message_body = f"""*Appointment Reminder* 🔔
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
-Hi {appointment_data['patient_name']},
-This is a reminder for your appointment with *{appointment_data['doctor_name']}* ({appointment_data['specialty']}).
+def encode_cursor(sort_value, row_id):
+    """Encode the (sort column, id) of the last row into an opaque cursor"""
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
 
-📅 *Date:* {appointment_data['date']}
-⏰ *Time:* {appointment_data['time']}
+def decode_cursor(cursor):
+    """Decode a cursor back into its (sort value string, id) pair"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    sort_value, row_id = base64.urlsafe_b64decode(padded).decode('utf-8').rsplit('|', 1)
+    return sort_value, int(row_id)
 
-Please reply if you need to reschedule.
-"""
-    print(f"\n[WhatsApp Reminder] Sending to {phone}...")
-    try:
-        client = Client(account_sid, auth_token)
-        to_number = "+919970208412" # Hardcoded for testing
-        message = client.messages.create(
-            from_='whatsapp:+14155238886',
-            body=message_body,
-            to=f'whatsapp:{to_number}'
-        )
-        print(f"[WhatsApp] Sent successfully! SID: {message.sid}")
-        return True
-    except Exception as e:
-        print(f"[WhatsApp] Failed to send: {str(e)}")
-        return False
-
-# Create tables
+# Create tables and apply pending schema migrations
 with app.app_context():
-    db.create_all()
+    migrate()
+    if counters_empty():
+        reconcile_counters()
     print("[OK] Database initialized")
 
 # ==================== PATIENT ENDPOINTS ====================
@@ -224,7 +190,9 @@ def register_doctor():
         )
         
         db.session.add(doctor)
+        roster_cache.bump()
         db.session.commit()
+        availability_index.set_doctor(doctor.id, doctor.specialty, doctor.is_available)
         
         return jsonify({
             'status': 'success',
@@ -315,17 +283,10 @@ def initiate_booking_call():
         if not phone:
             return jsonify({'status': 'error', 'message': 'Phone number required'}), 400
 
-        # Fetch active doctors for the roster
-        active_doctors = Doctor.query.filter_by(is_available=True).all()
-        roster = []
-        for doc in active_doctors:
-            roster.append({
-                'name': doc.name,
-                'specialty': doc.specialty,
-                'slots': doc.available_time or '9am-5pm'
-            })
+        # Active-doctor roster (cached list + pre-rendered XML)
+        roster = roster_cache.snapshot()
 
-        response = agent.create_booking_call(phone, doctor_info, roster)
+        response = agent.create_booking_call(phone, doctor_info, roster.roster, roster.xml)
         return jsonify(response)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -364,16 +325,30 @@ def book_appointment():
             db.session.flush()
         
         # Create appointment
-        confirmation_num = f"APT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Random suffix keeps concurrent bookings within the same second unique
+        confirmation_num = f"APT-{datetime.now().strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(2).upper()}"
         
         # Parse date and time (with defaults)
         appointment_date = data.get('appointment_date') or data.get('date') or datetime.now().strftime('%Y-%m-%d')
         appointment_time = data.get('appointment_time') or data.get('time') or '10:00 AM'
+        parsed_date = datetime.strptime(appointment_date, '%Y-%m-%d').date()
+        
+        # Claim the matching availability slot (if the doctor published one) in this transaction
+        slot = reservations.find_slot(doctor.id, parsed_date, appointment_time)
+        reservation = reservations.reserve(slot.id) if slot else None
+        if reservation and not reservation.ok:
+            db.session.rollback()
+            return jsonify({
+                'error': reservation.reason,
+                'conflict': True,
+                'slot_id': reservation.slot_id
+            }), 409
         
         appointment = Appointment(
             patient_id=patient.id,
             doctor_id=doctor.id,
-            appointment_date=datetime.strptime(appointment_date, '%Y-%m-%d').date(),
+            slot_id=reservation.slot_id if reservation else None,
+            appointment_date=parsed_date,
             appointment_time=appointment_time,
             reason=data.get('reason'),
             symptoms=data.get('symptoms'),
@@ -384,6 +359,8 @@ def book_appointment():
         
         db.session.add(appointment)
         db.session.commit()
+        if reservation and reservation.slot_full:
+            availability_index.remove_slot(reservation.slot_id)
         
         # Initiate voice call
         doctor_info = {
@@ -394,17 +371,10 @@ def book_appointment():
             'time': appointment_time
         }
         
-        # Fetch active doctors for the roster
-        active_doctors = Doctor.query.filter_by(is_available=True).all()
-        roster = []
-        for doc in active_doctors:
-            roster.append({
-                'name': doc.name,
-                'specialty': doc.specialty,
-                'slots': doc.available_time or '9am-5pm'
-            })
+        # Active-doctor roster (cached list + pre-rendered XML)
+        roster = roster_cache.snapshot()
 
-        call_response = agent.create_booking_call(phone, doctor_info, roster)
+        call_response = agent.create_booking_call(phone, doctor_info, roster.roster, roster.xml)
         
         # Log the call
         if call_response.get('status') == 'success':
@@ -412,24 +382,26 @@ def book_appointment():
                 call_id=str(call_response['data'].get('id')),
                 phone_number=phone,
                 appointment_id=appointment.id,
-                status='in_progress'
+                status='in_progress',
+                vad_engine=call_response.get('vad_engine'),
+                call_type='booking'
             )
             db.session.add(call_log)
             
             appointment.call_id = str(call_response['data'].get('id'))
             appointment.call_status = 'initiated'
             
-            db.session.commit()
-            
-            # Send SMS confirmation (simulated - implement with Twilio/SMS gateway)
-            send_sms_confirmation(patient.phone, {
+            # SMS confirmation goes out via the outbox once this commits
+            outbox.enqueue_confirmation(patient.phone, {
                 'patient_name': patient.name,
                 'doctor_name': doctor.name,
                 'specialty': doctor.specialty,
                 'date': appointment_date,
                 'time': appointment_time,
                 'confirmation': confirmation_num
-            })
+            }, appointment.id, channels=('sms',))
+            
+            db.session.commit()
         
         return jsonify({
             'appointment_id': appointment.id,
@@ -479,39 +451,80 @@ def get_appointment(appointment_id):
 
 @app.route('/api/appointments', methods=['GET'])
 def get_appointments():
-    """Get all appointments with filters"""
+    """Get appointments with filters, newest first, keyset-paginated on (appointment_date, id)"""
     status = request.args.get('status')
     date_str = request.args.get('date')
+    cursor = request.args.get('cursor')
+    limit = get_page_size()
     
-    query = Appointment.query
+    # Single joined column projection - no per-row lazy loads of patient/doctor
+    query = (db.session.query(
+                Appointment.id,
+                Patient.name.label('patient_name'),
+                Doctor.name.label('doctor_name'),
+                Appointment.appointment_date,
+                Appointment.appointment_time,
+                Appointment.status,
+                Appointment.confirmation_number)
+             .join(Patient, Appointment.patient_id == Patient.id)
+             .join(Doctor, Appointment.doctor_id == Doctor.id))
     
     if status:
-        query = query.filter_by(status=status)
+        query = query.filter(Appointment.status == status)
     if date_str:
         target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        query = query.filter_by(appointment_date=target_date)
+        query = query.filter(Appointment.appointment_date == target_date)
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            cursor_date = date.fromisoformat(cursor_date)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'status': 'error', 'data': {'message': 'Invalid cursor'}}), 400
+        query = query.filter(or_(
+            Appointment.appointment_date < cursor_date,
+            and_(Appointment.appointment_date == cursor_date, Appointment.id < cursor_id)
+        ))
+    
+    rows = (query.order_by(Appointment.appointment_date.desc(), Appointment.id.desc())
+            .limit(limit + 1)
+            .all())
     
-    appointments = query.order_by(Appointment.appointment_date.desc()).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].appointment_date, rows[-1].id)
     
     return jsonify({
         'status': 'success',
         'data': [{
             'id': a.id,
-            'patient_name': a.patient.name,
-            'doctor_name': a.doctor.name,
+            'patient_name': a.patient_name,
+            'doctor_name': a.doctor_name,
             'date': a.appointment_date.isoformat(),
             'time': a.appointment_time,
             'status': a.status,
             'confirmation_number': a.confirmation_number
-        } for a in appointments]
+        } for a in rows],
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/appointment/<int:appointment_id>/cancel', methods=['POST'])
 def cancel_appointment(appointment_id):
-    """Cancel an appointment"""
+    """Cancel an appointment and release its availability slot"""
     appointment = Appointment.query.get_or_404(appointment_id)
+    
+    # Only the place this appointment reserved is given back; appointments booked
+    # before slot_id existed (or without a published slot) hold none
+    slot = None
+    if appointment.status != 'cancelled' and appointment.slot_id:
+        if reservations.release(appointment.slot_id):
+            slot = db.session.get(DoctorAvailability, appointment.slot_id)
+        appointment.slot_id = None
+    
     appointment.status = 'cancelled'
     db.session.commit()
+    if slot:
+        availability_index.add_slot(slot.id, slot.doctor_id, slot.date, slot.time_slot)
     
     return jsonify({
         'status': 'success',
@@ -522,8 +535,38 @@ def cancel_appointment(appointment_id):
 
 @app.route('/api/calls', methods=['GET'])
 def get_calls():
-    """Get all call logs"""
-    calls = CallLog.query.order_by(CallLog.created_at.desc()).all()
+    """Get call logs, newest first, keyset-paginated on (created_at, id)"""
+    cursor = request.args.get('cursor')
+    limit = get_page_size()
+    
+    # Project only the listed columns - prompt_used/evaluation_result are never loaded
+    query = db.session.query(
+        CallLog.id,
+        CallLog.call_id,
+        CallLog.phone_number,
+        CallLog.status,
+        CallLog.duration,
+        CallLog.created_at)
+    
+    if cursor:
+        try:
+            cursor_created, cursor_id = decode_cursor(cursor)
+            cursor_created = datetime.fromisoformat(cursor_created)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'status': 'error', 'data': {'message': 'Invalid cursor'}}), 400
+        query = query.filter(or_(
+            CallLog.created_at < cursor_created,
+            and_(CallLog.created_at == cursor_created, CallLog.id < cursor_id)
+        ))
+    
+    rows = (query.order_by(CallLog.created_at.desc(), CallLog.id.desc())
+            .limit(limit + 1)
+            .all())
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
     
     return jsonify({
         'status': 'success',
@@ -534,41 +577,77 @@ def get_calls():
             'status': c.status,
             'duration': c.duration,
             'created_at': c.created_at.isoformat() if c.created_at else None
-        } for c in calls]
+        } for c in rows],
+        'next_cursor': next_cursor
     })
 
+@app.route('/api/call/<int:call_id>/recording', methods=['GET'])
+def get_call_recording(call_id):
+    """Stream a call recording from the local cache (supports Range requests)"""
+    for _ in range(2):
+        try:
+            recording = recordings.get(call_id)
+            return send_file(
+                recording.path,
+                mimetype=recording.content_type,
+                conditional=True,  # Range / If-None-Match -> 206 / 304
+                etag=recording.sha256,
+                max_age=86400,
+                download_name=f'recording_{call_id}.mp3'
+            )
+        except FileNotFoundError:
+            continue  # evicted between lookup and open - fetch again
+        except RecordingUnavailable as e:
+            return jsonify({'error': str(e)}), e.http_status
+    return jsonify({'error': 'Recording unavailable'}), 503
+
 # ==================== DASHBOARD STATS ====================
 
 @app.route('/api/stats/dashboard', methods=['GET'])
 def get_dashboard_stats():
-    """Get dashboard statistics"""
-    total_patients = Patient.query.count()
-    total_doctors = Doctor.query.count()
-    total_appointments = Appointment.query.count()
-    
-    today = date.today()
-    today_appointments = Appointment.query.filter_by(appointment_date=today).count()
-    
-    pending_appointments = Appointment.query.filter_by(status='scheduled').count()
-    completed_appointments = Appointment.query.filter_by(status='completed').count()
+    """Get dashboard statistics from the pre-aggregated counters table"""
+    today_key = date_key(date.today())
+    counters = read_counters([
+        'patients', 'doctors', 'appointments', today_key,
+        status_key('scheduled'), status_key('completed')
+    ])
     
     return jsonify({
         'status': 'success',
         'data': {
-            'total_patients': total_patients,
-            'total_doctors': total_doctors,
-            'total_appointments': total_appointments,
-            'today_appointments': today_appointments,
-            'pending_appointments': pending_appointments,
-            'completed_appointments': completed_appointments
+            'total_patients': counters['patients'],
+            'total_doctors': counters['doctors'],
+            'total_appointments': counters['appointments'],
+            'today_appointments': counters[today_key],
+            'pending_appointments': counters[status_key('scheduled')],
+            'completed_appointments': counters[status_key('completed')]
         }
     })
 
+@app.route('/api/stats/usage', methods=['GET'])
+def get_usage_stats():
+    """Call token usage and cost per day, call type and booked appointment, from the daily buckets"""
+    try:
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else date.today()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') \
+            else end - timedelta(days=request.args.get('days', 30, type=int) - 1)
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+    if start > end:
+        return jsonify({'error': 'from must not be after to'}), 400
+    
+    return jsonify({'status': 'success', 'data': usage.usage_rollup(start, end)})
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check"""
     return jsonify({'status': 'healthy', 'service': 'Hospital Management System'}), 200
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (request latency, SQL per request, outbound API latency)"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # ==================== DOCTOR AUTHENTICATION ====================
 
 @app.route('/api/doctor/login', methods=['POST'])
@@ -646,7 +725,8 @@ def get_doctor_availability(doctor_id):
                 'date': slot.date.isoformat(),
                 'time_slot': slot.time_slot,
                 'is_booked': slot.is_booked,
-                'max_patients': slot.max_patients
+                'max_patients': slot.max_patients,
+                'booked_count': slot.booked_count
             } for slot in slots]
         }), 200
         
@@ -664,6 +744,7 @@ def add_doctor_availability(doctor_id):
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         
         added_slots = []
+        new_slots = []
         for time_slot in time_slots:
             # Check if slot already exists
             existing = DoctorAvailability.query.filter_by(
@@ -681,8 +762,15 @@ def add_doctor_availability(doctor_id):
                 )
                 db.session.add(slot)
                 added_slots.append(time_slot)
+                new_slots.append(slot)
         
+        db.session.flush()
+        indexed = [(slot.id, slot.time_slot) for slot in new_slots]
+        if new_slots:
+            roster_cache.bump()
         db.session.commit()
+        for slot_id, time_slot in indexed:
+            availability_index.add_slot(slot_id, doctor_id, appointment_date, time_slot)
         
         return jsonify({
             'success': True,
@@ -702,11 +790,13 @@ def delete_availability_slot(doctor_id, slot_id):
         if not slot:
             return jsonify({'error': 'Slot not found'}), 404
         
-        if slot.is_booked:
+        if slot.is_booked or slot.booked_count:
             return jsonify({'error': 'Cannot delete booked slot'}), 400
         
         db.session.delete(slot)
+        roster_cache.bump()
         db.session.commit()
+        availability_index.remove_slot(slot_id)
         
         return jsonify({'success': True, 'message': 'Slot deleted'}), 200
         
@@ -720,7 +810,9 @@ def toggle_doctor_availability(doctor_id):
     try:
         doctor = Doctor.query.get_or_404(doctor_id)
         doctor.is_available = not doctor.is_available
+        roster_cache.bump()
         db.session.commit()
+        availability_index.set_doctor(doctor.id, doctor.specialty, doctor.is_available)
         
         return jsonify({
             'success': True,
@@ -734,6 +826,20 @@ def toggle_doctor_availability(doctor_id):
 
 # ==================== GET AVAILABLE DOCTORS FOR BOOKING ====================
 
+def parse_time_window():
+    """Read ?from_time=&to_time= (e.g. '9:00 AM', '14:30') as a minute-of-day window"""
+    bounds = []
+    for name, default in (('from_time', 0), ('to_time', MINUTES_PER_DAY - 1)):
+        value = request.args.get(name)
+        if not value:
+            bounds.append(default)
+            continue
+        minute = parse_time_slot(value)
+        if minute is None:
+            raise ValueError(f"Invalid {name}: {value}")
+        bounds.append(minute)
+    return bounds[0], bounds[1]
+
 @app.route('/api/doctors/available', methods=['GET'])
 def get_available_doctors():
     """Get currently available doctors with their next available slots"""
@@ -742,21 +848,21 @@ def get_available_doctors():
         date_str = request.args.get('date', date.today().isoformat())
         
         query_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        from_minute, to_minute = parse_time_window()
         
         query = Doctor.query.filter_by(is_available=True)
         if specialty:
             query = query.filter_by(specialty=specialty)
         
         doctors = query.all()
+        availability_index.ensure_fresh()
         
         result = []
         for doctor in doctors:
-            # Get available slots for this doctor
-            available_slots = DoctorAvailability.query.filter(
-                DoctorAvailability.doctor_id == doctor.id,
-                DoctorAvailability.date >= query_date,
-                DoctorAvailability.is_booked == False
-            ).order_by(DoctorAvailability.date, DoctorAvailability.time_slot).limit(5).all()
+            # Next free slots come from the in-memory index, ordered by real time of day
+            available_slots = availability_index.doctor_slots(
+                doctor.id, query_date, from_minute, to_minute, limit=5
+            )
             
             result.append({
                 'id': doctor.id,
@@ -775,11 +881,51 @@ def get_available_doctors():
             'doctors': result
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/slots/next', methods=['GET'])
+def get_next_free_slots():
+    """Next N free slots for a specialty on or after a date, within an optional time window"""
+    try:
+        specialty = request.args.get('specialty')
+        if not specialty:
+            return jsonify({'error': 'specialty required'}), 400
+        
+        date_str = request.args.get('date', date.today().isoformat())
+        query_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        from_minute, to_minute = parse_time_window()
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        
+        availability_index.ensure_fresh()
+        slots = availability_index.next_free_slots(specialty, query_date, from_minute, to_minute, limit)
+        
+        return jsonify({
+            'success': True,
+            'slots': [{
+                'slot_id': slot.slot_id,
+                'doctor_id': slot.doctor_id,
+                'date': slot.date.isoformat(),
+                'time': slot.time_slot
+            } for slot in slots]
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ==================== CALL RESULT SYNC ====================
 
+def run_call_sync(details):
+    """Apply fetched call details (confirmations are queued in the outbox), then wake the scheduler"""
+    report = call_sync.sync_call_details(details)
+    # Wake the scheduler so it can time these exactly instead of waiting for a resync
+    notify_scheduler(report.followups)
+    return report.results
+
 @app.route('/api/call/sync/<call_id>', methods=['POST'])
 def sync_call_results(call_id):
     """Sync call evaluation results with database"""
@@ -790,160 +936,94 @@ def sync_call_results(call_id):
         if call_detail.get('status') != 'success':
             return jsonify({'error': 'Failed to fetch call details'}), 400
         
-        call_data = call_detail['data']
+        result = run_call_sync({str(call_id): call_detail})[0]
+        if result['status'] != 'success':
+            return jsonify({'error': result['message']}), 500
         
-        # Extract evaluation result from nested structure if necessary
-        evaluation_result = call_data.get('evaluation_result', {})
-        if not evaluation_result and 'call_details' in call_data:
-            # Try to find it in callOutcomesData
-            evaluation_result = call_data['call_details'].get('callOutcomesData', {})
-            
-        phone_number = call_data.get('phone_number', 'Unknown')
+        return jsonify({
+            'status': 'success',
+            'message': 'Call results synced successfully',
+            'data': result['data']
+        }), 200
         
-        # 1. Find or Create Patient
-        patient = Patient.query.filter_by(phone=phone_number).first()
-        if not patient:
-            # Try to get name from evaluation, else use "Unknown"
-            patient_name = evaluation_result.get('name', 'New Patient')
-            patient = Patient(name=patient_name, phone=phone_number)
-            db.session.add(patient)
-            db.session.flush() # Get ID
-            
-        # Update patient name if we have a better one now
-        if evaluation_result.get('name') and evaluation_result['name'] != 'Unknown':
-            patient.name = evaluation_result['name']
-
-        # 2. Find or Create CallLog
-        call_log = CallLog.query.filter_by(call_id=str(call_id)).first()
-        if not call_log:
-            call_log = CallLog(
-                call_id=str(call_id),
-                phone_number=phone_number,
-                status=call_data.get('status', 'completed'),
-                duration=call_data.get('duration', 0),
-                recording_url=call_data.get('recording_url'),
-                evaluation_result=evaluation_result
-            )
-            db.session.add(call_log)
-        else:
-            call_log.status = call_data.get('status', 'completed')
-            call_log.duration = call_data.get('duration')
-            call_log.evaluation_result = evaluation_result
-            if call_data.get('recording_url'):
-                call_log.recording_url = call_data.get('recording_url')
-
-        # 3. Find or Create Appointment
-        # If call_log already had an appointment, use it. Otherwise create new.
-        appointment = None
-        if call_log.appointment_id:
-            appointment = db.session.get(Appointment, call_log.appointment_id)
-        
-        if not appointment:
-            # Default doctor (first available or specific one)
-            doctor = Doctor.query.first()
-            if not doctor:
-                # Create a dummy doctor if none exists
-                doctor = Doctor(name="Dr. Sharma", specialty="General Medicine", phone="0000000000")
-                db.session.add(doctor)
-                db.session.flush()
-            
-            appointment = Appointment(
-                patient_id=patient.id,
-                doctor_id=doctor.id,
-                appointment_date=date.today() + timedelta(days=1), # Default tomorrow
-                appointment_time="10:00 AM", # Default time
-                call_id=str(call_id),
-                status='pending'
-            )
-            db.session.add(appointment)
-            db.session.flush()
-            call_log.appointment_id = appointment.id
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-        # 4. Update Appointment from Evaluation
-        if evaluation_result.get('symptoms'):
-            appointment.symptoms = evaluation_result['symptoms']
-        
-        if evaluation_result.get('specialty'):
-            specialty = evaluation_result['specialty']
-            # Try to find a doctor with matching specialty
-            matching_doctor = Doctor.query.filter(Doctor.specialty.ilike(f"%{specialty}%")).first()
-            if matching_doctor:
-                appointment.doctor_id = matching_doctor.id
+@app.route('/api/call/sync', methods=['POST'])
+def sync_call_results_batch():
+    """
+    Sync many calls at once: {"call_ids": [...]} and/or {"from_id": a, "to_id": b}.
+    Details are fetched concurrently and applied in CALL_SYNC_BATCH_SIZE transactions.
+    """
+    try:
+        call_ids, error = call_sync.parse_call_ids(request.json or {})
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
         
-        if evaluation_result.get('time'):
-            appointment.appointment_time = evaluation_result['time']
-            
-        if evaluation_result.get('booked') == True:
-            appointment.status = 'confirmed'
-            appointment.call_status = 'completed'
-            
-            # Generate confirmation number if not exists
-            if not appointment.confirmation_number:
-                appointment.confirmation_number = f"APT-{appointment.id}-{secrets.token_hex(4).upper()}"
-
-            # Send SMS Confirmation
-            appointment_data = {
-                'patient_name': patient.name,
-                'doctor_name': appointment.doctor.name,
-                'specialty': appointment.doctor.specialty,
-                'date': str(appointment.appointment_date),
-                'time': appointment.appointment_time,
-                'confirmation': appointment.confirmation_number
-            }
-            send_sms_confirmation(patient.phone, appointment_data)
-            send_whatsapp_confirmation(patient.phone, appointment_data)
-            
-            # Schedule Follow-up Calls (1 hour and 2 hours later)
-            now = datetime.utcnow()
-            follow_up_1 = FollowUpCall(
-                appointment_id=appointment.id,
-                scheduled_time=now + timedelta(hours=1),
-                type='whatsapp',
-                status='pending'
-            )
-            follow_up_2 = FollowUpCall(
-                appointment_id=appointment.id,
-                scheduled_time=now + timedelta(hours=2),
-                type='call',
-                status='pending'
-            )
-            db.session.add(follow_up_1)
-            db.session.add(follow_up_2)
-
-        db.session.commit()
+        started = time.perf_counter()
+        details = agent.get_booking_statuses(call_ids)
+        fetched = time.perf_counter()
+        results = run_call_sync(details)
+        elapsed = time.perf_counter() - started
         
+        synced = sum(1 for r in results if r['status'] == 'success')
         return jsonify({
             'status': 'success',
-            'message': 'Call results synced successfully',
             'data': {
-                'patient_name': patient.name,
-                'doctor': appointment.doctor.name,
-                'specialty': appointment.doctor.specialty,
-                'symptoms': appointment.symptoms,
-                'status': appointment.status
+                'results': results,
+                'requested': len(call_ids),
+                'synced': synced,
+                'failed': len(results) - synced,
+                'fetch_ms': round((fetched - started) * 1000, 1),
+                'elapsed_ms': round(elapsed * 1000, 1),
+                'calls_per_second': round(len(call_ids) / elapsed, 1) if elapsed else None
             }
         }), 200
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/webhook/call-completed', methods=['POST'])
 def call_completed_webhook():
-    """Webhook endpoint for Dinodial to notify when call is completed"""
+    """
+    Webhook endpoint for Dinodial to notify when call is completed.
+    Only queues the event (deduplicated by call_id); the webhook_queue workers
+    in scheduler.py sync it, so queued events wait until a scheduler runs
+    (watch webhook_events{status="pending"} on /metrics).
+    """
     try:
-        data = request.json
+        data = request.json or {}
         call_id = data.get('call_id')
         
         if not call_id:
             return jsonify({'error': 'call_id required'}), 400
+        try:
+            call_id = str(int(call_id))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'call_id must be an integer'}), 400
         
-        # Sync the results
-        return sync_call_results(str(call_id))
+        queued = webhook_queue.enqueue(call_id, data)
+        return jsonify({'status': 'accepted', 'call_id': call_id, 'duplicate': not queued}), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/webhook/twilio-status', methods=['POST'])
+def twilio_status_webhook():
+    """Twilio message status callback (set OUTBOX_STATUS_CALLBACK_URL to this route)"""
+    # Twilio signs the exact URL it was given; behind a proxy request.url may differ from it
+    url = outbox.STATUS_CALLBACK_URL or request.url
+    if not outbox.valid_twilio_signature(url, request.form.to_dict(), request.headers.get('X-Twilio-Signature')):
+        return jsonify({'error': 'Invalid Twilio signature'}), 403
+    sid = request.values.get('MessageSid')
+    status = request.values.get('MessageStatus')
+    if not sid or not status:
+        return jsonify({'error': 'MessageSid and MessageStatus required'}), 400
+    outbox.record_delivery_status(sid, status)
+    return '', 204
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
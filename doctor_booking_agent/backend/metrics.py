@@ -0,0 +1,272 @@
+"""
+Per-request latency/SQL instrumentation and Prometheus exposition
+
+The only telemetry used to be print statements. init_app() now wires:
+
+  request hooks   http_request_duration_seconds{method,route,status}; the
+                  route is the URL rule ('/api/doctor/<int:doctor_id>'),
+                  never the raw path, so label cardinality stays bounded
+  engine events   before/after_cursor_execute on every bind time each SQL
+                  statement. Per request they feed
+                  http_request_sql_statements{route} and
+                  http_request_sql_duration_seconds{route}, so an N+1 loop
+                  shows up as a statement-count histogram creeping right.
+                  SQL time is execute time; fetching rows counts toward
+                  the request latency only.
+                  sql_statements_total{context} also counts background
+                  work (scheduler, workers).
+  outbound calls  outbound_request_duration_seconds{service,endpoint,ok}:
+                  Dinodial through LatencyStats.listeners (agent
+                  transport), Twilio through outbox.OutboxSender.
+  gauges          register_gauge() values read at scrape time: queue
+                  depths, Dinodial p50/p95 latency over the agent's
+                  rolling window (DinodialClient.latency_stats),
+                  and the agent's prompt template cache and
+                  booking-prompt compaction totals (kind='counter').
+
+render() produces the Prometheus text format served at /metrics. Requests
+slower than METRICS_SLOW_REQUEST_MS log their SQL statements with timings
+(at most METRICS_SLOW_SQL_LIMIT of them).
+
+Metrics live in process memory: with several server processes each
+exposes its own, and Prometheus sums them. The scheduler, which has no
+HTTP server, can expose its outbound and SQL metrics with serve() when
+SCHEDULER_METRICS_PORT is set.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, List, Tuple
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+SLOW_REQUEST_MS = float(os.getenv('METRICS_SLOW_REQUEST_MS', 500))
+SLOW_SQL_LIMIT = int(os.getenv('METRICS_SLOW_SQL_LIMIT', 50))  # statements kept per request for the slow log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OUTBOUND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, values)} {total}')
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((values, list(series)) for values, series in self._series.items())
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, values)} {series[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, values)} {cumulative}')
+        return lines
+
+class Gauge:
+    """
+    Value read from a callback at scrape time ({label values: value}); kind
+    'counter' exposes running totals kept elsewhere (e.g. in the agent)
+    """
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], collect: Callable[[], dict],
+                 kind: str = 'gauge'):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self.collect, self.kind = collect, kind
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"[Metrics] {self.name} unavailable: {e}")
+            return lines
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, label_values)} {value}')
+        return lines
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                            ('method', 'route', 'status'), LATENCY_BUCKETS)
+REQUEST_SQL_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements executed per HTTP request',
+                                   ('route',), STATEMENT_BUCKETS)
+REQUEST_SQL_TIME = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per HTTP request',
+                             ('route',), LATENCY_BUCKETS)
+SQL_STATEMENTS = Counter('sql_statements_total', 'SQL statements executed', ('context',))
+OUTBOUND_LATENCY = Histogram('outbound_request_duration_seconds', 'Latency of calls to external APIs',
+                             ('service', 'endpoint', 'ok'), OUTBOUND_BUCKETS)
+SLOW_REQUESTS = Counter('http_slow_requests_total', f'HTTP requests slower than {SLOW_REQUEST_MS:g} ms',
+                        ('route',))
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, REQUEST_SQL_TIME, SQL_STATEMENTS, OUTBOUND_LATENCY, SLOW_REQUESTS]
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+def register_gauge(name: str, help_text: str, labels: Tuple[str, ...], collect: Callable[[], dict],
+                   kind: str = 'gauge') -> Gauge:
+    """Add a scrape-time gauge (collect runs inside the scrape's app context)"""
+    for metric in REGISTRY:
+        if metric.name == name:
+            return metric
+    gauge = Gauge(name, help_text, labels, collect, kind)
+    REGISTRY.append(gauge)
+    return gauge
+
+def observe_outbound(service: str, endpoint: str, seconds: float, ok: bool = True):
+    OUTBOUND_LATENCY.observe(seconds, service, endpoint, 'true' if ok else 'false')
+
+def outbound_listener(service: str):
+    """A LatencyStats listener (endpoint, seconds, ok) that records into OUTBOUND_LATENCY"""
+    def listener(endpoint: str, seconds: float, ok: bool):
+        observe_outbound(service, endpoint, seconds, ok)
+    return listener
+
+# ==================== SQL ====================
+
+class RequestStats:
+    """SQL statements of the current request (kept on flask.g)"""
+    __slots__ = ('started', 'statements', 'sql_seconds', 'queries')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.queries = []  # (seconds, statement), first SLOW_SQL_LIMIT only
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    stats = g.get('_request_stats') if has_request_context() else None
+    if stats is None:
+        SQL_STATEMENTS.inc('background')
+        return
+    SQL_STATEMENTS.inc('request')
+    stats.statements += 1
+    stats.sql_seconds += elapsed
+    if len(stats.queries) < SLOW_SQL_LIMIT:
+        stats.queries.append((elapsed, statement))
+
+def instrument_engine(engine):
+    if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+# ==================== REQUESTS ====================
+
+def _before_request():
+    g._request_stats = RequestStats()
+
+def _after_request(response):
+    g._response_status = response.status_code
+    return response
+
+def _teardown_request(exc):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.pop('_response_status', 500)
+    REQUEST_LATENCY.observe(elapsed, request.method, route, status)
+    REQUEST_SQL_STATEMENTS.observe(stats.statements, route)
+    REQUEST_SQL_TIME.observe(stats.sql_seconds, route)
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(route)
+        log_slow_request(request.method, request.full_path.rstrip('?'), status, elapsed, stats)
+
+def log_slow_request(method: str, path: str, status: int, elapsed: float, stats: RequestStats):
+    print(f"[Metrics] Slow request {method} {path} -> {status} in {elapsed * 1000:.0f} ms, "
+          f"{stats.statements} SQL statements in {stats.sql_seconds * 1000:.0f} ms")
+    for seconds, statement in stats.queries:
+        print(f"    {seconds * 1000:8.1f} ms  {' '.join(statement.split())[:300]}")
+    if stats.statements > len(stats.queries):
+        print(f"    (+{stats.statements - len(stats.queries)} more)")
+
+def init_app(app, db):
+    """Install the request hooks and the SQL listeners on every bind of `db`"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+def serve(port: int, host: str = '0.0.0.0', app=None) -> bool:
+    """Serve render() at http://host:port/metrics on a daemon thread (for processes without a server)"""
+    from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    def application(environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found\n']
+        if app is not None:
+            with app.app_context():  # gauges may query the database
+                body = render()
+        else:
+            body = render()
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE)])
+        return [body.encode('utf-8')]
+
+    try:
+        server = make_server(host, port, application, handler_class=QuietHandler)
+    except OSError as e:
+        print(f"[Metrics] Port {port} unavailable ({e}); metrics not exposed")
+        return False
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"[Metrics] Serving /metrics on {host}:{port}")
+    return True
@@ -0,0 +1,191 @@
+"""
+Versioned schema migrations and the hot-query plan check
+
+migrate() runs at startup (hospital_api, and so the scheduler) and is safe
+to run from several processes at once:
+
+  1. db.create_all() creates missing tables, with the indexes declared in
+     their __table_args__.
+  2. ensure_columns() adds model columns missing from existing tables.
+     Columns are additive and fully described by the models, so this runs
+     on every start.
+  3. Every migration in MIGRATIONS whose version is not yet recorded in
+     schema_migrations runs in its own transaction, then records its
+     version. Migrations must be idempotent (IF NOT EXISTS, WHERE ... IS
+     NULL) so a race between two starting processes is harmless.
+
+Add a schema change that the models cannot express - an index on an
+existing table, a backfill, a rename - by appending a @migration with the
+next version number. Never edit or renumber an applied migration.
+
+check_query_plans() runs EXPLAIN QUERY PLAN (SQLite) over the hot queries
+and reports any that fall back to a full table scan:
+
+    python migrations.py --check-plans    # exits 1 on a table scan
+"""
+import argparse
+import sys
+from datetime import date, datetime
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from models import (db, Doctor, Patient, Appointment, CallLog, DoctorAvailability, FollowUpCall,
+                    WebhookEvent, OutboxMessage, SchemaMigration, DashboardCounter, ReconcilerState,
+                    ensure_columns)
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+def migration(version: int, name: str):
+    def register(fn):
+        assert all(v != version for v, _, _ in MIGRATIONS), f"duplicate migration version {version}"
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+@migration(1, "Backfill follow_up_calls.type (replaces scheduler.ensure_schema)")
+def _backfill_followup_type(connection):
+    # The column used to be added by hand with DEFAULT 'call'; ensure_columns adds it without one
+    connection.execute(FollowUpCall.__table__.update()
+                       .where(FollowUpCall.__table__.c.type.is_(None))
+                       .values(type='call'))
+
+@migration(2, "Hot-path indexes: appointments, availability, follow-ups, call logs, queues")
+def _create_hot_path_indexes(connection):
+    for table in (Appointment.__table__, CallLog.__table__, DoctorAvailability.__table__,
+                  FollowUpCall.__table__, WebhookEvent.__table__, OutboxMessage.__table__):
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+@migration(3, "Backfill doctor_availability.booked_count for slots booked before reservations")
+def _backfill_booked_count(connection):
+    # Slots booked through the old is_booked flag kept booked_count at 0, so
+    # reservations.py would hand their places out again
+    slots = DoctorAvailability.__table__
+    connection.execute(slots.update()
+                       .where(slots.c.is_booked == True, slots.c.booked_count == 0)
+                       .values(booked_count=func.coalesce(slots.c.max_patients, 1)))
+
+@migration(4, "Move the call reconciler watermark and lease out of dashboard_counters")
+def _create_reconciler_state(connection):
+    ReconcilerState.__table__.create(connection, checkfirst=True)
+    counters = DashboardCounter.__table__
+    state = ReconcilerState.__table__
+    watermark = connection.execute(select(counters.c.value)
+                                   .where(counters.c.name == 'call_sync_watermark')).scalar()
+    exists = connection.execute(select(state.c.name).where(state.c.name == 'calls')).first()
+    if watermark and not exists:
+        connection.execute(state.insert().values(name='calls', watermark=watermark))
+    connection.execute(counters.delete().where(
+        counters.c.name.in_(('call_sync_watermark', 'call_reconciler_lease'))))
+
+def applied_versions() -> set:
+    return {v for (v,) in db.session.query(SchemaMigration.version)}
+
+def migrate() -> List[int]:
+    """Bring the schema up to date (inside an app context); returns the versions applied now"""
+    db.create_all()
+    ensure_columns()
+    done = applied_versions()
+    db.session.commit()
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                fn(connection)
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()))
+        except IntegrityError:
+            continue  # another process applied it first
+        applied.append(version)
+        print(f"[Schema] Applied migration {version}: {name}")
+    return applied
+
+# ==================== QUERY PLAN CHECK ====================
+
+def hot_queries() -> Dict[str, object]:
+    """The queries the API and workers run constantly, as they issue them"""
+    import followup_leases
+    import outbox
+    import webhook_queue
+    now = datetime.utcnow()
+    today = date.today()
+    return {
+        'patient by phone': select(Patient.id).where(Patient.phone == '+910000000000'),
+        'appointments by status': (select(Appointment.id).where(Appointment.status == 'scheduled')
+                                   .order_by(Appointment.appointment_date.desc(), Appointment.id.desc()).limit(51)),
+        'appointments list (keyset)': (select(Appointment.id, Patient.name, Doctor.name)
+                                       .join(Patient, Appointment.patient_id == Patient.id)
+                                       .join(Doctor, Appointment.doctor_id == Doctor.id)
+                                       .where(or_(Appointment.appointment_date < today,
+                                                  and_(Appointment.appointment_date == today, Appointment.id < 100)))
+                                       .order_by(Appointment.appointment_date.desc(), Appointment.id.desc()).limit(51)),
+        'doctor appointments on a date': select(Appointment.id).where(
+            Appointment.doctor_id == 1, Appointment.appointment_date == today),
+        'doctor appointments': (select(Appointment.id).where(Appointment.doctor_id == 1)
+                                .order_by(Appointment.appointment_date.desc())),
+        'doctor free slots': select(DoctorAvailability.id).where(
+            DoctorAvailability.doctor_id == 1, DoctorAvailability.date == today,
+            DoctorAvailability.is_booked == False),
+        'doctor slots in range': select(DoctorAvailability.id).where(
+            DoctorAvailability.doctor_id == 1, DoctorAvailability.date >= today, DoctorAvailability.date <= today),
+        'due follow-ups': (select(FollowUpCall.id).where(followup_leases._claimable(now))
+                           .order_by(FollowUpCall.scheduled_time).limit(50)),
+        'follow-ups by lease': select(FollowUpCall.id).where(FollowUpCall.claimed_by == 'token'),
+        'call logs list (keyset)': (select(CallLog.id).where(CallLog.created_at < now)
+                                    .order_by(CallLog.created_at.desc(), CallLog.id.desc()).limit(51)),
+        'call log by call id': select(CallLog.id).where(CallLog.call_id.in_(['1', '2'])),
+        'due webhook events': (select(WebhookEvent.id).where(webhook_queue._claimable(now))
+                               .order_by(WebhookEvent.next_attempt_at).limit(20)),
+        'webhook events by lease': select(WebhookEvent.id).where(WebhookEvent.claimed_by == 'token'),
+        'due outbox messages': (select(OutboxMessage.id).where(outbox._claimable(now))
+                                .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(50)),
+        'outbox messages by lease': select(OutboxMessage.id).where(OutboxMessage.claimed_by == 'token'),
+    }
+
+def is_table_scan(line: str) -> bool:
+    """'SCAN appointments' is a full table scan; 'SCAN ... USING [COVERING] INDEX' walks an index in order"""
+    return line.startswith('SCAN ') and ' USING ' not in line and line != 'SCAN CONSTANT ROW'
+
+def explain(statement) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines of a statement (SQLite)"""
+    connection = db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+def check_query_plans() -> Dict[str, Tuple[bool, List[str]]]:
+    """{query name: (uses indexes only, plan lines)}; SQLite only"""
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('The query plan check runs against SQLite')
+    report = {}
+    for name, statement in hot_queries().items():
+        plan = explain(statement)
+        report[name] = (not any(is_table_scan(line) for line in plan), plan)
+    db.session.rollback()
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Apply schema migrations')
+    parser.add_argument('--check-plans', action='store_true', help='fail if a hot query does a table scan')
+    args = parser.parse_args(argv)
+
+    from hospital_api import app  # applies migrations on import
+    with app.app_context():
+        print(f"Schema at version {max(applied_versions(), default=0)}")
+        if not args.check_plans:
+            return 0
+        failed = 0
+        for name, (ok, plan) in check_query_plans().items():
+            failed += not ok
+            print(f"{'ok  ' if ok else 'SCAN'} {name}: {' | '.join(plan)}")
+        if failed:
+            print(f"\n{failed} hot quer{'y falls' if failed == 1 else 'ies fall'} back to a table scan")
+        return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,8 +3,11 @@ Database Models for Hospital Booking Management System
 """
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from storage import RoutingSession
 
-db = SQLAlchemy()
+# GET/HEAD request reads go to the read-only pool when storage.py configures one
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Doctor(db.Model):
     """Doctor model"""
@@ -45,15 +48,24 @@ class Patient(db.Model):
 class Appointment(db.Model):
     """Appointment model"""
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_status', 'status'),
+        db.Index('ix_appointments_doctor_date', 'doctor_id', 'appointment_date'),
+        db.Index('ix_appointments_date', 'appointment_date'),  # keyset list order
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    slot_id = db.Column(db.Integer, db.ForeignKey('doctor_availability.id'))  # Place reserved at booking; released on cancel
     
-    appointment_date = db.Column(db.Date, nullable=False)
+    # active_history: setting status or date loads the committed value first, so the
+    # counters.py deltas always know what they are replacing (even on an expired row)
+    appointment_date = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
     appointment_time = db.Column(db.String(20), nullable=False)
     
-    status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled, no_show
+    status = db.column_property(db.Column(db.String(20), default='scheduled'),  # scheduled, completed, cancelled, no_show
+                                active_history=True)
     
     # Call details
     call_id = db.Column(db.String(100))
@@ -73,6 +85,9 @@ class Appointment(db.Model):
 class CallLog(db.Model):
     """Call log model for tracking all voice calls"""
     __tablename__ = 'call_logs'
+    __table_args__ = (
+        db.Index('ix_call_logs_created', 'created_at'),  # keyset list order
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     call_id = db.Column(db.String(100), unique=True)
@@ -84,30 +99,47 @@ class CallLog(db.Model):
     duration = db.Column(db.Integer)  # in seconds
     
     # Call metadata
+    vad_engine = db.Column(db.String(20))  # Dinodial VAD engine the call was placed with
+    call_type = db.Column(db.String(20), default='booking')  # booking, reminder
     prompt_used = db.Column(db.Text)
     evaluation_result = db.Column(db.JSON)
     recording_url = db.Column(db.String(500))
     
+    # Token usage from the call detail's usageMetadata (set by call_sync / usage.py)
+    prompt_tokens = db.Column(db.Integer)
+    response_tokens = db.Column(db.Integer)
+    prompt_audio_tokens = db.Column(db.Integer)
+    response_audio_tokens = db.Column(db.Integer)
+    cost_usd = db.Column(db.Float)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
 
 class DoctorAvailability(db.Model):
     """Doctor availability slots"""
     __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_date_booked', 'doctor_id', 'date', 'is_booked'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
     
     date = db.Column(db.Date, nullable=False)
     time_slot = db.Column(db.String(20), nullable=False)  # e.g., "10:00 AM"
-    is_booked = db.Column(db.Boolean, default=False)
+    is_booked = db.Column(db.Boolean, default=False)  # True once booked_count reaches max_patients
     max_patients = db.Column(db.Integer, default=1)  # Patients per slot
+    booked_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Claimed by reservations.py
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class FollowUpCall(db.Model):
     """Model to schedule follow-up calls"""
     __tablename__ = 'follow_up_calls'
+    __table_args__ = (
+        db.Index('ix_follow_up_calls_status_scheduled', 'status', 'scheduled_time'),
+        db.Index('ix_follow_up_calls_claimed_by', 'claimed_by'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
@@ -115,3 +147,129 @@ class FollowUpCall(db.Model):
     type = db.Column(db.String(20), default='call') # call, whatsapp
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Lease held by the scheduler worker currently delivering this follow-up (see followup_leases.py)
+    claimed_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+
+class WebhookEvent(db.Model):
+    """Inbound call-completed webhook, queued until webhook_queue.py workers sync it"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('ix_webhook_events_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_webhook_events_claimed_by', 'claimed_by'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    call_id = db.Column(db.String(100), unique=True, nullable=False)  # one event per call (deduplicated)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    
+    # Lease held by the worker currently syncing this event
+    claimed_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+class OutboxMessage(db.Model):
+    """Outgoing SMS/WhatsApp message, written with the change that caused it and sent by outbox.py"""
+    __tablename__ = 'outbox_messages'
+    __table_args__ = (
+        db.Index('ix_outbox_messages_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_outbox_messages_claimed_by', 'claimed_by'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))
+    channel = db.Column(db.String(20), nullable=False)  # sms, whatsapp
+    kind = db.Column(db.String(20))  # confirmation, reminder
+    to_number = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed (+ Twilio delivery statuses)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    provider_sid = db.Column(db.String(64), unique=True)
+    last_error = db.Column(db.Text)
+    
+    # Lease held by the sender currently delivering this message
+    claimed_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class OutboxStatusCallback(db.Model):
+    """Twilio status callback that arrived before its message's SID was recorded (applied by outbox.py)"""
+    __tablename__ = 'outbox_status_callbacks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    provider_sid = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class DashboardCounter(db.Model):
+    """Pre-aggregated dashboard counters, maintained by counters.py"""
+    __tablename__ = 'dashboard_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g. patients, status:scheduled, appointments_on:2025-01-01
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class ReconcilerState(db.Model):
+    """Watermark and cross-process lease of a background reconciler (call_reconciler.py)"""
+    __tablename__ = 'reconciler_state'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g. calls
+    watermark = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # highest settled id
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+
+class UsageDaily(db.Model):
+    """Token usage and cost per day and call type, maintained by usage.py"""
+    __tablename__ = 'usage_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    call_type = db.Column(db.String(20), primary_key=True)  # booking, reminder
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    booked = db.Column(db.Integer, nullable=False, default=0)  # calls whose evaluation confirmed a booking
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_tokens = db.Column(db.Integer, nullable=False, default=0)
+    prompt_audio_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_audio_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+
+class SchemaMigration(db.Model):
+    """Versioned migrations applied to this database (migrations.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def ensure_columns():
+    """
+    Add columns declared on the models but missing from existing tables.
+    db.create_all() only creates missing tables, so databases created before
+    a column was introduced need an ALTER TABLE. Must run inside an app context.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            print(f"[Schema] Added column {table.name}.{column.name}")
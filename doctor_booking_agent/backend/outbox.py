@@ -0,0 +1,320 @@
+"""
+Transactional outbox for SMS/WhatsApp notifications
+
+Handlers and the sync path used to build a new twilio Client and send each
+message synchronously, so a slow Twilio answer directly inflated booking
+latency. Now they only add OutboxMessage rows to the session
+(enqueue_confirmation / enqueue_reminder). The rows commit or roll back
+together with the appointment change that caused them: a rolled-back
+booking never texts anyone, and a committed one is never lost.
+
+OutboxSender threads lease pending rows in batches, using the same lease
+scheme as follow-ups. They send through one long-lived Twilio client, with a
+token bucket per channel (dispatcher.TokenBucket) to stay under Twilio's
+rate limits, and write every batch's outcome back in one transaction. A 429
+pauses the channel's bucket. Other failures are retried with exponential
+backoff up to OUTBOX_MAX_ATTEMPTS. SMS needs TWILIO_SMS_FROM; without it
+SMS rows fail at once with that reason. An idle sender only runs a read
+per poll; the claiming UPDATE and its commit happen only when a message is
+due.
+
+Twilio delivery callbacks, if OUTBOX_STATUS_CALLBACK_URL is set, update the
+row by message SID. Callbacks must carry a valid X-Twilio-Signature
+(TWILIO_AUTH_TOKEN). A callback can beat the sender's commit of the SID; it
+is then kept in outbox_status_callbacks and applied when the SID is
+recorded (unmatched ones are dropped after OUTBOX_EARLY_CALLBACK_TTL).
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, select, update
+from models import db, OutboxMessage, OutboxStatusCallback
+from dispatcher import TokenBucket
+from followup_leases import WORKER_ID
+import metrics
+
+WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))  # 0 disables the sender
+CLAIM_BATCH = int(os.getenv('OUTBOX_CLAIM_BATCH', 10))
+LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 120))
+POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.5))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 10))
+RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 900))
+RATE_LIMIT_BACKOFF = float(os.getenv('OUTBOX_RATE_LIMIT_BACKOFF', 30))
+
+WHATSAPP_FROM = os.getenv('TWILIO_WHATSAPP_FROM', '+14155238886')  # Twilio Sandbox Number
+SMS_FROM = os.getenv('TWILIO_SMS_FROM')  # unset: SMS messages fail with a clear error
+# FOR TESTING: send every WhatsApp message to this verified number instead (empty = real recipient)
+WHATSAPP_OVERRIDE_TO = os.getenv('OUTBOX_WHATSAPP_OVERRIDE_TO', '')
+STATUS_CALLBACK_URL = os.getenv('OUTBOX_STATUS_CALLBACK_URL')
+EARLY_CALLBACK_TTL = int(os.getenv('OUTBOX_EARLY_CALLBACK_TTL', 86400))  # seconds
+
+# ==================== MESSAGE BODIES ====================
+
+def sms_confirmation_body(appointment_data: Dict[str, Any]) -> str:
+    return f"""Appointment Confirmed!
+
+Patient: {appointment_data['patient_name']}
+Doctor: {appointment_data['doctor_name']} ({appointment_data['specialty']})
+Date: {appointment_data['date']}
+Time: {appointment_data['time']}
+Confirmation: {appointment_data['confirmation']}
+
+Arrive 10 min early. Call to reschedule.
+- Hospital Booking System"""
+
+def whatsapp_confirmation_body(appointment_data: Dict[str, Any]) -> str:
+    return f"""*Appointment Confirmed!* ✅
+
+👤 *Patient:* {appointment_data['patient_name']}
+👨‍⚕️ *Doctor:* {appointment_data['doctor_name']} ({appointment_data['specialty']})
+📅 *Date:* {appointment_data['date']}
+⏰ *Time:* {appointment_data['time']}
+🔖 *ID:* {appointment_data['confirmation']}
+
+Please arrive 10 min early.
+Reply to this message to reschedule."""
+
+def whatsapp_reminder_body(appointment_data: Dict[str, Any]) -> str:
+    return f"""*Appointment Reminder* 🔔
+
+Hi {appointment_data['patient_name']},
+This is a reminder for your appointment with *{appointment_data['doctor_name']}* ({appointment_data['specialty']}).
+
+📅 *Date:* {appointment_data['date']}
+⏰ *Time:* {appointment_data['time']}
+
+Please reply if you need to reschedule.
+"""
+
+# ==================== ENQUEUE (caller's transaction) ====================
+
+def enqueue(channel: str, to_number: str, body: str, kind: str = None,
+            appointment_id: Optional[int] = None) -> OutboxMessage:
+    """Add a message to the session; it is sent only once the caller commits"""
+    message = OutboxMessage(channel=channel, kind=kind, to_number=to_number, body=body,
+                            appointment_id=appointment_id, status='pending', attempts=0,
+                            next_attempt_at=datetime.utcnow())
+    db.session.add(message)
+    return message
+
+def enqueue_confirmation(phone: str, appointment_data: Dict[str, Any], appointment_id: Optional[int] = None,
+                         channels: Tuple[str, ...] = ('sms', 'whatsapp')) -> List[OutboxMessage]:
+    """Queue booking confirmations (SMS and/or WhatsApp)"""
+    bodies = {'sms': sms_confirmation_body, 'whatsapp': whatsapp_confirmation_body}
+    return [enqueue(channel, phone, bodies[channel](appointment_data), 'confirmation', appointment_id)
+            for channel in channels]
+
+def enqueue_reminder(phone: str, appointment_data: Dict[str, Any],
+                     appointment_id: Optional[int] = None) -> OutboxMessage:
+    """Queue a WhatsApp appointment reminder"""
+    return enqueue('whatsapp', phone, whatsapp_reminder_body(appointment_data), 'reminder', appointment_id)
+
+# ==================== LEASES ====================
+
+def _claimable(now):
+    return and_(
+        OutboxMessage.status == 'pending',
+        OutboxMessage.next_attempt_at <= now,
+        or_(OutboxMessage.lease_expires_at.is_(None), OutboxMessage.lease_expires_at <= now)
+    )
+
+def claim(limit: int = CLAIM_BATCH, worker_id: str = WORKER_ID) -> Tuple[str, list]:
+    """Lease up to `limit` due messages, oldest first; returns (token, rows)"""
+    now = datetime.utcnow()
+    token = f"{worker_id}#{uuid.uuid4().hex[:12]}"
+    if db.session.query(OutboxMessage.id).filter(_claimable(now)).limit(1).first() is None:
+        db.session.rollback()  # end the read transaction; no write when idle
+        return token, []
+    candidates = (select(OutboxMessage.id).where(_claimable(now))
+                  .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(limit))
+    db.session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(claimed_by=token, lease_expires_at=now + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    claimed = db.session.query(
+        OutboxMessage.id, OutboxMessage.channel, OutboxMessage.to_number,
+        OutboxMessage.body, OutboxMessage.attempts
+    ).filter(OutboxMessage.claimed_by == token).order_by(OutboxMessage.id).all()
+    return token, claimed
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_MAX, RETRY_BASE * (2 ** max(0, attempts - 1)))
+
+def record_results(token: str, outcomes: List[Tuple[Any, Dict[str, Any]]]):
+    """Write (row, outcome) pairs back in one transaction, only where `token` still holds the lease"""
+    now = datetime.utcnow()
+    for row, outcome in outcomes:
+        if outcome['ok']:
+            values = {'status': 'sent', 'provider_sid': outcome.get('sid'), 'sent_at': now,
+                      'attempts': row.attempts + 1, 'last_error': None}
+        else:
+            attempts = row.attempts + (0 if outcome.get('throttled') else 1)
+            final = attempts >= MAX_ATTEMPTS or outcome.get('permanent', False)
+            delay = RATE_LIMIT_BACKOFF if outcome.get('throttled') else retry_delay(attempts)
+            values = {'status': 'failed' if final else 'pending', 'attempts': attempts,
+                      'last_error': str(outcome.get('error'))[:1000],
+                      'next_attempt_at': now + timedelta(seconds=delay)}
+        db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == row.id, OutboxMessage.claimed_by == token)
+            .values(claimed_by=None, lease_expires_at=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+    _apply_early_callbacks([outcome['sid'] for _, outcome in outcomes if outcome['ok'] and outcome.get('sid')])
+    db.session.commit()
+
+# Callbacks can arrive out of order; a message never moves back down this ladder
+DELIVERY_PROGRESS = ('queued', 'sending', 'sent', 'delivered', 'read')
+
+def _apply_status(sid: str, status: str) -> bool:
+    """Move the message with this SID to `status` (no commit); False if no message has the SID"""
+    if not db.session.query(OutboxMessage.id).filter(OutboxMessage.provider_sid == sid).first():
+        return False
+    condition = OutboxMessage.provider_sid == sid
+    if status in DELIVERY_PROGRESS:
+        condition = and_(condition, OutboxMessage.status.notin_(
+            DELIVERY_PROGRESS[DELIVERY_PROGRESS.index(status) + 1:]))
+    db.session.execute(
+        update(OutboxMessage)
+        .where(condition)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+def _apply_early_callbacks(sids: List[str]):
+    """Apply (then delete) callbacks stored before these SIDs were recorded, in arrival order"""
+    if not sids:
+        return
+    early = (OutboxStatusCallback.query.filter(OutboxStatusCallback.provider_sid.in_(sids))
+             .order_by(OutboxStatusCallback.id).all())
+    for callback in early:
+        _apply_status(callback.provider_sid, callback.status)
+        db.session.delete(callback)
+
+def record_delivery_status(sid: str, status: str) -> bool:
+    """
+    Apply a Twilio status callback (delivered, undelivered, read, ...) to its
+    message. One for a SID not recorded yet is stored and applied once the
+    sender commits it; returns False in that case.
+    """
+    try:
+        applied = _apply_status(sid, status)
+        if not applied:
+            db.session.add(OutboxStatusCallback(provider_sid=sid, status=status))
+            OutboxStatusCallback.query.filter(
+                OutboxStatusCallback.received_at < datetime.utcnow() - timedelta(seconds=EARLY_CALLBACK_TTL)
+            ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return applied
+
+def valid_twilio_signature(url: str, params: Dict[str, Any], signature: Optional[str]) -> bool:
+    """Whether a callback's X-Twilio-Signature matches (False when TWILIO_AUTH_TOKEN is unset)"""
+    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+    if not auth_token or not signature:
+        return False
+    from twilio.request_validator import RequestValidator
+    return RequestValidator(auth_token).validate(url, params, signature)
+
+# ==================== SENDER ====================
+
+class OutboxSender:
+    """Worker threads draining the outbox through one shared Twilio client"""
+
+    def __init__(self, app, workers: int = WORKERS, batch: int = CLAIM_BATCH, poll_interval: float = POLL_INTERVAL):
+        self.app = app
+        self.workers = workers
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.buckets = {
+            'whatsapp': TokenBucket(float(os.getenv('OUTBOX_WHATSAPP_RATE', 1.0)),
+                                    int(os.getenv('OUTBOX_WHATSAPP_BURST', 5))),
+            'sms': TokenBucket(float(os.getenv('OUTBOX_SMS_RATE', 1.0)),
+                               int(os.getenv('OUTBOX_SMS_BURST', 5))),
+        }
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.counts = {'sent': 0, 'failed': 0, 'throttled': 0}
+
+    @property
+    def client(self):
+        """Long-lived Twilio client (keeps its HTTP connections alive between messages)"""
+        with self._client_lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+            return self._client
+
+    def _create(self, **kwargs):
+        if STATUS_CALLBACK_URL:
+            kwargs['status_callback'] = STATUS_CALLBACK_URL
+        started = time.perf_counter()
+        ok = False
+        try:
+            message = self.client.messages.create(**kwargs)
+            ok = True
+            return message
+        finally:
+            metrics.observe_outbound('twilio', 'messages.create', time.perf_counter() - started, ok)
+
+    def deliver(self, row) -> Dict[str, Any]:
+        """Send one message; returns {'ok', 'sid'} or {'ok': False, 'error', 'throttled', 'permanent'}"""
+        if row.channel == 'sms' and not SMS_FROM:
+            return {'ok': False, 'error': 'TWILIO_SMS_FROM is not set', 'permanent': True}
+        self.buckets.get(row.channel, self.buckets['whatsapp']).acquire()
+        try:
+            if row.channel == 'whatsapp':
+                to_number = WHATSAPP_OVERRIDE_TO or row.to_number
+                message = self._create(from_=f'whatsapp:{WHATSAPP_FROM}', body=row.body, to=f'whatsapp:{to_number}')
+                print(f"[WhatsApp] Sent successfully to {to_number}! SID: {message.sid}")
+                return {'ok': True, 'sid': message.sid}
+            if row.channel == 'sms':
+                message = self._create(from_=SMS_FROM, body=row.body, to=row.to_number)
+                return {'ok': True, 'sid': message.sid}
+            return {'ok': False, 'error': f"Unknown channel: {row.channel}"}
+        except Exception as e:
+            throttled = getattr(e, 'status', None) == 429
+            if throttled:
+                self.buckets.get(row.channel, self.buckets['whatsapp']).pause(RATE_LIMIT_BACKOFF)
+            print(f"[Outbox] {row.channel} message {row.id} failed: {e}")
+            return {'ok': False, 'error': str(e), 'throttled': throttled}
+
+    def drain_once(self) -> int:
+        """Lease one batch, send it and record the outcomes (inside an app context)"""
+        token, claimed = claim(self.batch)
+        if not claimed:
+            return 0
+        outcomes = [(row, self.deliver(row)) for row in claimed]
+        record_results(token, outcomes)
+        with self._lock:
+            for _, outcome in outcomes:
+                key = 'sent' if outcome['ok'] else ('throttled' if outcome.get('throttled') else 'failed')
+                self.counts[key] += 1
+        return len(claimed)
+
+    def start(self) -> bool:
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'outbox-sender-{i}', daemon=True).start()
+        return self.workers > 0
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    claimed = self.drain_once()
+            except Exception as e:
+                print(f"[Outbox] Sender error: {e}")
+                claimed = 0
+            if not claimed:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,221 @@
+"""
+Local, content-addressed cache of call recordings
+
+Playing a recording used to mean asking Dinodial for its URL and
+downloading the whole MP3 on every request, and again for every seek.
+RecordingCache fetches each recording once and keeps it on disk:
+
+    <root>/objects/<sha[:2]>/<sha256>   recording bytes, named by content hash
+    <root>/calls/<call_id>              "<sha256> <content type>" for the call
+
+Files are streamed to a temp file while hashing and then renamed into
+place, so readers never see a partial object and identical audio is stored
+once. The cache is bounded by RECORDING_CACHE_MAX_BYTES with LRU eviction:
+each hit touches the object's mtime, and when a download pushes the total
+over the limit the least recently used objects (and the call entries
+pointing at them) are deleted. Concurrent misses for the same call share
+one download.
+
+The /api/call/<id>/recording endpoint serves objects with send_file, which
+answers Range requests (206) and hands the open file to the server's
+wsgi.file_wrapper (sendfile), so scrubbing never touches upstream.
+"""
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from typing import Any, Callable, Dict, Optional
+import requests
+
+CACHE_DIR = os.getenv('RECORDING_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recording_cache'))
+MAX_BYTES = int(os.getenv('RECORDING_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+DOWNLOAD_TIMEOUT = float(os.getenv('RECORDING_DOWNLOAD_TIMEOUT', 60))
+CHUNK_SIZE = 256 * 1024
+DEFAULT_CONTENT_TYPE = 'audio/mpeg'
+
+CachedRecording = namedtuple('CachedRecording', ['path', 'sha256', 'size', 'content_type'])
+
+class RecordingUnavailable(Exception):
+    """The call has no recording (yet) - 404 - or upstream could not provide it - 502"""
+
+    def __init__(self, message: str, http_status: int = 502):
+        super().__init__(message)
+        self.http_status = http_status
+
+def recording_url_of(response: Dict[str, Any]) -> Optional[str]:
+    """Recording URL from a Dinodial call/recording response"""
+    if not isinstance(response, dict) or response.get('status') == 'error':
+        return None
+    data = response.get('data', response)
+    if isinstance(data, str):
+        return data
+    if isinstance(data, dict):
+        for key in ('recording_url', 'url', 'recording', 'file'):
+            if isinstance(data.get(key), str) and data[key]:
+                return data[key]
+    return None
+
+class RecordingCache:
+    """Disk cache of recordings keyed by content hash, bounded with LRU eviction"""
+
+    def __init__(self, resolve_url: Callable[[int], Optional[str]], root: str = CACHE_DIR,
+                 max_bytes: int = MAX_BYTES, session: Optional[requests.Session] = None):
+        self.resolve_url = resolve_url  # call id -> downloadable URL (or None)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._inflight = {}  # call id -> Event of the download in progress
+        self._size = None  # bytes in objects/, scanned lazily
+        self.hits = self.misses = self.evictions = 0
+        for sub in ('objects', 'calls', 'tmp'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.root, 'objects', sha[:2], sha)
+
+    def _call_path(self, call_id: int) -> str:
+        return os.path.join(self.root, 'calls', str(int(call_id)))
+
+    def lookup(self, call_id: int) -> Optional[CachedRecording]:
+        """The cached recording of a call (touching it for LRU), or None"""
+        try:
+            with open(self._call_path(call_id), encoding='utf-8') as f:
+                sha, _, content_type = f.read().strip().partition(' ')
+            path = self._object_path(sha)
+            os.utime(path)
+            size = os.path.getsize(path)
+        except (OSError, ValueError):
+            return None
+        return CachedRecording(path, sha, size, content_type or DEFAULT_CONTENT_TYPE)
+
+    def get(self, call_id: int) -> CachedRecording:
+        """Cached recording of a call, downloading it on a miss (raises RecordingUnavailable)"""
+        while True:
+            cached = self.lookup(call_id)
+            if cached:
+                with self._lock:
+                    self.hits += 1
+                return cached
+            with self._lock:
+                pending = self._inflight.get(call_id)
+                if pending is None:
+                    pending = self._inflight[call_id] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                pending.wait(DOWNLOAD_TIMEOUT)
+                if self.lookup(call_id) is None:
+                    raise RecordingUnavailable(f'Recording of call {call_id} could not be fetched')
+                continue
+            try:
+                with self._lock:
+                    self.misses += 1
+                return self._fetch(call_id)
+            finally:
+                with self._lock:
+                    self._inflight.pop(call_id, None)
+                pending.set()
+
+    def _fetch(self, call_id: int) -> CachedRecording:
+        try:
+            url = self.resolve_url(call_id)
+        except Exception as e:
+            raise RecordingUnavailable(f'Recording lookup failed: {e}')
+        if not url:
+            raise RecordingUnavailable(f'No recording for call {call_id}', 404)
+        tmp_path = os.path.join(self.root, 'tmp', f'{call_id}.{threading.get_ident()}.part')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with self.session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 200:
+                    raise RecordingUnavailable(f'Recording download failed: HTTP {response.status_code}',
+                                               404 if response.status_code == 404 else 502)
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+                if not content_type.startswith('audio/'):
+                    content_type = DEFAULT_CONTENT_TYPE
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+        except requests.RequestException as e:
+            self._discard(tmp_path)
+            raise RecordingUnavailable(f'Recording download failed: {e}')
+        except Exception:
+            self._discard(tmp_path)
+            raise
+
+        sha = digest.hexdigest()
+        path = self._object_path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            is_new = not os.path.exists(path)
+            if is_new:
+                os.replace(tmp_path, path)
+            else:
+                os.utime(path)  # same audio already cached under another call
+        if not is_new:
+            self._discard(tmp_path)
+        entry_tmp = self._call_path(call_id) + '.part'
+        with open(entry_tmp, 'w', encoding='utf-8') as f:
+            f.write(f'{sha} {content_type}')
+        os.replace(entry_tmp, self._call_path(call_id))
+        if is_new:
+            self._account(size)
+        return CachedRecording(path, sha, size, content_type)
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _objects(self):
+        """(mtime, size, sha, path) of every cached object"""
+        objects_dir = os.path.join(self.root, 'objects')
+        for prefix in os.listdir(objects_dir):
+            for entry in os.scandir(os.path.join(objects_dir, prefix)):
+                stat = entry.stat()
+                yield stat.st_mtime, stat.st_size, entry.name, entry.path
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _, _ in self._objects())
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used objects until under max_bytes (holding _lock)"""
+        evicted = set()
+        for _, size, sha, path in sorted(self._objects()):
+            if self._size <= self.max_bytes:
+                break
+            self._discard(path)
+            self._size -= size
+            evicted.add(sha)
+            self.evictions += 1
+        if not evicted:
+            return
+        calls_dir = os.path.join(self.root, 'calls')
+        for entry in os.scandir(calls_dir):
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    if f.read().partition(' ')[0] in evicted:
+                        self._discard(entry.path)
+            except OSError:
+                pass
+        print(f"[Recordings] Evicted {len(evicted)} recording(s); cache at {self._size / 1024 ** 2:.1f} MB")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _, _ in self._objects())
+            return {'bytes': self._size, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
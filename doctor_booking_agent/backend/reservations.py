@@ -0,0 +1,92 @@
+"""
+Atomic doctor slot reservations
+
+A slot is claimed with one conditional UPDATE that increments booked_count
+only while it is below max_patients, so two concurrent bookings can never
+both take the last place in a slot. The UPDATE runs in the caller's
+transaction: if the booking is rolled back, so is the claim.
+
+Slots that just reported a conflict are remembered for a few seconds, so a
+crowd of callers hammering a sold-out slot is turned away without queueing
+on the database write lock.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+from typing import Optional
+from sqlalchemy import func, update
+from models import db, DoctorAvailability
+from availability_index import parse_time_slot
+
+FULL_SLOT_TTL = float(os.getenv('RESERVATION_FULL_SLOT_TTL', 5))
+
+ReservationResult = namedtuple('ReservationResult', ['ok', 'slot_id', 'slot_full', 'reason'])
+
+class SlotReservations:
+    """Claims and releases DoctorAvailability capacity"""
+
+    def __init__(self, full_slot_ttl: float = FULL_SLOT_TTL):
+        self.full_slot_ttl = full_slot_ttl
+        self._full_until = {}  # slot_id -> monotonic deadline of the sold-out hint
+        self._lock = threading.Lock()
+
+    def find_slot(self, doctor_id: int, day: date, time_slot: str):
+        """Find the slot for a doctor/date matching a time such as '10:00 AM' or '10am'"""
+        minute = parse_time_slot(time_slot)
+        slots = db.session.query(
+            DoctorAvailability.id,
+            DoctorAvailability.doctor_id,
+            DoctorAvailability.date,
+            DoctorAvailability.time_slot
+        ).filter_by(doctor_id=doctor_id, date=day).all()
+        for slot in slots:
+            if slot.time_slot == time_slot or (minute is not None and parse_time_slot(slot.time_slot) == minute):
+                return slot
+        return None
+
+    def _known_full(self, slot_id: int) -> bool:
+        with self._lock:
+            deadline = self._full_until.get(slot_id)
+            if deadline is None:
+                return False
+            if time.monotonic() < deadline:
+                return True
+            del self._full_until[slot_id]
+            return False
+
+    def reserve(self, slot_id: int) -> ReservationResult:
+        """Claim one place in a slot inside the current transaction"""
+        if self._known_full(slot_id):
+            return ReservationResult(False, slot_id, True, 'Slot is fully booked')
+
+        capacity = func.coalesce(DoctorAvailability.max_patients, 1)
+        stmt = (update(DoctorAvailability)
+                .where(DoctorAvailability.id == slot_id,
+                       DoctorAvailability.booked_count < capacity)
+                .values(booked_count=DoctorAvailability.booked_count + 1,
+                        is_booked=DoctorAvailability.booked_count + 1 >= capacity)
+                .execution_options(synchronize_session=False))
+        if db.session.execute(stmt).rowcount != 1:
+            with self._lock:
+                self._full_until[slot_id] = time.monotonic() + self.full_slot_ttl
+            return ReservationResult(False, slot_id, True, 'Slot is fully booked')
+
+        is_booked = db.session.query(DoctorAvailability.is_booked).filter_by(id=slot_id).scalar()
+        return ReservationResult(True, slot_id, bool(is_booked), None)
+
+    def release(self, slot_id: int) -> bool:
+        """Give back one place in a slot inside the current transaction"""
+        stmt = (update(DoctorAvailability)
+                .where(DoctorAvailability.id == slot_id,
+                       DoctorAvailability.booked_count > 0)
+                .values(booked_count=DoctorAvailability.booked_count - 1,
+                        is_booked=False)
+                .execution_options(synchronize_session=False))
+        released = db.session.execute(stmt).rowcount == 1
+        with self._lock:
+            self._full_until.pop(slot_id, None)
+        return released
+
+reservations = SlotReservations()
@@ -0,0 +1,89 @@
+"""
+Versioned snapshot of the booking-call doctor roster
+
+Booking calls embed the list of available doctors as a <hospital_roster>
+XML block. The snapshot keeps that list and its pre-rendered XML in memory,
+tagged with the 'roster_version' counter. Handlers that change the roster
+(register_doctor, toggle_doctor_availability, availability edits) call
+bump() in their transaction; every process re-reads the shared version at
+most every ROSTER_VERSION_CHECK_INTERVAL seconds and rebuilds only when it
+moved. Writes that bypass the API (seed scripts) are picked up by a full
+rebuild every ROSTER_CACHE_TTL seconds.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event
+from models import db, Doctor
+from counters import bump_counter, read_counters
+from src.prompts import render_roster_xml
+
+VERSION_KEY = 'roster_version'
+VERSION_CHECK_INTERVAL = float(os.getenv('ROSTER_VERSION_CHECK_INTERVAL', 1))
+CACHE_TTL = int(os.getenv('ROSTER_CACHE_TTL', 300))
+
+RosterSnapshot = namedtuple('RosterSnapshot', ['version', 'roster', 'xml', 'built_at'])
+
+class RosterCache:
+    """Roster list + rendered XML, rebuilt only when the roster version changes"""
+
+    def __init__(self, check_interval: float = VERSION_CHECK_INTERVAL, ttl: int = CACHE_TTL):
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self.stats = {'hits': 0, 'rebuilds': 0}
+
+    def _read_version(self) -> int:
+        return read_counters([VERSION_KEY])[VERSION_KEY]
+
+    def _build(self, version: int) -> RosterSnapshot:
+        rows = db.session.query(Doctor.name, Doctor.specialty, Doctor.available_time).filter(
+            Doctor.is_available == True
+        ).all()
+        roster = tuple({
+            'name': name,
+            'specialty': specialty,
+            'slots': available_time or '9am-5pm'
+        } for name, specialty, available_time in rows)
+        return RosterSnapshot(version, roster, render_roster_xml(roster), time.monotonic())
+
+    def snapshot(self) -> RosterSnapshot:
+        """Current roster (must run inside an app context)"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._snapshot
+            if current is not None and now - self._checked_at < self.check_interval:
+                self.stats['hits'] += 1
+                return current
+            version = self._read_version()
+            self._checked_at = now
+            if current is not None and current.version == version and now - current.built_at < self.ttl:
+                self.stats['hits'] += 1
+                return current
+            self._snapshot = self._build(version)
+            self.stats['rebuilds'] += 1
+            return self._snapshot
+
+    def bump(self):
+        """Mark the roster as changed; call before the handler's commit"""
+        bump_counter(VERSION_KEY)
+        db.session.info['roster_changed'] = True
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+roster_cache = RosterCache()
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    # Re-read the version only once the bump is visible to other connections
+    if session.info.pop('roster_changed', False):
+        roster_cache.invalidate()
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('roster_changed', None)
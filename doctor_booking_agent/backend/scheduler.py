@@ -1,116 +1,233 @@
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 import os
 
 # Add agent directory to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agent')))
 
-from hospital_api import app, db, FollowUpCall, Appointment, Patient, Doctor, send_whatsapp_reminder, agent
-from sqlalchemy import text
+from hospital_api import app, db, FollowUpCall, Appointment, Patient, Doctor, CallLog, agent, run_call_sync
+from counters import reconcile_counters
+from usage import rebuild_usage
+from followup_queue import DueQueue, start_wake_listener
+from dispatcher import FollowUpDispatcher
+from followup_leases import claim_due, finish, defer, release, renew, holds_lease, CLAIM_BATCH, WORKER_ID
+from call_reconciler import CallReconciler, start_reconciler, PAGE_SIZE as RECONCILE_PAGE_SIZE
+from webhook_queue import WebhookWorkerPool
+from outbox import OutboxSender, enqueue_reminder
+import metrics
 
-def ensure_schema():
-    """Ensure the type column exists in the database"""
+# How often the dashboard counters are rebuilt from the base tables
+COUNTER_RECONCILE_INTERVAL = int(os.getenv('COUNTER_RECONCILE_INTERVAL', 3600))
+# Safety-net reload of pending follow-ups created without a wake-up (e.g. demo_trigger.py)
+RESYNC_INTERVAL = int(os.getenv('SCHEDULER_RESYNC_INTERVAL', 900))
+# Delay before retrying a voice reminder that hit the Dinodial rate limit
+RATE_LIMIT_BACKOFF = int(os.getenv('SCHEDULER_RATE_LIMIT_BACKOFF', 65))
+# Delay before re-offering a job to a channel whose queue was full
+BACKPRESSURE_DELAY = int(os.getenv('SCHEDULER_BACKPRESSURE_DELAY', 5))
+# How often dispatcher queue depth / throughput is printed while there is activity
+STATS_INTERVAL = int(os.getenv('SCHEDULER_STATS_INTERVAL', 60))
+# Port for this process's /metrics (Dinodial/Twilio latency, background SQL); unset = not exposed
+METRICS_PORT = int(os.getenv('SCHEDULER_METRICS_PORT', 0))
+
+def load_pending(queue):
+    """Push every pending follow-up deadline (or lease expiry, if later) onto the in-memory queue"""
     with app.app_context():
-        try:
-            # Try to query the column to see if it exists
-            db.session.execute(text("SELECT type FROM follow_up_calls LIMIT 1"))
-            print("Schema check: 'type' column exists.")
-        except Exception:
-            print("Schema check: 'type' column missing. Adding it...")
-            try:
-                # Add the column
-                db.session.execute(text("ALTER TABLE follow_up_calls ADD COLUMN type VARCHAR(20) DEFAULT 'call'"))
-                db.session.commit()
-                print("Schema updated successfully.")
-            except Exception as e:
-                print(f"Error updating schema: {e}")
+        rows = db.session.query(FollowUpCall.id, FollowUpCall.scheduled_time, FollowUpCall.lease_expires_at).filter(
+            FollowUpCall.status == 'pending'
+        ).all()
+    for row in rows:
+        queue.push(row.id, max(row.scheduled_time, row.lease_expires_at or row.scheduled_time))
+    return len(rows)
+
+def send_followup(call):
+    """Deliver one follow-up. Returns 'completed', 'failed' or 'rate_limited'."""
+    appt = db.session.get(Appointment, call.appointment_id)
+    if not appt:
+        print(f"Appointment {call.appointment_id} not found. Marking failed.")
+        return 'failed'
+    
+    patient = db.session.get(Patient, appt.patient_id)
+    doctor = db.session.get(Doctor, appt.doctor_id)
+    
+    data = {
+        'patient_name': patient.name,
+        'doctor_name': doctor.name,
+        'specialty': doctor.specialty,
+        'date': str(appt.appointment_date),
+        'time': appt.appointment_time
+    }
+    
+    # Determine action based on type
+    call_type = getattr(call, 'type', 'call') # Default to call if attribute missing
+    
+    if call_type == 'whatsapp':
+        print(f"Queueing WhatsApp Reminder for {patient.name}...")
+        # Commits with the follow-up's final status; OutboxSender delivers it
+        enqueue_reminder(patient.phone, data, appt.id)
+        return 'completed'
+        
+    elif call_type == 'call':
+        print(f"Processing Voice Call Reminder for {patient.name}...")
+        # Use the new create_reminder_call method
+        response = agent.create_reminder_call(
+            phone_number=patient.phone,
+            patient_name=patient.name,
+            doctor_name=doctor.name,
+            date=str(appt.appointment_date),
+            time=appt.appointment_time
+        )
+        print(f"Call initiated: {response}")
+        
+        # Check for rate limit error
+        if isinstance(response, dict) and 'error' in response and 'Rate limit' in response['error']:
+            print(f"Rate limit hit. Will retry in {RATE_LIMIT_BACKOFF}s.")
+            # Do not mark as completed, so it gets picked up again
+            return 'rate_limited'
+        if isinstance(response, dict) and response.get('status') == 'success':
+            # Logged so its usage is booked as a reminder (commits with the follow-up's status)
+            db.session.add(CallLog(
+                call_id=str(response['data'].get('id')),
+                phone_number=patient.phone,
+                appointment_id=appt.id,
+                status='in_progress',
+                vad_engine=response.get('vad_engine'),
+                call_type='reminder'
+            ))
+        return 'completed'
+    
+    else:
+        print(f"Unknown follow-up type: {call_type}")
+        return 'failed'
+
+def run_claimed_followup(followup_id, lease_token):
+    """Deliver a follow-up this worker has leased and record the outcome under the lease"""
+    # The job may have waited in the dispatcher queue or the rate limiter past its lease,
+    # and another worker may own the row now
+    call = FollowUpCall.query.filter(FollowUpCall.id == followup_id,
+                                     holds_lease(lease_token, datetime.utcnow())).first()
+    if not call or not renew(followup_id, lease_token):
+        print(f"[Lease] Lease on follow-up {followup_id} expired before sending; skipped")
+        return 'skipped'
+    try:
+        outcome = send_followup(call)
+    except Exception as e:
+        print(f"Error processing follow-up {followup_id}: {e}")
+        db.session.rollback()
+        outcome = 'failed'
+    
+    if outcome == 'rate_limited':
+        # Stay pending, but hidden from every worker until the backoff has passed
+        defer(followup_id, lease_token, RATE_LIMIT_BACKOFF)
+    else:
+        finish(followup_id, lease_token, outcome)
+    return outcome
 
-def process_followups():
-    """Check for pending follow-ups and execute them"""
+def process_followup(followup_id, lease_token):
+    """Dispatcher worker entry point"""
+    with app.app_context():
+        return run_claimed_followup(followup_id, lease_token)
+
+def process_followups(followup_ids=None):
+    """
+    Claim and execute due pending follow-ups one after another (optionally only the given ids).
+    Returns the ids left pending because the voice API was rate limited.
+    """
+    retry_ids = []
     with app.app_context():
         now = datetime.utcnow()
-        # Find pending calls that are due
-        pending = FollowUpCall.query.filter(
-            FollowUpCall.status == 'pending',
-            FollowUpCall.scheduled_time <= now
-        ).all()
+        # Lease the due rows so a concurrently running scheduler cannot send them too
+        token, claimed = claim_due(followup_ids, limit=CLAIM_BATCH if followup_ids is None else len(followup_ids))
         
-        if pending:
-            print(f"[{now}] Found {len(pending)} pending follow-ups.")
+        if claimed:
+            print(f"[{now}] Found {len(claimed)} pending follow-ups.")
         
-        for call in pending:
-            try:
-                appt = db.session.get(Appointment, call.appointment_id)
-                if not appt:
-                    print(f"Appointment {call.appointment_id} not found. Marking failed.")
-                    call.status = 'failed'
-                    db.session.commit()
-                    continue
-                
-                patient = db.session.get(Patient, appt.patient_id)
-                doctor = db.session.get(Doctor, appt.doctor_id)
-                
-                data = {
-                    'patient_name': patient.name,
-                    'doctor_name': doctor.name,
-                    'specialty': doctor.specialty,
-                    'date': str(appt.appointment_date),
-                    'time': appt.appointment_time
-                }
-                
-                # Determine action based on type
-                call_type = getattr(call, 'type', 'call') # Default to call if attribute missing
-                
-                if call_type == 'whatsapp':
-                    print(f"Processing WhatsApp Reminder for {patient.name}...")
-                    success = send_whatsapp_reminder(patient.phone, data)
-                    if success:
-                        call.status = 'completed'
-                    else:
-                        call.status = 'failed'
-                    
-                elif call_type == 'call':
-                    print(f"Processing Voice Call Reminder for {patient.name}...")
-                    # Use the new create_reminder_call method
-                    response = agent.create_reminder_call(
-                        phone_number=patient.phone,
-                        patient_name=patient.name,
-                        doctor_name=doctor.name,
-                        date=str(appt.appointment_date),
-                        time=appt.appointment_time
-                    )
-                    print(f"Call initiated: {response}")
-                    
-                    # Check for rate limit error
-                    if isinstance(response, dict) and 'error' in response and 'Rate limit' in response['error']:
-                        print("Rate limit hit. Will retry later.")
-                        # Do not mark as completed, so it gets picked up again
-                        # But we should probably back off for this loop
-                        time.sleep(65) # Wait a bit more than a minute
-                    else:
-                        call.status = 'completed'
-                
-                else:
-                    print(f"Unknown follow-up type: {call_type}")
-                    call.status = 'failed'
-                    
-                db.session.commit()
-                
-            except Exception as e:
-                print(f"Error processing follow-up {call.id}: {e}")
-                call.status = 'failed'
-                db.session.commit()
+        voice_rate_limited = False
+        for followup_id, followup_type in claimed:
+            if voice_rate_limited and (followup_type or 'call') == 'call':
+                # Already throttled in this batch - leave pending for the retry
+                release(followup_id, token)
+                retry_ids.append(followup_id)
+                continue
+            if run_claimed_followup(followup_id, token) == 'rate_limited':
+                voice_rate_limited = True
+                retry_ids.append(followup_id)
+    
+    return retry_ids
+
+def dispatch_due(dispatcher, queue, followup_ids):
+    """Lease due follow-ups and hand them to their channel's worker pool"""
+    now = datetime.utcnow()
+    with app.app_context():
+        for start in range(0, len(followup_ids), CLAIM_BATCH):
+            batch = followup_ids[start:start + CLAIM_BATCH]
+            token, claimed = claim_due(batch)
+            for followup_id, followup_type in claimed:
+                if not dispatcher.submit(followup_id, followup_type, token):
+                    # Channel saturated: drop the lease so any worker can take it later
+                    release(followup_id, token)
+                    queue.push(followup_id, now + timedelta(seconds=BACKPRESSURE_DELAY))
+            
+            # Rows leased by another worker come back to us if that lease expires unfinished
+            won = {followup_id for followup_id, _ in claimed}
+            lost = [followup_id for followup_id in batch if followup_id not in won]
+            if lost:
+                leased = db.session.query(FollowUpCall.id, FollowUpCall.lease_expires_at).filter(
+                    FollowUpCall.id.in_(lost),
+                    FollowUpCall.status == 'pending',
+                    FollowUpCall.lease_expires_at.isnot(None)
+                ).all()
+                for row in leased:
+                    queue.push(row.id, row.lease_expires_at)
 
 if __name__ == "__main__":
-    print("Starting Follow-up Scheduler...")
-    ensure_schema()
+    print(f"Starting Follow-up Scheduler (worker {WORKER_ID})...")
+    queue = DueQueue()
+    dispatcher = FollowUpDispatcher(
+        process_followup,
+        on_rate_limited=lambda followup_id: queue.push(
+            followup_id, datetime.utcnow() + timedelta(seconds=RATE_LIMIT_BACKOFF)),
+        rate_limit_backoff=RATE_LIMIT_BACKOFF
+    )
+    start_wake_listener(queue)
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT, app=app)
+    # Sends SMS/WhatsApp messages queued in the outbox
+    OutboxSender(app).start()
+    # Drains call-completed webhooks queued by the API
+    webhooks = WebhookWorkerPool(app, lambda call_ids: run_call_sync(agent.get_booking_statuses(call_ids)))
+    webhooks.start()
+    # Picks up completed calls whose webhook never arrived
+    start_reconciler(app, CallReconciler(
+        list_page=lambda page: agent.list_calls(page, RECONCILE_PAGE_SIZE),
+        sync=lambda call_ids: run_call_sync(agent.get_booking_statuses(call_ids))
+    ))
+    print(f"Loaded {load_pending(queue)} pending follow-ups.")
     print("Scheduler running. Press Ctrl+C to stop.")
+    last_reconcile = last_resync = last_stats = time.monotonic()
     while True:
         try:
-            process_followups()
+            # Sleeps until the next deadline, a wake-up for an earlier job, or the resync interval
+            due_ids = queue.wait_due(RESYNC_INTERVAL)
+            if due_ids:
+                dispatch_due(dispatcher, queue, due_ids)
+            
+            if time.monotonic() - last_resync >= RESYNC_INTERVAL:
+                load_pending(queue)
+                last_resync = time.monotonic()
+            
+            if due_ids and time.monotonic() - last_stats >= STATS_INTERVAL:
+                print(f"[Dispatcher] {dispatcher.format_stats()}")
+                last_stats = time.monotonic()
         except Exception as e:
             print(f"Scheduler loop error: {e}")
+            time.sleep(5)
         
-        # Sleep for 60 seconds
-        time.sleep(60)
+        if time.monotonic() - last_reconcile >= COUNTER_RECONCILE_INTERVAL:
+            try:
+                with app.app_context():
+                    reconcile_counters()
+                    rebuild_usage()
+            except Exception as e:
+                print(f"Counter reconciliation error: {e}")
+            last_reconcile = time.monotonic()
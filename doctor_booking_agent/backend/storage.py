@@ -0,0 +1,140 @@
+"""
+Database storage profiles and read/write routing
+
+hospital_api used to hardcode sqlite:///hospital_booking.db with QueuePool
+options (pool_size/max_overflow/pre-ping) that do nothing useful for a
+local file, in SQLite's default rollback-journal mode where a dashboard
+read and a booking write block each other. configure() now picks one of
+two profiles from the environment:
+
+  sqlite    (default) SQLITE_PATH, relative to the app's instance folder.
+            Every connection runs in WAL mode with tuned pragmas, so
+            readers never block the writer and vice versa. A second,
+            read-only connection pool on the same file (mode=ro,
+            query_only) serves GET/HEAD requests. Writers keep the primary
+            pool to themselves.
+  postgres  DATABASE_URL=postgresql://... with a pre-pinged, recycled
+            QueuePool (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+            DB_POOL_TIMEOUT). Needs a driver, e.g. pip install
+            psycopg2-binary. DATABASE_READ_URL, if set, points GET traffic
+            at a replica.
+
+RoutingSession sends a statement to the 'read' bind when it runs inside a
+GET/HEAD request and is not part of a flush or an INSERT/UPDATE/DELETE.
+Wrap a GET view that must write, or must read its own uncommitted writes,
+with @use_primary.
+"""
+import os
+from functools import wraps
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+READ_BIND = 'read'
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'hospital_booking.db')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable at checkpoints in WAL mode
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', 65536))  # page cache per connection
+SQLITE_MMAP_BYTES = int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 ** 2))
+SQLITE_WRITE_POOL_SIZE = int(os.getenv('SQLITE_WRITE_POOL_SIZE', 5))
+SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', 10))
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+
+def _postgres_url(url: str) -> str:
+    # Heroku-style postgres:// URLs are not accepted by SQLAlchemy 1.4+
+    return 'postgresql://' + url[len('postgres://'):] if url.startswith('postgres://') else url
+
+def _sqlite_options(pool_size: int) -> dict:
+    return {
+        'pool_size': pool_size,
+        'max_overflow': pool_size,
+        'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+    }
+
+def _postgres_options() -> dict:
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': True,
+    }
+
+def configure(app, sqlite_path: str = None) -> str:
+    """Set the SQLAlchemy config of `app` for the selected profile; returns 'sqlite' or 'postgres'"""
+    database_url = os.getenv('DATABASE_URL')
+    binds = {}
+    if database_url and not database_url.startswith('sqlite'):
+        profile = 'postgres'
+        app.config['SQLALCHEMY_DATABASE_URI'] = _postgres_url(database_url)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _postgres_options()
+        if os.getenv('DATABASE_READ_URL'):
+            binds[READ_BIND] = {'url': _postgres_url(os.getenv('DATABASE_READ_URL')), **_postgres_options()}
+    else:
+        profile = 'sqlite'
+        path = sqlite_path or SQLITE_PATH
+        # Relative paths resolve against app.instance_path (Flask-SQLAlchemy), for both URLs
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _sqlite_options(SQLITE_WRITE_POOL_SIZE)
+        binds[READ_BIND] = {'url': f'sqlite:///file:{path}?mode=ro&uri=true',
+                            **_sqlite_options(SQLITE_READ_POOL_SIZE)}
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['STORAGE_PROFILE'] = profile
+    return profile
+
+def _sqlite_pragmas(read_only: bool):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')  # persistent; read-only connections can't set it
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_BYTES}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        if read_only:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+    return on_connect
+
+def init_app(app, db, sqlite_path: str = None) -> str:
+    """configure() + db.init_app() + connection pragmas; returns the profile"""
+    profile = configure(app, sqlite_path)
+    db.init_app(app)
+    if profile == 'sqlite':
+        with app.app_context():
+            event.listen(db.engines[None], 'connect', _sqlite_pragmas(read_only=False))
+            event.listen(db.engines[READ_BIND], 'connect', _sqlite_pragmas(read_only=True))
+            # Create the file and switch it to WAL before any read-only connection opens it
+            with db.engines[None].connect():
+                pass
+    print(f"[Storage] {profile} profile, read pool: {'yes' if READ_BIND in app.config['SQLALCHEMY_BINDS'] else 'no'}")
+    return profile
+
+def use_primary(view):
+    """Run a GET view against the primary pool (it writes, or reads its own writes)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_use_primary = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def _reads_routed() -> bool:
+    return (has_request_context() and request.method in ('GET', 'HEAD')
+            and not g.get('db_use_primary', False))
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends plain reads in GET/HEAD requests to the 'read' bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and READ_BIND in self._db.engines
+                and (clause is None or isinstance(clause, Select)) and _reads_routed()):
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,471 @@
+"""
+Deterministic synthetic datasets for load tests and benchmarks
+
+setup_database.py and seed_enhanced.py used to add a handful of doctors
+and patients, and 8x7 availability slots per doctor, one ORM object at a
+time. generate() builds datasets of any size instead: thousands of
+doctors, millions of patients, and the appointments, call logs, follow-ups
+and usage buckets that go with them. Rows are built as plain dicts with
+pre-assigned ids and inserted set-based (executemany per chunk of
+CHUNK_ROWS), so nothing is read back and no ORM object is created.
+
+Everything comes from one random.Random(seed) and the anchor date, so the
+same parameters always produce the same database. The data is skewed the
+way real traffic is:
+
+  specialties   weighted (General Medicine ~30%, Nephrology ~1%)
+  doctors       Zipf-like popularity; popular doctors get most bookings
+                and their slots fill first
+  time slots    late-morning and early-evening peaks, post-lunch dip
+  patients      a minority of repeat patients hold most appointments
+  calls         ~70% of appointments were booked by a voice call; past
+                confirmed ones also had a WhatsApp and a voice reminder
+
+Bulk inserts bypass the ORM flush hooks, so the dashboard counters are
+rebuilt afterwards. The usage_daily buckets are written directly.
+
+Usage:
+    python synthetic_data.py --doctors 2000 --patients 1000000 --appointments 2000000 --reset
+    python synthetic_data.py --reset --demo --doctors 0 --patients 0 --appointments 0   # demo data only
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, List
+from sqlalchemy import Boolean, Date, DateTime, func, insert
+from werkzeug.security import generate_password_hash
+from models import db, Doctor, Patient, Appointment, CallLog, DoctorAvailability, FollowUpCall
+import usage
+
+CHUNK_ROWS = 20000
+CALL_ID_BASE = 900_000_000  # synthetic call ids stay clear of real Dinodial ids
+DEMO_PASSWORD = 'password123'
+
+TIME_SLOTS = ['9:00 AM', '10:00 AM', '11:00 AM', '12:00 PM', '2:00 PM', '3:00 PM', '4:00 PM', '5:00 PM']
+SLOT_DEMAND = [8, 14, 18, 12, 6, 8, 13, 17]  # relative demand per slot
+
+# (specialty, share weight, consultation fee)
+SPECIALTIES = [
+    ('General Medicine', 30, 500.0), ('Pediatrics', 14, 600.0), ('Gynecology', 10, 800.0),
+    ('Orthopedics', 9, 800.0), ('Dermatology', 8, 700.0), ('Cardiology', 7, 1000.0),
+    ('ENT', 6, 600.0), ('Ophthalmology', 5, 700.0), ('Psychiatry', 4, 1200.0),
+    ('Neurology', 3, 1200.0), ('Gastroenterology', 2, 1000.0), ('Endocrinology', 1, 900.0),
+    ('Nephrology', 1, 1100.0),
+]
+SHIFTS = [
+    ('Monday,Tuesday,Wednesday,Thursday,Friday', '9:00 AM - 5:00 PM'),
+    ('Monday,Wednesday,Friday', '10:00 AM - 4:00 PM'),
+    ('Tuesday,Thursday,Saturday', '9:00 AM - 3:00 PM'),
+    ('Monday,Tuesday,Thursday,Friday', '11:00 AM - 6:00 PM'),
+    ('Wednesday,Thursday,Friday,Saturday', '10:00 AM - 5:00 PM'),
+]
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Arjun', 'Sai', 'Rohan', 'Karan', 'Rahul', 'Vikram', 'Sujit',
+               'Ananya', 'Diya', 'Priya', 'Meera', 'Anjali', 'Kavya', 'Isha', 'Neha', 'Pooja', 'Sneha',
+               'Amit', 'Ravi', 'Suresh', 'Deepak', 'Manoj', 'Lakshmi', 'Sunita', 'Geeta', 'Fatima', 'Imran']
+LAST_NAMES = ['Sharma', 'Verma', 'Kumar', 'Singh', 'Patel', 'Reddy', 'Nair', 'Iyer', 'Mehta', 'Gupta',
+              'Rao', 'Das', 'Joshi', 'Kulkarni', 'Menon', 'Chopra', 'Bose', 'Khan', 'Pillai', 'Desai']
+CITIES = ['Bangalore', 'Mumbai', 'Delhi', 'Chennai', 'Hyderabad', 'Pune', 'Kolkata', 'Ahmedabad']
+VAD_ENGINES = ('CAWL', 'VALDOR', 'KAAN')
+
+DEMO_DOCTORS = [
+    {'name': 'Dr. Raj Kumar', 'specialty': 'General Medicine', 'phone': '+919876543210',
+     'email': 'rajkumar@hospital.com', 'clinic_name': 'City General Hospital',
+     'available_days': 'Monday,Tuesday,Wednesday,Thursday,Friday', 'available_time': '9:00 AM - 5:00 PM',
+     'consultation_fee': 500.0},
+    {'name': 'Dr. Priya Sharma', 'specialty': 'Pediatrics', 'phone': '+919876543211',
+     'email': 'priya@hospital.com', 'clinic_name': 'Children Health Center',
+     'available_days': 'Monday,Wednesday,Friday', 'available_time': '10:00 AM - 4:00 PM',
+     'consultation_fee': 600.0},
+    {'name': 'Dr. Arun Nair', 'specialty': 'Cardiology', 'phone': '+919876543212',
+     'email': 'arun@hospital.com', 'clinic_name': 'Heart Care Clinic',
+     'available_days': 'Tuesday,Thursday,Saturday', 'available_time': '9:00 AM - 3:00 PM',
+     'consultation_fee': 1000.0},
+    {'name': 'Dr. Sujit Reddy', 'specialty': 'Dermatology', 'phone': '+919876543213',
+     'email': 'sujit@hospital.com', 'clinic_name': 'Skin & Hair Clinic',
+     'available_days': 'Monday,Tuesday,Thursday,Friday', 'available_time': '11:00 AM - 6:00 PM',
+     'consultation_fee': 700.0},
+    {'name': 'Dr. Meera Patel', 'specialty': 'Orthopedics', 'phone': '+919876543214',
+     'email': 'meera@hospital.com', 'clinic_name': 'Bone & Joint Care',
+     'available_days': 'Wednesday,Thursday,Friday,Saturday', 'available_time': '10:00 AM - 5:00 PM',
+     'consultation_fee': 800.0},
+]
+DEMO_PATIENTS = [
+    {'name': 'Rahul Verma', 'phone': '+918098444187', 'email': 'rahul@example.com',
+     'age': 35, 'gender': 'Male', 'address': '123, MG Road, Bangalore'},
+    {'name': 'Anjali Mehta', 'phone': '+919988776655', 'email': 'anjali@example.com',
+     'age': 28, 'gender': 'Female', 'address': '45, Park Street, Mumbai'},
+    {'name': 'Vikram Singh', 'phone': '+919876543210', 'email': 'vikram@example.com',
+     'age': 42, 'gender': 'Male', 'address': '78, Khan Market, Delhi'},
+]
+
+def _sqlite_converter(column, dialect):
+    """Value -> what SQLAlchemy would store on SQLite, or None when no conversion is needed"""
+    # Same text formats as SQLAlchemy's SQLite DATE/DATETIME, without its per-value %-formatting
+    if isinstance(column.type, DateTime):
+        return lambda v: None if v is None else v.isoformat(' ', 'microseconds')
+    if isinstance(column.type, Date):
+        return lambda v: None if v is None else v.isoformat()
+    if isinstance(column.type, Boolean):
+        return None  # sqlite3 stores bool as 0/1
+    return column.type._cached_bind_processor(dialect)
+
+def _sqlite_writer(model, columns: List[str]):
+    """executemany on the raw DB-API cursor with values converted as SQLAlchemy would"""
+    connection = db.session.connection()
+    table = model.__table__
+    converters = [(i, convert) for i, convert in
+                  enumerate(_sqlite_converter(table.c[name], connection.dialect) for name in columns) if convert]
+    values_of = itemgetter(*columns)
+    sql = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    cursor = connection.connection.cursor()
+
+    def write(batch):
+        params = []
+        for row in batch:
+            values = list(values_of(row)) if len(columns) > 1 else [values_of(row)]
+            for i, convert in converters:
+                values[i] = convert(values[i])
+            params.append(values)
+        cursor.executemany(sql, params)
+    return write
+
+def bulk_insert(model, rows: Iterable[dict], chunk: int = CHUNK_ROWS) -> int:
+    """
+    Set-based INSERT of dict rows (all with the same keys) in chunks, inside
+    the current transaction. On SQLite the rows skip SQLAlchemy's per-row
+    parameter handling and go straight to executemany; elsewhere a Core
+    insert (multi-row VALUES on Postgres) is used.
+    """
+    write = None
+    count = 0
+    batch = []
+
+    def flush():
+        nonlocal write
+        if write is None:
+            if db.session.connection().dialect.name == 'sqlite':
+                write = _sqlite_writer(model, list(batch[0]))
+            else:
+                statement = insert(model.__table__)
+                write = lambda rows: db.session.execute(statement, rows)
+        write(batch)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            flush()
+            count += len(batch)
+            batch = []
+    if batch:
+        flush()
+        count += len(batch)
+    return count
+
+def _next_id(model) -> int:
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def _randint(rng: random.Random, low: int, high: int) -> int:
+    """rng.randint without its argument checks (hot loops)"""
+    return low + int(rng.random() * (high - low + 1))
+
+def _cumulative(weights: List[float]) -> List[float]:
+    total, result = 0.0, []
+    for w in weights:
+        total += w
+        result.append(total)
+    return result
+
+def slot_rows(doctor_ids: Iterable[int], start: date, days: int, booked=None) -> Iterable[dict]:
+    """Availability slots for each doctor and day; booked(doctor_id, slot_index) -> bool (default free)"""
+    created_at = datetime.combine(start, datetime.min.time())
+    for doctor_id in doctor_ids:
+        for day_offset in range(days):
+            slot_date = start + timedelta(days=day_offset)
+            for index, time_slot in enumerate(TIME_SLOTS):
+                taken = bool(booked and booked(doctor_id, index))
+                yield {'doctor_id': doctor_id, 'date': slot_date, 'time_slot': time_slot,
+                       'is_booked': taken, 'max_patients': 1, 'booked_count': int(taken),
+                       'created_at': created_at}
+
+def insert_demo_data(slot_days: int = 7) -> List[dict]:
+    """The demo doctors (password123), their free slots and sample patients; returns the doctors"""
+    password = generate_password_hash(DEMO_PASSWORD)
+    now = datetime.utcnow()
+    first_id = _next_id(Doctor)
+    doctors = [{**doc, 'id': first_id + i, 'password': password, 'is_available': True, 'created_at': now}
+               for i, doc in enumerate(DEMO_DOCTORS)]
+    bulk_insert(Doctor, doctors)
+    bulk_insert(DoctorAvailability, slot_rows([d['id'] for d in doctors], date.today(), slot_days))
+    bulk_insert(Patient, [{**p, 'created_at': now} for p in DEMO_PATIENTS])
+    db.session.commit()
+    return doctors
+
+class SyntheticDataset:
+    """Parameters of one reproducible dataset; generate() writes it"""
+
+    def __init__(self, doctors=200, patients=20000, appointments=50000, slot_days=14, history_days=90,
+                 seed=42, anchor=None, call_share=0.7):
+        self.doctors = doctors
+        self.patients = patients
+        self.appointments = appointments  # past appointments; future ones come from booked slots
+        self.slot_days = slot_days
+        self.history_days = history_days
+        self.seed = seed
+        self.anchor = anchor or date.today()
+        self.call_share = call_share
+        self.rng = random.Random(seed)
+        self.usage = defaultdict(lambda: dict.fromkeys(('calls', 'booked') + usage.Usage._fields, 0))
+        self.counts = {}
+
+    # ---------- entities ----------
+
+    def _doctor_rows(self, first_id: int) -> Iterable[dict]:
+        rng = self.rng
+        password = generate_password_hash(DEMO_PASSWORD)  # one hash for every synthetic doctor
+        specialty_cw = _cumulative([w for _, w, _ in SPECIALTIES])
+        created_at = datetime.combine(self.anchor - timedelta(days=self.history_days + 30), datetime.min.time())
+        for i in range(self.doctors):
+            doctor_id = first_id + i
+            specialty, _, fee = rng.choices(SPECIALTIES, cum_weights=specialty_cw)[0]
+            days, hours = rng.choice(SHIFTS)
+            yield {
+                'id': doctor_id,
+                'name': f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                'specialty': specialty,
+                'phone': f"+9170{doctor_id:08d}",
+                'email': f"doctor{doctor_id}@synthetic.hospital",
+                'password': password,
+                'clinic_name': f"{rng.choice(LAST_NAMES)} {specialty} Clinic",
+                'available_days': days,
+                'available_time': hours,
+                'consultation_fee': fee,
+                'is_available': rng.random() < 0.95,
+                'created_at': created_at,
+            }
+
+    def _patient_rows(self, first_id: int) -> Iterable[dict]:
+        rng = self.rng
+        created_at = datetime.combine(self.anchor - timedelta(days=self.history_days), datetime.min.time())
+        for i in range(self.patients):
+            patient_id = first_id + i
+            yield {
+                'id': patient_id,
+                'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                'phone': f"+9180{patient_id:08d}",
+                'age': int(rng.triangular(1, 90, 34)),
+                'gender': 'Female' if rng.random() < 0.52 else 'Male',
+                'address': f"{_randint(rng, 1, 400)}, {rng.choice(CITIES)}",
+                'created_at': created_at,
+            }
+
+    # ---------- appointments and calls ----------
+
+    def _pick_patient(self) -> int:
+        # Power-law: a minority of repeat patients hold most appointments
+        return self.first_patient + int(self.patients * self.rng.random() ** 2.5)
+
+    def _call_usage(self, duration: int):
+        rng = self.rng
+        prompt_audio = duration * 25 // 3  # the caller speaks about a third of the call, 25 tokens/s
+        response_audio = duration * 25 // 4
+        prompt = int(rng.gauss(5300, 250)) + prompt_audio
+        response = response_audio + _randint(rng, 0, 40)
+        return prompt, response, prompt_audio, response_audio
+
+    def _appointment(self, appointment_id: int, doctor_id: int, day: date, slot_index: int, slot_id: int = None):
+        """One appointment and its call logs / follow-ups as (appointment, [call logs], [follow-ups])"""
+        rng = self.rng
+        past = day < self.anchor
+        if past:
+            roll = rng.random()
+            status = 'completed' if roll < 0.8 else 'cancelled' if roll < 0.92 else 'no_show'
+        else:
+            status = 'confirmed' if rng.random() < 0.75 else 'scheduled'
+        lead = timedelta(days=_randint(rng, 0, 14), hours=_randint(rng, 8, 20), minutes=_randint(rng, 0, 59))
+        created_at = datetime.combine(day, datetime.min.time()) - lead
+        appointment = {
+            'id': appointment_id, 'patient_id': self._pick_patient(), 'doctor_id': doctor_id, 'slot_id': slot_id,
+            'appointment_date': day, 'appointment_time': TIME_SLOTS[slot_index], 'status': status,
+            'confirmation_number': f"APT-{appointment_id}-{rng.getrandbits(32):08X}",
+            'call_id': None, 'call_status': None, 'created_at': created_at, 'updated_at': created_at,
+        }
+        calls, followups = [], []
+        if rng.random() < self.call_share:
+            booked = status != 'cancelled'
+            appointment['call_id'] = str(CALL_ID_BASE + appointment_id)
+            appointment['call_status'] = 'completed'
+            calls.append(self._call_log(appointment, created_at, 'booking', booked))
+            if booked:
+                for hours, kind in ((1, 'whatsapp'), (2, 'call')):
+                    scheduled = created_at + timedelta(hours=hours)
+                    done = scheduled < datetime.combine(self.anchor, datetime.min.time())
+                    followups.append({'appointment_id': appointment_id, 'scheduled_time': scheduled,
+                                      'type': kind, 'status': 'completed' if done else 'pending',
+                                      'created_at': created_at})
+                    if kind == 'call' and done:
+                        calls.append(self._call_log(appointment, scheduled, 'reminder', False))
+        return appointment, calls, followups
+
+    def _call_log(self, appointment: dict, created_at: datetime, call_type: str, booked: bool) -> dict:
+        rng = self.rng
+        duration = int(rng.lognormvariate(4.3, 0.5)) if call_type == 'booking' else _randint(rng, 20, 60)
+        prompt, response, prompt_audio, response_audio = self._call_usage(duration)
+        cost = usage.cost_of(prompt, response, prompt_audio, response_audio)
+        bucket = self.usage[(created_at.date(), call_type)]
+        for name, value in (('calls', 1), ('booked', int(booked)), ('prompt_tokens', prompt),
+                            ('response_tokens', response), ('prompt_audio_tokens', prompt_audio),
+                            ('response_audio_tokens', response_audio), ('cost_usd', cost)):
+            bucket[name] += value
+        # At most one booking and one reminder call per appointment
+        offset = 0 if call_type == 'booking' else 500_000_000
+        call_id = str(CALL_ID_BASE + offset + appointment['id'])
+        return {
+            'call_id': call_id, 'phone_number': self.patient_phone(appointment['patient_id']),
+            'appointment_id': appointment['id'], 'status': 'completed', 'duration': duration,
+            'vad_engine': rng.choice(VAD_ENGINES), 'call_type': call_type,
+            'evaluation_result': {'booked': booked} if call_type == 'booking' else {},
+            'prompt_tokens': prompt, 'response_tokens': response, 'prompt_audio_tokens': prompt_audio,
+            'response_audio_tokens': response_audio, 'cost_usd': cost,
+            'created_at': created_at, 'completed_at': created_at + timedelta(seconds=duration),
+        }
+
+    @staticmethod
+    def patient_phone(patient_id: int) -> str:
+        return f"+9180{patient_id:08d}"
+
+    def _appointment_stream(self, doctor_cw: List[float], doctor_ids: List[int], booked_slots: List[tuple]):
+        """(past appointments by popularity, then one per booked future slot), each with calls/follow-ups"""
+        rng = self.rng
+        slot_cw = _cumulative(SLOT_DEMAND)
+        slot_indexes = range(len(TIME_SLOTS))
+        appointment_id = self.first_appointment
+        for _ in range(self.appointments if self.patients else 0):
+            doctor_id = rng.choices(doctor_ids, cum_weights=doctor_cw)[0]
+            day = self.anchor - timedelta(days=_randint(rng, 1, self.history_days))
+            slot_index = rng.choices(slot_indexes, cum_weights=slot_cw)[0]
+            yield self._appointment(appointment_id, doctor_id, day, slot_index)
+            appointment_id += 1
+        for slot_id, doctor_id, day, slot_index in booked_slots if self.patients else ():
+            yield self._appointment(appointment_id, doctor_id, day, slot_index, slot_id)
+            appointment_id += 1
+
+    def generate(self) -> Dict[str, int]:
+        """Insert the dataset into the current database (inside an app context) and commit"""
+        rng = self.rng
+        first_doctor = _next_id(Doctor)
+        self.first_patient = _next_id(Patient)
+        self.first_appointment = _next_id(Appointment)
+
+        self.counts['doctors'] = bulk_insert(Doctor, self._doctor_rows(first_doctor))
+        self.counts['patients'] = bulk_insert(Patient, self._patient_rows(self.first_patient))
+
+        if not self.doctors:
+            self.counts.update(slots=0, appointments=0, call_logs=0, followups=0, usage_buckets=0)
+            db.session.commit()
+            return dict(self.counts)
+
+        # Zipf-like popularity over a shuffled doctor order
+        doctor_ids = list(range(first_doctor, first_doctor + self.doctors))
+        ranked = doctor_ids[:]
+        rng.shuffle(ranked)
+        popularity = {doctor_id: 1 / (rank + 1) ** 0.8 for rank, doctor_id in enumerate(ranked)}
+        doctor_cw = _cumulative([popularity[d] for d in doctor_ids])
+        top = max(popularity.values())
+        demand_top = max(SLOT_DEMAND)
+
+        # A slot fills with probability rising with the doctor's popularity and the slot's demand
+        booked_slots = []
+        def booked(doctor_id, slot_index):
+            p = 0.15 + 0.8 * (popularity[doctor_id] / top) ** 0.5 * SLOT_DEMAND[slot_index] / demand_top
+            return rng.random() < p
+        def slots():
+            # Explicit ids so each future appointment can record the slot it holds
+            for slot_id, row in enumerate(slot_rows(doctor_ids, self.anchor, self.slot_days, booked),
+                                          _next_id(DoctorAvailability)):
+                row['id'] = slot_id
+                if row['is_booked']:
+                    booked_slots.append((slot_id, row['doctor_id'], row['date'], TIME_SLOTS.index(row['time_slot'])))
+                yield row
+        self.counts['slots'] = bulk_insert(DoctorAvailability, slots())
+
+        appointments, calls, followups = [], [], []
+        self.counts.update(appointments=0, call_logs=0, followups=0)
+        def flush():
+            self.counts['appointments'] += bulk_insert(Appointment, appointments)
+            self.counts['call_logs'] += bulk_insert(CallLog, calls)
+            self.counts['followups'] += bulk_insert(FollowUpCall, followups)
+            appointments.clear()
+            calls.clear()
+            followups.clear()
+        for appointment, call_rows, followup_rows in self._appointment_stream(doctor_cw, doctor_ids, booked_slots):
+            appointments.append(appointment)
+            calls.extend(call_rows)
+            followups.extend(followup_rows)
+            if len(appointments) >= CHUNK_ROWS:
+                flush()
+        flush()
+
+        self._merge_usage()
+        db.session.commit()
+        return dict(self.counts)
+
+    def _merge_usage(self):
+        """Add this dataset's usage buckets to usage_daily"""
+        connection = db.session.connection()
+        statement = usage._upsert_statement(connection.dialect.name)
+        rows = [{'day': day, 'call_type': call_type, **values} for (day, call_type), values in sorted(self.usage.items())]
+        for start in range(0, len(rows), CHUNK_ROWS):
+            connection.execute(statement, rows[start:start + CHUNK_ROWS])
+        self.counts['usage_buckets'] = len(rows)
+
+def reset_database():
+    """Drop and recreate every table (all data is lost)"""
+    from migrations import migrate
+    db.drop_all()
+    migrate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a reproducible synthetic hospital dataset')
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=50000, help='past appointments (future ones fill booked slots)')
+    parser.add_argument('--slot-days', type=int, default=14, help='days of availability slots from the anchor date')
+    parser.add_argument('--history-days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', type=date.fromisoformat, help='"today" of the dataset (default: today)')
+    parser.add_argument('--database', help='SQLite file (default: the app database, or DATABASE_URL)')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    parser.add_argument('--demo', action='store_true', help='also insert the demo doctors and patients')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    import storage
+    from counters import reconcile_counters
+
+    app = Flask(__name__)
+    storage.init_app(app, db, sqlite_path=os.path.abspath(args.database) if args.database else None)
+    with app.app_context():
+        if args.reset:
+            reset_database()
+        else:
+            from migrations import migrate
+            migrate()
+        if args.demo:
+            insert_demo_data()
+        started = time.perf_counter()
+        dataset = SyntheticDataset(args.doctors, args.patients, args.appointments, args.slot_days,
+                                   args.history_days, args.seed, args.anchor)
+        counts = dataset.generate()
+        elapsed = time.perf_counter() - started
+        reconcile_counters()
+    total = sum(v for k, v in counts.items() if k != 'usage_buckets')
+    print(', '.join(f"{v:,} {k}" for k, v in counts.items()))
+    print(f"{total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s), seed {args.seed}")
+
+if __name__ == '__main__':
+    sys.exit(main())
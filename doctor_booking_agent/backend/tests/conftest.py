@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Flask app on a throwaway SQLite file with the full schema"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def sql_writes(app):
+    """Non-SELECT statements executed during the test"""
+    from sqlalchemy import event
+    writes = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith('SELECT'):
+            writes.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    yield writes
+    event.remove(db.engine, 'before_cursor_execute', on_execute)
@@ -0,0 +1,88 @@
+from models import db
+import call_reconciler
+
+
+def test_lease_is_exclusive_until_released(app):
+    lease = call_reconciler.acquire_lease(60)
+    assert lease is not None
+    assert call_reconciler.acquire_lease(60) is None
+
+    call_reconciler.release_lease(lease)
+    assert call_reconciler.acquire_lease(60) is not None
+
+
+def test_expired_lease_can_be_taken(app):
+    assert call_reconciler.acquire_lease(-1) is not None
+    assert call_reconciler.acquire_lease(60) is not None
+
+
+def test_cycle_is_skipped_while_another_process_holds_the_lease(app):
+    listed = []
+    reconciler = call_reconciler.CallReconciler(
+        list_page=lambda page: listed.append(page) or {'status': 'success', 'data': []},
+        sync=lambda call_ids: [])
+
+    held = call_reconciler.acquire_lease(60)
+    assert 'skipped' in reconciler.run_once()
+    assert listed == []
+
+    call_reconciler.release_lease(held)
+    assert reconciler.run_once()['scanned'] == 0
+    assert listed == [1]
+    assert call_reconciler.acquire_lease(60) is not None  # released after the cycle
+
+
+def paged_calls(ids, page_size):
+    """A newest-first call list served page by page"""
+    ids = sorted(ids, reverse=True)
+
+    def list_page(page):
+        chunk = ids[(page - 1) * page_size:page * page_size]
+        return {'status': 'success', 'data': {
+            'results': [{'id': call_id, 'status': 'completed'} for call_id in chunk],
+            'next': page * page_size < len(ids)}}
+    return list_page
+
+
+def test_unreached_watermark_advances_past_the_scanned_pages(app):
+    listed = []
+    list_page = paged_calls(range(1, 101), page_size=10)
+    reconciler = call_reconciler.CallReconciler(
+        list_page=lambda page: listed.append(page) or list_page(page),
+        sync=lambda call_ids: [{'call_id': c, 'status': 'success'} for c in call_ids],
+        max_pages=3)
+
+    assert reconciler.run_once()['watermark'] == 100
+    assert call_reconciler.read_watermark() == 100
+
+    listed.clear()
+    assert reconciler.run_once()['scanned'] == 0
+    assert listed == [1]  # the next cycle reaches the watermark on the first page
+
+
+def test_watermark_and_lease_leave_dashboard_counters_alone(app):
+    from counters import compute_counters, reconcile_counters
+    from models import DashboardCounter
+
+    reconcile_counters()
+    lease = call_reconciler.acquire_lease(60)
+    call_reconciler.raise_watermark(42)
+    db.session.commit()
+
+    assert reconcile_counters() == {}
+    assert {row.name for row in DashboardCounter.query} == set(compute_counters())
+    assert call_reconciler.read_watermark() == 42
+    assert call_reconciler.acquire_lease(60) is None
+    call_reconciler.release_lease(lease)
+
+
+def test_migration_moves_watermark_out_of_dashboard_counters(app):
+    from migrations import migrate
+    from models import DashboardCounter
+    db.session.add_all([DashboardCounter(name='call_sync_watermark', value=7),
+                        DashboardCounter(name='call_reconciler_lease', value=0)])
+    db.session.commit()
+
+    assert 4 in migrate()
+    assert call_reconciler.read_watermark() == 7
+    assert not DashboardCounter.query.filter(DashboardCounter.name.like('call_%')).count()
@@ -0,0 +1,35 @@
+from models import db, Doctor, FollowUpCall, OutboxMessage
+import call_sync
+
+
+def booked_call_detail(phone='+919800000001'):
+    return {'status': 'success', 'data': {
+        'phone_number': phone,
+        'status': 'completed',
+        'duration': 90,
+        'evaluation_result': {'booked': True, 'name': 'Asha Rao', 'specialty': 'Cardiology', 'time': '10:00 AM'},
+        'call_details': {'usageMetadata': {'promptTokenCount': 1000, 'responseTokenCount': 400}},
+    }}
+
+
+def test_resync_of_booked_call_confirms_once(app):
+    db.session.add(Doctor(name='Dr. Mehta', specialty='Cardiology', phone='+917000000001'))
+    db.session.commit()
+
+    for _ in range(2):
+        report = call_sync.sync_call_details({'255': booked_call_detail()})
+        assert report.results[0]['status'] == 'success'
+
+    confirmations = OutboxMessage.query.filter_by(kind='confirmation').all()
+    assert sorted(m.channel for m in confirmations) == ['sms', 'whatsapp']
+    assert sorted(f.type for f in FollowUpCall.query.all()) == ['call', 'whatsapp']
+
+
+def test_resync_reports_no_new_followups(app):
+    db.session.add(Doctor(name='Dr. Mehta', specialty='Cardiology', phone='+917000000001'))
+    db.session.commit()
+
+    first = call_sync.sync_call_details({'255': booked_call_detail()})
+    second = call_sync.sync_call_details({'255': booked_call_detail()})
+    assert len(first.followups) == 2
+    assert second.followups == []
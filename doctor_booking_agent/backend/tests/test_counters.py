@@ -0,0 +1,40 @@
+from datetime import date
+
+from models import db, Appointment, Doctor, Patient
+from counters import compute_counters, read_counters, reconcile_counters
+
+
+def add_appointment(status):
+    patient = Patient(name='Asha Rao', phone='+919800000001')
+    doctor = Doctor(name='Dr. Mehta', specialty='Cardiology', phone='+917000000001')
+    db.session.add_all([patient, doctor])
+    db.session.flush()
+    appointment = Appointment(patient_id=patient.id, doctor_id=doctor.id, appointment_date=date(2030, 1, 7),
+                              appointment_time='10:00 AM', status=status)
+    db.session.add(appointment)
+    db.session.commit()  # expires every attribute: the old status is no longer loaded
+    return appointment
+
+
+def test_status_change_on_expired_row_moves_the_old_status(app):
+    appointment = add_appointment('confirmed')
+    reconcile_counters()
+
+    appointment.status = 'cancelled'
+    db.session.commit()
+
+    counters = read_counters(['status:confirmed', 'status:cancelled', 'status:scheduled'])
+    assert counters == {'status:confirmed': 0, 'status:cancelled': 1, 'status:scheduled': 0}
+    assert reconcile_counters() == {}
+
+
+def test_date_change_on_expired_row_moves_the_old_date(app):
+    appointment = add_appointment('scheduled')
+    reconcile_counters()
+
+    appointment.appointment_date = date(2030, 1, 8)
+    db.session.commit()
+
+    assert read_counters(['appointments_on:2030-01-07'])['appointments_on:2030-01-07'] == 0
+    assert reconcile_counters() == {}
+    assert compute_counters()['appointments_on:2030-01-08'] == 1
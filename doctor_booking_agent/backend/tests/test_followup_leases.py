@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from models import db, CallLog, FollowUpCall
+import followup_leases
+
+
+def add_due_followup():
+    followup = FollowUpCall(appointment_id=1, scheduled_time=datetime.utcnow() - timedelta(minutes=1), type='call')
+    db.session.add(followup)
+    db.session.commit()
+    return followup.id
+
+
+def expire_lease(followup_id):
+    db.session.query(FollowUpCall).filter_by(id=followup_id).update(
+        {'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def test_expired_lease_cannot_finish_after_reclaim(app):
+    followup_id = add_due_followup()
+    first, claimed = followup_leases.claim_due(worker_id='a')
+    assert [row.id for row in claimed] == [followup_id]
+
+    expire_lease(followup_id)  # the first worker's job outlived LEASE_SECONDS
+    second, claimed = followup_leases.claim_due(worker_id='b')
+    assert [row.id for row in claimed] == [followup_id]
+
+    db.session.add(CallLog(call_id='late', phone_number='+919800000001', call_type='reminder'))
+    assert not followup_leases.finish(followup_id, first, 'completed')
+    assert CallLog.query.count() == 0  # the late worker's rows are rolled back with it
+
+    assert followup_leases.finish(followup_id, second, 'completed')
+    assert db.session.get(FollowUpCall, followup_id).status == 'completed'
+
+
+def test_expired_lease_is_neither_renewed_nor_deferred(app):
+    followup_id = add_due_followup()
+    token, _ = followup_leases.claim_due(worker_id='a')
+    assert followup_leases.renew(followup_id, token)
+
+    expire_lease(followup_id)
+    assert not followup_leases.renew(followup_id, token)
+    assert not followup_leases.defer(followup_id, token, 60)
+    assert db.session.get(FollowUpCall, followup_id).status == 'pending'
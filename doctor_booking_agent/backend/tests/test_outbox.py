@@ -0,0 +1,63 @@
+from twilio.request_validator import RequestValidator
+
+from models import db, OutboxMessage, OutboxStatusCallback
+import outbox
+
+
+class FakeMessages:
+    def __init__(self):
+        self.sent = []
+
+    def create(self, **kwargs):
+        self.sent.append(kwargs)
+        return type('Message', (), {'sid': f'SM{len(self.sent):032d}'})()
+
+
+def sender_with_fake_client(app):
+    sender = outbox.OutboxSender(app, workers=0)
+    sender._client = type('Client', (), {'messages': FakeMessages()})()
+    return sender
+
+
+def test_idle_claim_does_not_write(app, sql_writes):
+    token, claimed = outbox.claim()
+    assert claimed == []
+    assert sql_writes == []
+
+
+def test_whatsapp_goes_to_the_real_recipient_by_default(app, monkeypatch):
+    monkeypatch.setattr(outbox, 'SMS_FROM', None)
+    outbox.enqueue_confirmation('+919800000001', {
+        'patient_name': 'Asha', 'doctor_name': 'Dr. Mehta', 'specialty': 'Cardiology',
+        'date': '2026-10-20', 'time': '10:00 AM', 'confirmation': 'APT-1'})
+    db.session.commit()
+    sender = sender_with_fake_client(app)
+    assert sender.drain_once() == 2
+
+    assert [m['to'] for m in sender.client.messages.sent] == ['whatsapp:+919800000001']
+    sms = OutboxMessage.query.filter_by(channel='sms').one()
+    assert sms.status == 'failed' and 'TWILIO_SMS_FROM' in sms.last_error
+
+
+def test_early_status_callback_is_applied_when_the_sid_is_recorded(app):
+    outbox.enqueue('whatsapp', '+919800000001', 'hello')
+    db.session.commit()
+    sid = f'SM{1:032d}'
+    assert outbox.record_delivery_status(sid, 'delivered') is False
+    assert OutboxStatusCallback.query.count() == 1
+
+    sender_with_fake_client(app).drain_once()
+    message = OutboxMessage.query.one()
+    assert (message.provider_sid, message.status) == (sid, 'delivered')
+    assert OutboxStatusCallback.query.count() == 0
+
+
+def test_twilio_signature_is_checked(app, monkeypatch):
+    url, params = 'https://example.test/api/webhook/twilio-status', {'MessageSid': 'SM1', 'MessageStatus': 'sent'}
+    monkeypatch.delenv('TWILIO_AUTH_TOKEN', raising=False)
+    assert not outbox.valid_twilio_signature(url, params, 'anything')
+
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'secret')
+    signature = RequestValidator('secret').compute_signature(url, params)
+    assert outbox.valid_twilio_signature(url, params, signature)
+    assert not outbox.valid_twilio_signature(url, {**params, 'MessageStatus': 'read'}, signature)
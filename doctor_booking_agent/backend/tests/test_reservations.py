@@ -0,0 +1,56 @@
+from datetime import date
+
+from models import db, Appointment, Doctor, DoctorAvailability, Patient
+from migrations import migrate
+from reservations import SlotReservations
+from synthetic_data import SyntheticDataset
+
+
+def add_slot(time_slot='10:00 AM', is_booked=False, booked_count=0, max_patients=1):
+    doctor = Doctor.query.first()
+    if doctor is None:
+        doctor = Doctor(name='Dr. Mehta', specialty='Cardiology', phone='+917000000001')
+        db.session.add(doctor)
+        db.session.flush()
+    slot = DoctorAvailability(doctor_id=doctor.id, date=date(2030, 1, 7), time_slot=time_slot,
+                              is_booked=is_booked, booked_count=booked_count, max_patients=max_patients)
+    db.session.add(slot)
+    db.session.commit()
+    return slot.id
+
+
+def test_migration_backfills_booked_count_of_legacy_booked_slots(app):
+    legacy = add_slot(is_booked=True, booked_count=0)
+    free = add_slot('11:00 AM')
+
+    assert 3 in migrate()
+
+    assert db.session.get(DoctorAvailability, legacy).booked_count == 1
+    assert db.session.get(DoctorAvailability, free).booked_count == 0
+    assert not SlotReservations().reserve(legacy).ok
+
+
+def test_release_gives_back_only_the_reserved_place(app):
+    reservations = SlotReservations()
+    slot_id = add_slot(max_patients=2)
+    assert reservations.reserve(slot_id).ok
+    db.session.commit()
+
+    assert reservations.release(slot_id)
+    assert not reservations.release(slot_id)  # nothing left to give back
+    db.session.commit()
+    assert db.session.get(DoctorAvailability, slot_id).booked_count == 0
+
+
+def test_synthetic_future_appointments_hold_their_slot(app):
+    SyntheticDataset(doctors=3, patients=20, appointments=10, slot_days=2, seed=7).generate()
+
+    future = Appointment.query.filter(Appointment.appointment_date >= date.today()).all()
+    assert future
+    for appointment in future:
+        slot = db.session.get(DoctorAvailability, appointment.slot_id)
+        assert (slot.doctor_id, slot.date, slot.time_slot, slot.is_booked) == (
+            appointment.doctor_id, appointment.appointment_date, appointment.appointment_time, True)
+    assert not Appointment.query.filter(Appointment.appointment_date < date.today(),
+                                        Appointment.slot_id.isnot(None)).count()
+    assert Patient.query.count() == 20
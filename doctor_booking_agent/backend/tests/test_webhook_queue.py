@@ -0,0 +1,16 @@
+import webhook_queue
+
+
+def test_idle_claim_does_not_write(app, sql_writes):
+    token, claimed = webhook_queue.claim()
+    assert claimed == []
+    assert sql_writes == []
+
+
+def test_claim_leases_due_events(app):
+    assert webhook_queue.enqueue('255', {'call_id': '255'})
+    assert not webhook_queue.enqueue('255', {'call_id': '255'})  # duplicate delivery
+    token, claimed = webhook_queue.claim()
+    assert [call_id for _, call_id, _ in claimed] == ['255']
+    assert webhook_queue.claim()[1] == []  # leased
+    assert webhook_queue.queue_depth() == {'pending': 1}
@@ -0,0 +1,164 @@
+"""
+Token usage and cost accounting for voice calls
+
+Every Dinodial call detail carries call_details.usageMetadata: prompt and
+response token counts, each broken down by modality (TEXT/AUDIO). The sync
+path (call_sync.py) stores those counts and the derived cost on the call's
+CallLog row, and adds the same numbers to a (day, call_type) bucket in the
+usage_daily table within the same transaction. /api/stats/usage reads only
+the buckets, so cost per confirmed booking needs neither a re-fetch of call
+details nor a scan of call_logs.
+
+Re-syncing a call is idempotent: the bucket receives the difference between
+the new and the previously stored values. rebuild_usage() recomputes the
+buckets from call_logs (reconciliation only, run by the scheduler).
+
+Prices are USD per million tokens and default to the Gemini Live list
+prices; override them with the USAGE_PRICE_* variables.
+"""
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+from models import db, CallLog, UsageDaily
+
+PRICE_TEXT_IN = float(os.getenv('USAGE_PRICE_TEXT_IN', 0.50))
+PRICE_AUDIO_IN = float(os.getenv('USAGE_PRICE_AUDIO_IN', 3.00))
+PRICE_TEXT_OUT = float(os.getenv('USAGE_PRICE_TEXT_OUT', 2.00))
+PRICE_AUDIO_OUT = float(os.getenv('USAGE_PRICE_AUDIO_OUT', 12.00))
+
+TOKEN_FIELDS = ('prompt_tokens', 'response_tokens', 'prompt_audio_tokens', 'response_audio_tokens')
+Usage = namedtuple('Usage', TOKEN_FIELDS + ('cost_usd',))
+
+def _modality_count(details, modality: str) -> int:
+    return sum(d.get('tokenCount') or 0 for d in details or [] if d.get('modality') == modality)
+
+def usage_of(call_data: Dict[str, Any]) -> Optional[Usage]:
+    """Token counts and cost of a call detail, or None if it has no usageMetadata"""
+    metadata = ((call_data.get('call_details') or {}).get('usageMetadata')) or {}
+    if not metadata:
+        return None
+    prompt = metadata.get('promptTokenCount') or 0
+    response = metadata.get('responseTokenCount') or 0
+    prompt_audio = _modality_count(metadata.get('promptTokensDetails'), 'AUDIO')
+    response_audio = _modality_count(metadata.get('responseTokensDetails'), 'AUDIO')
+    return Usage(prompt, response, prompt_audio, response_audio,
+                 cost_of(prompt, response, prompt_audio, response_audio))
+
+def cost_of(prompt: int, response: int, prompt_audio: int, response_audio: int) -> float:
+    """USD cost of a call's tokens (audio counts are included in prompt/response)"""
+    cost = ((prompt - prompt_audio) * PRICE_TEXT_IN + prompt_audio * PRICE_AUDIO_IN +
+            (response - response_audio) * PRICE_TEXT_OUT + response_audio * PRICE_AUDIO_OUT) / 1_000_000
+    return round(cost, 6)
+
+def parse_created(value) -> Optional[datetime]:
+    """Dinodial's `created` timestamp (ISO 8601), or None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+def _upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT(day, call_type) DO UPDATE SET col = col + excluded.col"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = UsageDaily.__table__
+    stmt = insert(table)
+    summed = ('calls', 'booked') + TOKEN_FIELDS + ('cost_usd',)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.call_type],
+        set_={name: table.c[name] + stmt.excluded[name] for name in summed}
+    )
+
+def _bucket_day(call_log: CallLog) -> date:
+    return (call_log.created_at or datetime.utcnow()).date()
+
+def record_call_usage(call_log: CallLog, call_data: Dict[str, Any], booked: bool, was_booked: bool):
+    """
+    Store a call's usage on its CallLog and add the change to its daily
+    bucket, inside the current transaction (commits with the caller).
+    `booked`/`was_booked` are the call's booking outcome after and before
+    this sync.
+    """
+    usage = usage_of(call_data)
+    delta = {'calls': 0, 'booked': int(booked) - int(was_booked)}
+    if usage is not None:
+        first = call_log.prompt_tokens is None
+        delta['calls'] = int(first)
+        for name in Usage._fields:
+            delta[name] = getattr(usage, name) - (getattr(call_log, name) or 0)
+            setattr(call_log, name, getattr(usage, name))
+    if not any(delta.values()):
+        return
+    row = dict.fromkeys(UsageDaily.__table__.c.keys(), 0)
+    row.update(delta, day=_bucket_day(call_log), call_type=call_log.call_type or 'booking')
+    connection = db.session.connection()
+    connection.execute(_upsert_statement(connection.dialect.name), [row])
+
+def is_booked(call_log: CallLog) -> bool:
+    """Whether a call confirmed a booking (reminder calls never count)"""
+    return (call_log.call_type or 'booking') == 'booking' and \
+        (call_log.evaluation_result or {}).get('booked') == True
+
+def rebuild_usage() -> int:
+    """Recompute usage_daily from call_logs (full scan - reconciliation only); returns bucket count"""
+    buckets = {}
+    try:
+        UsageDaily.query.delete(synchronize_session=False)
+        rows = db.session.query(CallLog).filter(
+            (CallLog.prompt_tokens.isnot(None)) | (CallLog.evaluation_result.isnot(None))
+        ).yield_per(1000)
+        for call_log in rows:
+            key = (_bucket_day(call_log), call_log.call_type or 'booking')
+            bucket = buckets.setdefault(key, dict.fromkeys(('calls', 'booked') + Usage._fields, 0))
+            bucket['booked'] += int(is_booked(call_log))
+            if call_log.prompt_tokens is not None:
+                bucket['calls'] += 1
+                for name in Usage._fields:
+                    bucket[name] += getattr(call_log, name) or 0
+        db.session.add_all(UsageDaily(day=day, call_type=call_type, **values)
+                           for (day, call_type), values in buckets.items())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(buckets)
+
+def usage_rollup(start: date, end: date) -> Dict[str, Any]:
+    """Per-day, per-call-type and per-booking usage between two dates (inclusive), from the buckets"""
+    rows = UsageDaily.query.filter(UsageDaily.day >= start, UsageDaily.day <= end) \
+        .order_by(UsageDaily.day, UsageDaily.call_type).all()
+
+    def empty():
+        return dict.fromkeys(('calls', 'booked') + Usage._fields, 0)
+
+    days, by_type, totals = {}, {}, empty()
+    for row in rows:
+        day = days.setdefault(row.day.isoformat(), {})
+        day[row.call_type] = {name: getattr(row, name) for name in totals}
+        for target in (by_type.setdefault(row.call_type, empty()), totals):
+            for name in target:
+                target[name] += getattr(row, name)
+
+    for values in list(by_type.values()) + [totals] + [v for day in days.values() for v in day.values()]:
+        values['cost_usd'] = round(values['cost_usd'], 6)
+    booked = totals['booked']
+    booking_cost = by_type.get('booking', {}).get('cost_usd', 0)
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': days,
+        'call_types': by_type,
+        'totals': totals,
+        'per_booked_appointment': {
+            'booked': booked,
+            # Booking calls only, and every call including reminders
+            'booking_cost_usd': round(booking_cost / booked, 6) if booked else None,
+            'total_cost_usd': round(totals['cost_usd'] / booked, 6) if booked else None,
+            'tokens': round(sum(totals[n] for n in ('prompt_tokens', 'response_tokens')) / booked, 1) if booked else None,
+        },
+    }
@@ -0,0 +1,187 @@
+"""
+Durable queue for call-completed webhooks
+
+call_completed_webhook used to run the whole sync inline: fetch the call
+from Dinodial, write the database, send SMS/WhatsApp. Each webhook held a
+worker for as long as those upstreams took. Now the handler only inserts
+the event into the webhook_events table and acknowledges. The insert is
+deduplicated by call_id: a redelivered webhook for a queued or synced call
+is a no-op, and one for a call whose event failed re-arms it.
+
+A pool of worker threads drains the table. Only scheduler.py starts it: the
+API process just queues, so without a running scheduler events stay
+pending (the webhook_events gauge on /metrics shows the backlog).
+Events are claimed in batches with the same lease scheme as follow-ups
+(followup_leases.py), so several processes can drain one table and a
+crashed worker's events become claimable again once the lease expires.
+Each claimed batch is synced with one concurrent fetch and batched commits.
+Failures are retried with exponential backoff up to WEBHOOK_MAX_ATTEMPTS.
+An idle worker only runs a read (is anything due?) per poll; the claiming
+UPDATE and its commit happen only when there is work, so empty queues add
+no write transactions.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, select, update
+from models import db, WebhookEvent
+from followup_leases import WORKER_ID
+
+WORKERS = int(os.getenv('WEBHOOK_WORKERS', 2))  # 0 disables the pool
+CLAIM_BATCH = int(os.getenv('WEBHOOK_CLAIM_BATCH', 20))
+LEASE_SECONDS = int(os.getenv('WEBHOOK_LEASE_SECONDS', 120))
+POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 0.5))  # idle sleep between empty claims
+MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 6))
+RETRY_BASE = float(os.getenv('WEBHOOK_RETRY_BASE', 5))  # seconds; doubles per attempt
+RETRY_MAX = float(os.getenv('WEBHOOK_RETRY_MAX', 600))
+
+def _insert_statement(dialect_name: str):
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(WebhookEvent.__table__)
+
+def enqueue(call_id: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Persist a webhook event and commit. Returns False when the call was
+    already queued or synced (a duplicate delivery).
+    """
+    now = datetime.utcnow()
+    table = WebhookEvent.__table__
+    connection = db.session.connection()
+    stmt = _insert_statement(connection.dialect.name).values(
+        call_id=call_id, payload=payload, status='pending', attempts=0,
+        next_attempt_at=now, received_at=now
+    )
+    # A failed event is re-armed by a fresh delivery; pending/done ones are left alone
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.call_id],
+        set_={'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'last_error': None,
+              'payload': stmt.excluded.payload, 'received_at': now},
+        where=table.c.status == 'failed'
+    )
+    try:
+        result = connection.execute(stmt)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result.rowcount == 1
+
+def _claimable(now):
+    return and_(
+        WebhookEvent.status == 'pending',
+        WebhookEvent.next_attempt_at <= now,
+        or_(WebhookEvent.lease_expires_at.is_(None), WebhookEvent.lease_expires_at <= now)
+    )
+
+def claim(limit: int = CLAIM_BATCH, worker_id: str = WORKER_ID) -> Tuple[str, List[Tuple[int, str, int]]]:
+    """Lease up to `limit` due events; returns (token, [(id, call_id, attempts), ...])"""
+    now = datetime.utcnow()
+    token = f"{worker_id}#{uuid.uuid4().hex[:12]}"
+    if db.session.query(WebhookEvent.id).filter(_claimable(now)).limit(1).first() is None:
+        db.session.rollback()  # end the read transaction; no write when idle
+        return token, []
+    candidates = (select(WebhookEvent.id).where(_claimable(now))
+                  .order_by(WebhookEvent.next_attempt_at).limit(limit))
+    db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(claimed_by=token, lease_expires_at=now + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    claimed = db.session.query(WebhookEvent.id, WebhookEvent.call_id, WebhookEvent.attempts).filter(
+        WebhookEvent.claimed_by == token
+    ).all()
+    return token, claimed
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_MAX, RETRY_BASE * (2 ** max(0, attempts - 1)))
+
+def record_results(token: str, claimed, results: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    """Mark each claimed event done, or reschedule/fail it, while `token` still holds its lease"""
+    now = datetime.utcnow()
+    counts = {'done': 0, 'retry': 0, 'failed': 0}
+    done_ids = []
+    for event_id, call_id, attempts in claimed:
+        result = results.get(call_id) or {'status': 'error', 'message': 'No result'}
+        if result['status'] == 'success':
+            done_ids.append(event_id)
+            continue
+        attempts += 1
+        final = attempts >= MAX_ATTEMPTS
+        counts['failed' if final else 'retry'] += 1
+        db.session.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id == event_id, WebhookEvent.claimed_by == token)
+            .values(status='failed' if final else 'pending', attempts=attempts,
+                    last_error=str(result.get('message'))[:1000],
+                    next_attempt_at=now + timedelta(seconds=retry_delay(attempts)),
+                    claimed_by=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+    if done_ids:
+        done = db.session.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(done_ids), WebhookEvent.claimed_by == token)
+            .values(status='done', completed_at=now, last_error=None, claimed_by=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        counts['done'] = done.rowcount
+    db.session.commit()
+    return counts
+
+def queue_depth() -> Dict[str, int]:
+    """Events per status"""
+    rows = db.session.query(WebhookEvent.status, db.func.count(WebhookEvent.id)).group_by(WebhookEvent.status).all()
+    return {status: count for status, count in rows}
+
+class WebhookWorkerPool:
+    """Threads that claim queued webhook events and sync them in batches"""
+
+    def __init__(self, app, sync: Callable[[List[int]], List[Dict[str, Any]]], workers: int = WORKERS,
+                 batch: int = CLAIM_BATCH, poll_interval: float = POLL_INTERVAL):
+        self.app = app
+        self.sync = sync  # call ids -> per-call results (call_sync result dicts)
+        self.workers = workers
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self.counts = {'done': 0, 'retry': 0, 'failed': 0}
+
+    def start(self) -> bool:
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'webhook-worker-{i}', daemon=True).start()
+        return self.workers > 0
+
+    def drain_once(self) -> int:
+        """Claim and process one batch (inside an app context); returns the number claimed"""
+        token, claimed = claim(self.batch)
+        if not claimed:
+            return 0
+        try:
+            results = {r['call_id']: r for r in self.sync([int(call_id) for _, call_id, _ in claimed])}
+        except Exception as e:
+            db.session.rollback()
+            results = {call_id: {'status': 'error', 'message': str(e)} for _, call_id, _ in claimed}
+        counts = record_results(token, claimed, results)
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+        return len(claimed)
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    claimed = self.drain_once()
+            except Exception as e:
+                print(f"[Webhooks] Worker error: {e}")
+                claimed = 0
+            if not claimed:
+                time.sleep(self.poll_interval)
@@ -2,9 +2,13 @@ import { useState, useEffect } from 'react';
 import Head from 'next/head';
 import Link from 'next/link';
 
+const APPOINTMENTS_PAGE_SIZE = 100;
+
 export default function Admin() {
   const [stats, setStats] = useState(null);
   const [appointments, setAppointments] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [doctors, setDoctors] = useState([]);
   const [activeTab, setActiveTab] = useState('overview');
 
@@ -27,16 +31,23 @@ export default function Admin() {
     }
   };
 
-  const fetchAppointments = async () => {
+  // /api/appointments is keyset-paginated: each page carries the cursor of the next one
+  const fetchAppointments = async (cursor = null) => {
     try {
       const backendUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
-      const res = await fetch(`${backendUrl}/api/appointments`);
+      const params = new URLSearchParams({ limit: APPOINTMENTS_PAGE_SIZE });
+      if (cursor) params.set('cursor', cursor);
+      setLoadingMore(true);
+      const res = await fetch(`${backendUrl}/api/appointments?${params}`);
       const data = await res.json();
       if (data.status === 'success') {
-        setAppointments(data.data);
+        setAppointments((previous) => (cursor ? [...previous, ...data.data] : data.data));
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Error:', error);
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -167,6 +178,18 @@ export default function Admin() {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <div style={{ padding: '1rem', textAlign: 'center' }}>
+                <button
+                  className="btn"
+                  style={{ background: 'var(--primary)', color: 'white' }}
+                  disabled={loadingMore}
+                  onClick={() => fetchAppointments(nextCursor)}
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         )}
 